@@ -20,98 +20,14 @@ from datetime import datetime, timedelta
 # 添加当前目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from .config_service import load_config, save_config, set_config_value, invalidate_config
+
 # 全局变量
 timer = None
+watcher = None
+worker = None
 enabled = True
 
-def find_config_directory():
-    """找到config文件夹"""
-    # 获取当前脚本所在目录
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    
-    # 检查当前目录是否有config文件夹
-    config_dir = os.path.join(current_dir, 'config')
-    if os.path.exists(config_dir) and os.path.isdir(config_dir):
-        return config_dir
-    
-    # 检查上一级目录
-    parent_dir = os.path.dirname(current_dir)
-    config_dir = os.path.join(parent_dir, 'config')
-    if os.path.exists(config_dir) and os.path.isdir(config_dir):
-        return config_dir
-    
-    # 如果都没有，在当前目录创建config文件夹
-    config_dir = os.path.join(current_dir, 'config')
-    os.makedirs(config_dir, exist_ok=True)
-    return config_dir
-
-def get_config_path():
-    """获取配置文件路径"""
-    config_dir = find_config_directory()
-    player_stats_dir = os.path.join(config_dir, 'player_stats')
-    os.makedirs(player_stats_dir, exist_ok=True)
-    return os.path.join(player_stats_dir, 'config.json')
-
-def load_config():
-    """加载配置文件"""
-    config_path = get_config_path()
-    
-    # 如果配置文件不存在，创建默认配置
-    if not os.path.exists(config_path):
-        default_config = {
-            "github": {
-                "token": "",
-                "repo_owner": "",
-                "repo_name": "",
-                "repo_path": "",
-                "file_path": "ranking.md",
-                "branch": "main"
-            },
-            "ranking_names": {
-                "minecraft:play_time": "在线时长最长",
-                "minecraft:walk_one_cm": "步行距离最远",
-                "minecraft:fly_one_cm": "飞行距离最远",
-                "minecraft:swim_one_cm": "游泳距离最远",
-                "minecraft:jump": "跳跃次数最多",
-                "minecraft:mob_kills": "杀死生物最多",
-                "minecraft:damage_taken": "受到伤害最多",
-                "minecraft:blocks_broken": "破坏方块最多"
-            },
-            "update": {
-                "enabled": True,
-                "interval": 3600,
-                "use_daily": False,
-                "daily_time": 8.5
-            },
-            "plugin": {
-                "enabled": True
-            }
-        }
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(default_config, f, indent=2, ensure_ascii=False)
-        return default_config
-    
-    # 加载配置文件
-    try:
-        with open(config_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        import logging
-        logging.error(f"加载配置文件时出错: {e}")
-        return {}
-
-def save_config(config):
-    """保存配置文件"""
-    config_path = get_config_path()
-    try:
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
-        return True
-    except Exception as e:
-        import logging
-        logging.error(f"保存配置文件时出错: {e}")
-        return False
-
 def on_load(server, prev):
     global enabled
     server.logger.info('Player Stats Plugin loaded')
@@ -120,10 +36,18 @@ def on_load(server, prev):
     config = load_config()
     enabled = config.get('plugin', {}).get('enabled', True)
     
+    # 解析服务端目录结构
+    resolve_server_layout(server)
+    
     # 注册帮助信息
     server.register_help_message('!!player_stats', '显示玩家统计数据')
     server.register_help_message('!!player_stats ranking', '显示排行榜')
+    server.register_help_message('!!player_stats top <统计项> [数量]', '查询排行榜前几名')
+    server.register_help_message('!!player_stats rank <玩家> <统计项>', '查询玩家的名次')
+    server.register_help_message('!!player_stats myrank <统计项>', '查询自己的名次和百分位')
+    server.register_help_message('!!player_stats item <分类> <条目> [数量]', '查询单个条目的排行榜')
     server.register_help_message('!!player_stats upload', '上传排行榜到GitHub')
+    server.register_help_message('!!player_stats stats', '显示更新流程各阶段的耗时统计')
     server.register_help_message('!!player_stats reload', '重新加载配置')
     server.register_help_message('!!player_stats enable', '启用插件')
     server.register_help_message('!!player_stats disable', '禁用插件')
@@ -132,22 +56,118 @@ def on_load(server, prev):
     # 注册命令
     register_commands(server)
     
+    # 启动后台任务线程
+    get_worker(server)
+    
+    # 先从快照恢复排行榜索引，查询命令立即可用
+    try:
+        restore_index_snapshot(server)
+    except Exception as e:
+        server.logger.warning(f'从快照恢复排行榜索引时出错: {e}')
+    
+    # 在后台生成排行榜索引，查询命令不必等到第一次定时更新；
+    # 先用快照填充解析缓存，只需重新读取快照之后变化的文件
+    try:
+        get_worker(server).submit('render', lambda: warm_start(server), covered_by=('update',))
+    except Exception as e:
+        server.logger.warning(f'生成排行榜索引时出错: {e}')
+    
     # 启动定时任务
     if enabled:
-        start_timer(server)
+        start_updater(server)
 
 def on_unload(server):
-    global timer
-    if timer:
-        server.cancel_task(timer)
-        timer = None
+    global worker
+    from .stats_history import close_stats_histories
+    from .update_and_upload_ranking import close_publisher
+    
+    stop_updater(server)
+    if worker:
+        worker.stop()
+        worker = None
+    close_stats_histories()
+    close_publisher()
     server.logger.info('Player Stats Plugin unloaded')
 
+def resolve_server_layout(server):
+    """重新解析服务端目录结构并缓存，包括network.servers中其他服务端的路径"""
+    from .get_player_data_paths import get_player_data_paths, invalidate_player_data_paths
+    
+    invalidate_player_data_paths()
+    paths = get_player_data_paths()
+    if paths['server_dir']:
+        server.logger.info(f'服务端目录: {paths["server_dir"]}，存档: {paths["level_name"]}')
+    else:
+        server.logger.warning('未找到服务端目录，请在配置文件的 server.server_dir 中指定')
+    return paths
+
+def restore_index_snapshot(server):
+    """从快照恢复排行榜索引，排行的统计项在配置中修改过时不恢复"""
+    from .generate_ranking_md import get_snapshot_path, get_index_stat_keys
+    from .ranking_index import get_ranking_index
+    from .stats_snapshot import restore_index
+    
+    performance_config = load_config().get('performance', {})
+    if not performance_config.get('snapshot', True) or performance_config.get('streaming', False):
+        return
+    start = time.perf_counter()
+    players = restore_index(get_snapshot_path(), get_ranking_index(), stat_keys=get_index_stat_keys(load_config()))
+    if players is not None:
+        server.logger.info(f'已从快照恢复 {players} 名玩家的排行榜索引，耗时 {(time.perf_counter() - start) * 1000:.1f}ms')
+
+def warm_start(server):
+    """用快照填充解析缓存后重新生成排行榜，校验快照之后发生变化的文件"""
+    from .generate_ranking_md import get_snapshot_path, get_index_stat_keys, get_parse_keys
+    from .get_player_data_paths import get_player_data_paths
+    from .stats_snapshot import restore_stats_cache
+    
+    config = load_config()
+    if config.get('performance', {}).get('snapshot', True):
+        try:
+            restore_stats_cache(
+                get_snapshot_path(),
+                get_player_data_paths()['stats_dir'],
+                get_parse_keys(config, get_index_stat_keys(config))
+            )
+        except Exception as e:
+            server.logger.warning(f'从快照填充解析缓存时出错: {e}')
+    return run_render(server)
+
 def register_commands(server):
     """注册插件命令"""
     root = Literal('!!player_stats')
-    root = root.then(Literal('ranking').runs(lambda src: show_ranking(src)))
-    root = root.then(Literal('upload').runs(lambda src: upload_ranking(src)))
+    root = root.then(Literal('ranking').runs(lambda src: show_ranking(src, server)))
+    root = root.then(
+        Literal('top').then(
+            Text('stat').runs(lambda src, ctx: show_top(src, server, ctx['stat'])).then(
+                Integer('n').at_min(1).runs(lambda src, ctx: show_top(src, server, ctx['stat'], ctx['n']))
+            )
+        )
+    )
+    root = root.then(
+        Literal('rank').then(
+            Text('player').then(
+                Text('stat').runs(lambda src, ctx: show_rank(src, server, ctx['player'], ctx['stat']))
+            )
+        )
+    )
+    root = root.then(
+        Literal('myrank').then(
+            Text('stat').runs(lambda src, ctx: show_own_rank(src, server, ctx['stat']))
+        )
+    )
+    root = root.then(
+        Literal('item').then(
+            Text('category').then(
+                Text('item').runs(lambda src, ctx: show_item_top(src, server, ctx['category'], ctx['item'])).then(
+                    Integer('n').at_min(1).runs(
+                        lambda src, ctx: show_item_top(src, server, ctx['category'], ctx['item'], ctx['n']))
+                )
+            )
+        )
+    )
+    root = root.then(Literal('stats').runs(lambda src: show_metrics(src)))
+    root = root.then(Literal('upload').runs(lambda src: upload_ranking(src, server)))
     root = root.then(Literal('reload').runs(lambda src: reload_config(src, server)))
     root = root.then(Literal('enable').runs(lambda src: enable_plugin(src, server)))
     root = root.then(Literal('disable').runs(lambda src: disable_plugin(src, server)))
@@ -163,7 +183,12 @@ def show_help(src):
 Player Stats Plugin 帮助信息：
 !!player_stats - 显示此帮助信息
 !!player_stats ranking - 显示玩家排行榜
+!!player_stats top <统计项> [数量] - 查询排行榜前几名，如 top time 5
+!!player_stats rank <玩家> <统计项> - 查询玩家的名次
+!!player_stats myrank <统计项> - 查询自己的名次和百分位
+!!player_stats item <分类> <条目> [数量] - 查询单个条目的排行榜，如 item mined diamond_ore 5
 !!player_stats upload - 上传排行榜到GitHub
+!!player_stats stats - 显示更新流程各阶段的耗时统计
 !!player_stats reload - 重新加载配置
 !!player_stats enable - 启用插件
 !!player_stats disable - 禁用插件
@@ -175,52 +200,215 @@ Player Stats Plugin 帮助信息：
         # 处理编码问题
         src.reply(help_text.encode('utf-8', 'replace').decode('gbk', 'replace'))
 
-def show_ranking(src):
+def reply_to(src, message):
+    """回复消息，处理编码兼容问题"""
+    try:
+        src.reply(message)
+    except UnicodeEncodeError:
+        src.reply(message.encode('utf-8', 'replace').decode('gbk', 'replace'))
+
+def get_worker(server):
+    """获取后台任务线程，首次调用时启动"""
+    global worker
+    from .pipeline_worker import PipelineWorker
+    
+    if worker is None:
+        worker = PipelineWorker(server.logger)
+        worker.start()
+    return worker
+
+def submit_render(server):
+    """提交生成排行榜的任务，正在生成或上传时复用其结果"""
+    return get_worker(server).submit('render', lambda: run_render(server), covered_by=('update',))
+
+def submit_update(server):
+    """提交生成并上传排行榜的任务，正在上传时复用其结果"""
+    return get_worker(server).submit('update', lambda: run_update(server))
+
+def show_ranking(src, server):
     """显示排行榜"""
-    from .generate_ranking_md import generate_ranking_md
+    def on_done(future):
+        error = future.exception()
+        if error:
+            reply_to(src, f'生成排行榜时出错: {error}')
+        else:
+            reply_to(src, '排行榜已更新，请查看 ranking.md 文件')
     
     try:
-        generate_ranking_md()
-        reply = '排行榜已更新，请查看 ranking.md 文件'
-        src.reply(reply)
+        future = submit_render(server)
+        if not future.done():
+            reply_to(src, '正在生成排行榜...')
+        future.add_done_callback(on_done)
     except Exception as e:
-        error_msg = f'生成排行榜时出错: {e}'
-        try:
-            src.reply(error_msg)
-        except UnicodeEncodeError:
-            src.reply(error_msg.encode('utf-8', 'replace').decode('gbk', 'replace'))
+        reply_to(src, f'生成排行榜时出错: {e}')
+
+# top命令一次最多显示的名次
+MAX_TOP_N = 50
+
+def get_ready_ranking_index(src, server):
+    """获取排行榜索引，尚未生成时提交生成任务并返回None"""
+    from .ranking_index import get_ranking_index
+    
+    if load_config().get('performance', {}).get('streaming', False):
+        reply_to(src, '流式模式下不生成排行榜索引，无法查询，请查看 ranking.md 文件')
+        return None
+    index = get_ranking_index()
+    if not index.is_ready():
+        reply_to(src, '排行榜索引正在生成，请稍后再试')
+        submit_render(server)
+        return None
+    return index
+
+def resolve_stat_arg(src, index, stat_name):
+    """解析命令中的统计项，未知时回复可用的统计项并返回None"""
+    stat_key = index.resolve_stat(stat_name)
+    if stat_key is None:
+        available = ', '.join(stat_key.split(':', 1)[-1] for stat_key in index.stat_keys())
+        reply_to(src, f'未知的统计项: {stat_name}，可用的统计项: {available}')
+    return stat_key
+
+def show_top(src, server, stat_name, n=10):
+    """从排行榜索引中查询前n名"""
+    from .generate_ranking_md import format_display_value
+    
+    try:
+        index = get_ready_ranking_index(src, server)
+        if index is None:
+            return
+        stat_key = resolve_stat_arg(src, index, stat_name)
+        if stat_key is None:
+            return
+        
+        ranking = index.top(stat_key, min(n, MAX_TOP_N))
+        lines = [f'=== {index.get_stat_name(stat_key)} ===']
+        for i, player in enumerate(ranking, 1):
+            lines.append(f'{i}. {player["name"]} {format_display_value(stat_key, player["value"])}')
+        if not ranking:
+            lines.append('无数据')
+        reply_to(src, '\n'.join(lines))
+    except Exception as e:
+        reply_to(src, f'查询排行榜时出错: {e}')
+
+def show_rank(src, server, player_name, stat_name):
+    """从排行榜索引中查询玩家的名次"""
+    from .generate_ranking_md import format_display_value
+    
+    try:
+        index = get_ready_ranking_index(src, server)
+        if index is None:
+            return
+        stat_key = resolve_stat_arg(src, index, stat_name)
+        if stat_key is None:
+            return
+        
+        uuid = index.find_player(player_name)
+        result = index.rank(uuid, stat_key) if uuid else None
+        if result is None:
+            reply_to(src, f'没有找到玩家 {player_name} 的统计数据')
+            return
+        reply_to(src, f'{index.get_name(uuid)} 在「{index.get_stat_name(stat_key)}」中排名第 {result["rank"]} 名'
+                      f'（共 {result["total"]} 名玩家，超过 {result["percentile"]:.1f}% 的玩家），'
+                      f'{format_display_value(stat_key, result["value"])}')
+    except Exception as e:
+        reply_to(src, f'查询排名时出错: {e}')
+
+def show_own_rank(src, server, stat_name):
+    """查询命令发送者自己的名次"""
+    if not src.is_player:
+        reply_to(src, '该命令只能由玩家使用，请使用 !!player_stats rank <玩家> <统计项>')
+        return
+    show_rank(src, server, src.player, stat_name)
 
-def upload_ranking(src):
+def show_item_top(src, server, category_name, item_name, n=10):
+    """从条目索引中查询单个条目的前n名"""
+    from .config_service import load_config
+    from .item_index import get_item_index
+    
+    try:
+        if not load_config().get('item_index', {}).get('enabled', False):
+            reply_to(src, '未启用条目排行榜，请在配置文件中将 item_index.enabled 设为 true')
+            return
+        index = get_item_index()
+        if not index.is_ready():
+            reply_to(src, '条目索引正在生成，请稍后再试')
+            submit_render(server)
+            return
+        category = index.resolve_category(category_name)
+        if category is None:
+            available = ', '.join(category.split(':', 1)[-1] for category in index.categories)
+            reply_to(src, f'未知的分类: {category_name}，可用的分类: {available}')
+            return
+        item = index.resolve_item(category, item_name)
+        if item is None:
+            reply_to(src, f'分类 {category} 中没有 {item_name} 的数据')
+            return
+        
+        ranking = index.top(category, item, min(n, MAX_TOP_N))
+        lines = [f'=== {category.split(":", 1)[-1]} / {item.split(":", 1)[-1]} ===']
+        for i, player in enumerate(ranking, 1):
+            lines.append(f'{i}. {player["name"]} {player["value"]}')
+        reply_to(src, '\n'.join(lines))
+    except Exception as e:
+        reply_to(src, f'查询条目排行榜时出错: {e}')
+
+def show_metrics(src):
+    """显示更新流程各阶段的耗时统计"""
+    from .pipeline_metrics import get_metrics, STAGE_ORDER
+    
+    snapshot = get_metrics().snapshot()
+    stages = snapshot['stages']
+    if not stages:
+        reply_to(src, '还没有执行过更新任务')
+        return
+    
+    lines = ['=== 更新流程统计 ===']
+    names = [name for name in STAGE_ORDER if name in stages]
+    names += sorted(name for name in stages if name not in STAGE_ORDER)
+    for name in names:
+        stats = stages[name]
+        lines.append(f'{name}: 最近 {stats["last"]:.3f}s | p50 {stats["p50"]:.3f}s | p95 {stats["p95"]:.3f}s'
+                     f' | {stats["count"]} 次 | 错误 {stats["errors"]} 次')
+    counters = snapshot['counters']
+    if counters:
+        lines.append('计数: ' + ', '.join(f'{name}={value}' for name, value in sorted(counters.items())))
+    reply_to(src, '\n'.join(lines))
+
+def upload_ranking(src, server):
     """上传排行榜到GitHub"""
-    from .update_and_upload_ranking import main
+    def on_done(future):
+        error = future.exception()
+        if error:
+            reply_to(src, f'上传排行榜时出错: {error}')
+            return
+        result = future.result()
+        if not result['success']:
+            reply_to(src, f'排行榜上传失败: {result["message"]}')
+        elif result['skipped']:
+            reply_to(src, '排行榜内容未变化，无需上传')
+        else:
+            reply_to(src, '排行榜上传完成')
     
     try:
-        reply = '开始上传排行榜到GitHub...'
-        src.reply(reply)
-        main()
-        reply = '排行榜上传完成'
-        src.reply(reply)
+        reply_to(src, '开始上传排行榜到GitHub...')
+        submit_update(server).add_done_callback(on_done)
     except Exception as e:
-        error_msg = f'上传排行榜时出错: {e}'
-        try:
-            src.reply(error_msg)
-        except UnicodeEncodeError:
-            src.reply(error_msg.encode('utf-8', 'replace').decode('gbk', 'replace'))
+        reply_to(src, f'上传排行榜时出错: {e}')
 
 def reload_config(src, server):
     """重新加载配置"""
     global enabled, timer
     
     try:
+        # 强制重新读取配置文件和服务端目录结构
+        invalidate_config()
         config = load_config()
         enabled = config.get('plugin', {}).get('enabled', True)
+        resolve_server_layout(server)
         
         # 重启定时任务
-        if timer:
-            server.cancel_task(timer)
-            timer = None
+        stop_updater(server)
         if enabled:
-            start_timer(server)
+            start_updater(server)
         
         reply = '配置已重新加载'
         src.reply(reply)
@@ -236,14 +424,12 @@ def enable_plugin(src, server):
     global enabled, timer
     
     try:
-        config = load_config()
-        config['plugin']['enabled'] = True
-        save_config(config)
+        set_config_value('plugin', 'enabled', True)
         enabled = True
         
         # 启动定时任务
-        if not timer:
-            start_timer(server)
+        if not timer and not watcher:
+            start_updater(server)
         
         reply = '插件已启用'
         src.reply(reply)
@@ -259,15 +445,11 @@ def disable_plugin(src, server):
     global enabled, timer
     
     try:
-        config = load_config()
-        config['plugin']['enabled'] = False
-        save_config(config)
+        set_config_value('plugin', 'enabled', False)
         enabled = False
         
         # 停止定时任务
-        if timer:
-            server.cancel_task(timer)
-            timer = None
+        stop_updater(server)
         
         reply = '插件已禁用'
         src.reply(reply)
@@ -281,12 +463,13 @@ def disable_plugin(src, server):
 def refresh_players(src):
     """重新获取玩家列表"""
     try:
-        from .parse_player_data import parse_usercache
+        from .parse_player_data import get_player_name_index
         from .get_player_data_paths import get_player_data_paths
         
         paths = get_player_data_paths()
         if paths['usercache_exists']:
-            uuid_to_name = parse_usercache(paths['usercache_path'])
+            # 只会重新读取发生变化的名称文件
+            uuid_to_name = get_player_name_index(os.path.dirname(paths['usercache_path']))
             count = len(uuid_to_name)
             reply = f'已重新获取玩家列表，共 {count} 名玩家'
             src.reply(reply)
@@ -300,6 +483,112 @@ def refresh_players(src):
         except UnicodeEncodeError:
             src.reply(error_msg.encode('utf-8', 'replace').decode('gbk', 'replace'))
 
+def start_updater(server):
+    """按配置的更新方式启动定时任务，watch模式下同时监视stats目录
+
+    上传到GitHub始终按定时设置进行；watch模式下stats目录变化时只重新生成排行榜
+    和游戏内查询使用的索引，不会在每次自动保存后都推送一次。
+    """
+    config = load_config()
+    if config.get('update', {}).get('mode', 'timer') == 'watch':
+        start_watcher(server)
+    start_timer(server)
+
+def stop_updater(server):
+    """停止定时任务和stats目录监视"""
+    global timer, watcher
+    if timer:
+        server.cancel_task(timer)
+        timer = None
+    if watcher:
+        watcher.stop()
+        watcher = None
+
+def run_render(server):
+    """生成排行榜，返回generate_ranking_md的结果"""
+    from .generate_ranking_md import generate_ranking_md
+    from .pipeline_metrics import get_metrics
+    
+    try:
+        with get_metrics().stage('cycle'):
+            return generate_ranking_md()
+    finally:
+        export_metrics(server)
+
+def run_update(server):
+    """生成排行榜并上传到GitHub，返回upload_to_github的结果"""
+    from .generate_ranking_md import generate_ranking_md
+    from .update_and_upload_ranking import upload_to_github
+    from .pipeline_metrics import get_metrics
+    
+    try:
+        with get_metrics().stage('cycle'):
+            generate_ranking_md()
+            return upload_to_github()
+    finally:
+        export_metrics(server)
+
+def export_metrics(server):
+    """按配置写入Prometheus格式的指标文件，相对路径相对于插件数据目录"""
+    from .config_service import get_data_dir
+    from .pipeline_metrics import get_metrics
+    
+    path = load_config().get('metrics', {}).get('prometheus_file', '')
+    if not path:
+        return
+    try:
+        get_metrics().write_prometheus_file(os.path.join(get_data_dir(), path))
+    except Exception as e:
+        server.logger.warning(f'写入指标文件时出错: {e}')
+
+def start_watcher(server):
+    """监视stats目录，在玩家数据变化后重新生成排行榜（不上传）"""
+    global watcher
+    from .get_player_data_paths import get_player_data_paths
+    from .stats_watcher import StatsWatcher
+    
+    update_config = load_config().get('update', {})
+    
+    def on_stats_changed(changed_uuids):
+        if not enabled:
+            return
+        if changed_uuids is None:
+            server.logger.info('stats目录发生大量变化，开始更新排行榜')
+        else:
+            server.logger.info(f'{len(changed_uuids)} 名玩家的统计数据发生变化，开始更新排行榜')
+        submit_render(server).add_done_callback(lambda future: log_render_result(server, future))
+    
+    paths = get_player_data_paths()
+    watcher = StatsWatcher(
+        paths['stats_dir'],
+        on_stats_changed,
+        debounce=update_config.get('watch_debounce', 5),
+        poll_interval=update_config.get('watch_poll_interval', 10),
+        logger=server.logger
+    )
+    watcher.start()
+    server.logger.info(f'已开始监视stats目录: {paths["stats_dir"]}')
+
+def log_render_result(server, future):
+    """记录后台生成排行榜任务的错误"""
+    error = future.exception()
+    if error:
+        server.logger.error(f'更新排行榜时出错: {error}')
+
+def log_update_result(server, future):
+    """记录后台更新任务的结果"""
+    error = future.exception()
+    if error:
+        server.logger.error(f'更新排行榜时出错: {error}')
+        return
+    result = future.result()
+    if not result['success']:
+        server.logger.warning(f'排行榜已生成，但上传失败: {result["message"]}')
+    elif result['skipped']:
+        server.logger.info(f'更新排行榜完成，{result["message"]}')
+    else:
+        server.logger.info('更新排行榜完成')
+
 def start_timer(server):
     """启动定时任务"""
     global timer
@@ -307,13 +596,8 @@ def start_timer(server):
     def task():
         if enabled:
             try:
-                # 执行更新任务
-                from .generate_ranking_md import generate_ranking_md
-                from .update_and_upload_ranking import upload_to_github
-                
-                generate_ranking_md()
-                upload_to_github()
-                server.logger.info('定时更新排行榜完成')
+                # 在后台线程中执行更新任务，不阻塞定时器
+                submit_update(server).add_done_callback(lambda future: log_update_result(server, future))
             except Exception as e:
                 server.logger.error(f'定时更新时出错: {e}')
             
@@ -357,3 +641,68 @@ def calculate_next_delay():
         # 按间隔更新
         interval = update_config.get('interval', 3600)  # 默认1小时
         return interval
+
+# 插件API，其他插件可以通过 server.get_plugin_instance('player_stats') 调用
+# player可以是玩家名称（不区分大小写）或uuid，stat可以是完整键名或简称；
+# 数据来自内存中的排行榜索引，索引尚未生成时返回None或空结果
+
+def get_player_rank(player, stat):
+    """获取玩家的名次，返回 {'rank', 'value', 'total', 'percentile'}，没有数据时返回None"""
+    from .ranking_index import get_ranking_index
+    
+    index = get_ranking_index()
+    uuid = index.find_player(player)
+    stat_key = index.resolve_stat(stat)
+    if uuid is None or stat_key is None:
+        return None
+    return index.rank(uuid, stat_key)
+
+def get_player_percentile(player, stat):
+    """获取玩家的百分位（0~100，值不高于该玩家的玩家所占百分比），没有数据时返回None"""
+    result = get_player_rank(player, stat)
+    return result['percentile'] if result else None
+
+def count_players_above(stat, threshold):
+    """获取该项统计数据严格大于threshold的玩家数"""
+    from .ranking_index import get_ranking_index
+    
+    index = get_ranking_index()
+    stat_key = index.resolve_stat(stat)
+    return index.count_above(stat_key, threshold) if stat_key else 0
+
+def get_top_players(stat, n=10):
+    """获取前n名，返回 [{'uuid', 'name', 'value'}]；n小于1时抛出ValueError"""
+    from .ranking_index import get_ranking_index
+    
+    if n < 1:
+        raise ValueError(f'n必须大于0: {n}')
+    index = get_ranking_index()
+    stat_key = index.resolve_stat(stat)
+    return index.top(stat_key, n) if stat_key else []
+
+def get_item_top_players(category, item, n=10):
+    """获取单个条目（如 mined diamond_ore）的前n名，返回 [{'uuid', 'name', 'value'}]；需要启用item_index
+
+    n小于1时抛出ValueError。
+    """
+    from .item_index import get_item_index
+    
+    if n < 1:
+        raise ValueError(f'n必须大于0: {n}')
+    index = get_item_index()
+    category = index.resolve_category(category)
+    item = index.resolve_item(category, item) if category else None
+    return index.top(category, item, n) if item else []
+
+def get_player_item_rank(player, category, item):
+    """获取玩家在单个条目排行榜中的名次，返回 {'rank', 'value', 'total', 'percentile'}，没有数据时返回None"""
+    from .ranking_index import get_ranking_index
+    from .item_index import get_item_index
+    
+    index = get_item_index()
+    uuid = get_ranking_index().find_player(player)
+    category = index.resolve_category(category)
+    item = index.resolve_item(category, item) if category else None
+    if uuid is None or item is None:
+        return None
+    return index.rank(uuid, category, item)
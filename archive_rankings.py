@@ -0,0 +1,228 @@
+import os
+import re
+import sys
+import json
+import time
+import tarfile
+import zipfile
+import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# 处理相对导入问题
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+try:
+    from .config_service import load_config, set_config_directory, use_default_config
+    from .create_player_rankings import stream_stat_values, format_ranking
+    from .ranking_engine import RankingAccumulator
+    from .generate_ranking_md import get_ranking_stats
+except ImportError:
+    # 当直接运行时使用绝对导入
+    from config_service import load_config, set_config_directory, use_default_config
+    from create_player_rankings import stream_stat_values, format_ranking
+    from ranking_engine import RankingAccumulator
+    from generate_ranking_md import get_ranking_stats
+
+# 存档中的stats文件：<存档目录>/stats/<uuid>.json
+_STATS_MEMBER_PATTERN = re.compile(r'(?:^|/)([^/]+)/stats/([0-9a-fA-F-]{36})\.json$')
+
+def _parse_usercache_bytes(raw):
+    """解析usercache.json的内容，返回uuid到玩家名称的映射"""
+    try:
+        data = json.loads(raw.decode('utf-8'))
+    except ValueError as e:
+        print(f"Error parsing usercache.json: {e}", file=sys.stderr)
+        return {}
+    return {entry['uuid']: entry['name'] for entry in data if entry.get('uuid') and entry.get('name')}
+
+def _is_usercache(name):
+    return name == 'usercache.json' or name.endswith('/usercache.json')
+
+def _match_stats(name, level):
+    """成员是stats文件时返回 (存档目录, uuid)，否则返回None；level不为空时只接受该存档"""
+    match = _STATS_MEMBER_PATTERN.search(name)
+    if match is None or (level and match.group(1) != level):
+        return None
+    return match.group(1), match.group(2)
+
+def _name_results(rankings, uuid_to_name):
+    """存档中的usercache.json可能在stats文件之后才读到，名称在计算完排行榜后再填充"""
+    for ranking in rankings.values():
+        for player in ranking:
+            player['name'] = uuid_to_name.get(player['uuid'], f"Unknown ({player['uuid'][:8]}...)")
+    return rankings
+
+def _scan_zip(path, level, state):
+    """zip文件可以从中央目录直接定位成员，只读取需要的成员
+
+    逐个生成 (uuid, stats文件内容)，usercache和读取情况记录在state中。
+    """
+    usercache_depth = None
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            name = info.filename
+            if info.is_dir():
+                continue
+            if _is_usercache(name):
+                # 存在多个usercache.json时使用最外层的
+                depth = name.count('/')
+                if usercache_depth is None or depth < usercache_depth:
+                    state['uuid_to_name'] = _parse_usercache_bytes(archive.read(info))
+                    usercache_depth = depth
+                    state['members_read'] += 1
+                continue
+            matched = _match_stats(name, level)
+            if matched is None:
+                continue
+            member_dir = name[:name.rindex('/')]
+            if state['stats_dir'] is None:
+                state['stats_dir'] = member_dir
+            elif member_dir != state['stats_dir']:
+                continue
+            state['members_read'] += 1
+            yield matched[1], archive.read(info)
+
+def _scan_tar(path, level, full_scan, state):
+    """以流方式读取tar文件，不解压到磁盘
+
+    打包时同一目录中的文件是连续的，读完stats目录并且已经读到usercache.json后
+    即停止读取，不再解压存档的其余部分；full_scan为True时读完整个存档。
+    """
+    usercache_read = False
+    stats_done = False
+    with tarfile.open(path, 'r|*') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            name = member.name
+            if _is_usercache(name):
+                if not usercache_read:
+                    state['uuid_to_name'] = _parse_usercache_bytes(archive.extractfile(member).read())
+                    usercache_read = True
+                    state['members_read'] += 1
+            else:
+                matched = _match_stats(name, level)
+                member_dir = name[:name.rindex('/')] if matched else None
+                stats_dir = state['stats_dir']
+                if matched and (stats_dir is None or member_dir == stats_dir) and not stats_done:
+                    state['stats_dir'] = member_dir
+                    state['members_read'] += 1
+                    yield matched[1], archive.extractfile(member).read()
+                    continue
+                if stats_dir is not None:
+                    stats_done = True
+            if stats_done and usercache_read and not full_scan:
+                state['stopped_early'] = True
+                break
+
+def rank_archive(path, stat_keys, top_n=10, level=None, full_scan=False):
+    """直接从存档备份（.tar、.tar.gz等tar格式或.zip）中计算排行榜，不解压到磁盘
+
+    stats文件边解压边交给stream_stat_values计算排行值，内存占用与存档中的玩家数无关。
+    level为空时使用第一个找到的stats目录。返回结果字典。
+    """
+    start = time.perf_counter()
+    state = {'uuid_to_name': {}, 'stats_dir': None, 'members_read': 0, 'stopped_early': False}
+    if zipfile.is_zipfile(path):
+        members = _scan_zip(path, level, state)
+    else:
+        members = _scan_tar(path, level, full_scan, state)
+    accumulator = RankingAccumulator(stat_keys, top_n)
+    counters = {'players': 0, 'errors': 0}
+    for uuid, values in stream_stat_values(members, accumulator.stat_keys, counters=counters):
+        accumulator.add(uuid, None, values)
+    uuid_to_name = state['uuid_to_name']
+    return {
+        'archive': path,
+        'stats_dir': state['stats_dir'],
+        'players': counters['players'],
+        'errors': counters['errors'],
+        'names': len(uuid_to_name),
+        'members_read': state['members_read'],
+        'stopped_early': state['stopped_early'],
+        'seconds': round(time.perf_counter() - start, 6),
+        'rankings': _name_results(accumulator.results(), uuid_to_name)
+    }
+
+def _rank_archive_safe(args):
+    """进程池中运行的rank_archive，出错时返回错误信息而不是中断其他存档"""
+    path, stat_keys, top_n, level, full_scan, config_dir, default_config = args
+    if config_dir:
+        set_config_directory(config_dir)
+    elif default_config:
+        use_default_config()
+    try:
+        return rank_archive(path, stat_keys, top_n, level, full_scan)
+    except (OSError, tarfile.TarError, zipfile.BadZipFile, EOFError) as e:
+        return {'archive': path, 'error': str(e)}
+
+def rank_archives(paths, stat_keys, top_n=10, level=None, full_scan=False, workers=4, use_process_pool=False,
+                  config_dir=None, default_config=False):
+    """并发处理多个存档，返回与paths顺序一致的结果列表
+
+    解压和读取在线程中进行；JSON解码占用CPU较多，存档较多时可以使用进程池。
+    config_dir为进程池中使用的config文件夹；default_config为True时改为使用内存中的默认配置，
+    不读写配置文件。
+    """
+    tasks = [(path, stat_keys, top_n, level, full_scan, config_dir, default_config) for path in paths]
+    executor_class = ProcessPoolExecutor if use_process_pool else ThreadPoolExecutor
+    with executor_class(max_workers=max(1, min(workers, len(tasks)))) as executor:
+        return list(executor.map(_rank_archive_safe, tasks))
+
+def main():
+    parser = argparse.ArgumentParser(description='直接从存档备份中计算排行榜，不需要解压')
+    parser.add_argument('archives', nargs='+', help='存档备份文件（.tar、.tar.gz、.tgz、.tar.xz或.zip）')
+    parser.add_argument('--top', type=int, default=10, help='每个排行榜的名次数量')
+    parser.add_argument('--level', help='存档目录名称，默认使用第一个找到的stats目录')
+    parser.add_argument('--workers', type=int, default=4, help='同时处理的存档数')
+    parser.add_argument('--processes', action='store_true', help='使用进程池处理存档')
+    parser.add_argument('--full-scan', action='store_true', help='读完整个tar存档，不在读完stats目录后提前停止')
+    parser.add_argument('--config-dir', help='config文件夹，不指定时使用默认配置，不读写配置文件')
+    parser.add_argument('--output', help='将结果以JSON格式保存到该路径，默认输出文本格式的排行榜')
+    args = parser.parse_args()
+
+    if args.config_dir:
+        set_config_directory(args.config_dir)
+    else:
+        # 离线工具不应在插件目录下创建配置文件
+        use_default_config()
+    ranking_stats = get_ranking_stats(load_config())
+    stat_keys = [stat_key for stat_key, _ in ranking_stats]
+
+    results = rank_archives(
+        args.archives, stat_keys,
+        top_n=args.top,
+        level=args.level,
+        full_scan=args.full_scan,
+        workers=args.workers,
+        use_process_pool=args.processes,
+        config_dir=args.config_dir,
+        default_config=not args.config_dir
+    )
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+
+    for result in results:
+        print(f"=== {result['archive']} ===")
+        if 'error' in result:
+            print(f"无法读取存档: {result['error']}")
+            print()
+            continue
+        print(f"stats目录: {result['stats_dir']}，{result['players']} 名玩家，读取 {result['members_read']} 个文件，"
+              f"耗时 {result['seconds']:.2f}s{'（已提前停止读取）' if result['stopped_early'] else ''}")
+        print()
+        if args.output:
+            continue
+        for stat_key, stat_name in ranking_stats:
+            ranking = result['rankings'][stat_key]
+            if ranking:
+                print(format_ranking(ranking, stat_key, stat_name))
+            else:
+                print(f"=== {stat_name} 排行榜 ===")
+                print("无数据")
+                print()
+
+if __name__ == '__main__':
+    main()
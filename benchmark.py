@@ -0,0 +1,361 @@
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import contextlib
+import uuid as uuid_lib
+
+try:
+    import resource
+except ImportError:
+    # Windows没有resource模块，不记录内存峰值
+    resource = None
+
+# 处理相对导入问题
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+try:
+    from .config_service import set_config_directory, save_config, DEFAULT_CONFIG
+    from .parse_player_data import get_player_name_index, parse_all_stats, clear_stats_cache, get_stats_cache_info
+    from .create_player_rankings import build_stat_matrix, create_rankings, create_rankings_streaming
+    from .generate_ranking_md import generate_ranking_md, get_snapshot_path, DEFAULT_RANKING_STATS
+    from .ranking_index import RankingIndex
+    from .stats_snapshot import restore_index
+    from .update_and_upload_ranking import upload_to_github, close_publisher
+    from .stat_matrix import numpy_available
+    from .derived_metrics import get_metric_plan
+except ImportError:
+    # 当直接运行时使用绝对导入
+    from config_service import set_config_directory, save_config, DEFAULT_CONFIG
+    from parse_player_data import get_player_name_index, parse_all_stats, clear_stats_cache, get_stats_cache_info
+    from create_player_rankings import build_stat_matrix, create_rankings, create_rankings_streaming
+    from generate_ranking_md import generate_ranking_md, get_snapshot_path, DEFAULT_RANKING_STATS
+    from ranking_index import RankingIndex
+    from stats_snapshot import restore_index
+    from update_and_upload_ranking import upload_to_github, close_publisher
+    from stat_matrix import numpy_available
+    from derived_metrics import get_metric_plan
+
+DEFAULT_PLAYER_COUNTS = [1000, 10000, 100000]
+
+# minecraft:custom中常见的统计项
+CUSTOM_STATS = [
+    'minecraft:play_time', 'minecraft:total_world_time', 'minecraft:time_since_rest',
+    'minecraft:time_since_death', 'minecraft:leave_game', 'minecraft:walk_one_cm',
+    'minecraft:sprint_one_cm', 'minecraft:crouch_one_cm', 'minecraft:swim_one_cm',
+    'minecraft:fly_one_cm', 'minecraft:fall_one_cm', 'minecraft:climb_one_cm',
+    'minecraft:walk_on_water_one_cm', 'minecraft:walk_under_water_one_cm',
+    'minecraft:boat_one_cm', 'minecraft:horse_one_cm', 'minecraft:minecart_one_cm',
+    'minecraft:aviate_one_cm', 'minecraft:jump', 'minecraft:mob_kills',
+    'minecraft:player_kills', 'minecraft:deaths', 'minecraft:damage_dealt',
+    'minecraft:damage_taken', 'minecraft:damage_blocked_by_shield',
+    'minecraft:damage_absorbed', 'minecraft:damage_resisted', 'minecraft:sneak_time',
+    'minecraft:animals_bred', 'minecraft:fish_caught', 'minecraft:traded_with_villager',
+    'minecraft:talked_to_villager', 'minecraft:open_chest', 'minecraft:open_barrel',
+    'minecraft:open_enderchest', 'minecraft:open_shulker_box', 'minecraft:interact_with_crafting_table',
+    'minecraft:interact_with_furnace', 'minecraft:interact_with_blast_furnace',
+    'minecraft:interact_with_smoker', 'minecraft:interact_with_anvil',
+    'minecraft:interact_with_grindstone', 'minecraft:interact_with_stonecutter',
+    'minecraft:enchant_item', 'minecraft:drop', 'minecraft:sleep_in_bed',
+    'minecraft:eat_cake_slice', 'minecraft:fill_cauldron', 'minecraft:use_cauldron',
+    'minecraft:inspect_hopper', 'minecraft:inspect_dropper', 'minecraft:inspect_dispenser',
+    'minecraft:trigger_trapped_chest', 'minecraft:target_hit', 'minecraft:bell_ring',
+    'minecraft:raid_trigger', 'minecraft:raid_win', 'minecraft:pot_flower',
+    'minecraft:play_noteblock', 'minecraft:tune_noteblock', 'minecraft:clean_armor'
+]
+
+# 各分类条目数的上限，活跃度越高的玩家条目越多
+CATEGORY_SIZES = {
+    'minecraft:mined': 300,
+    'minecraft:used': 300,
+    'minecraft:picked_up': 200,
+    'minecraft:crafted': 150,
+    'minecraft:dropped': 80,
+    'minecraft:killed': 40,
+    'minecraft:broken': 20,
+    'minecraft:killed_by': 15
+}
+
+# git中空tree对象的sha1
+EMPTY_TREE_SHA = '4b825dc642cb6eb9a060e54bf8d69288fbee4904'
+
+# 方块、物品和生物的名称表大小
+ITEM_VOCABULARY_SIZE = 1200
+
+def generate_world(server_dir, players, seed=0):
+    """生成确定性的假服务端目录：usercache.json和world/stats/*.json
+
+    同样的players和seed总是生成同样的内容。玩家活跃度呈长尾分布，
+    大部分玩家只有少量条目，少数玩家接近真实存档中的最大规模。
+    返回 {'files', 'bytes'}。
+    """
+    rng = random.Random(seed)
+    stats_dir = os.path.join(server_dir, 'world', 'stats')
+    os.makedirs(stats_dir, exist_ok=True)
+    items = [f'minecraft:item_{i}' for i in range(ITEM_VOCABULARY_SIZE)]
+
+    usercache = []
+    total_bytes = 0
+    for i in range(players):
+        player_uuid = str(uuid_lib.UUID(int=rng.getrandbits(128), version=4))
+        usercache.append({'name': f'Player{i}', 'uuid': player_uuid, 'expiresOn': '2030-01-01 00:00:00 +0000'})
+
+        activity = rng.random() ** 2
+        custom_count = 10 + int(activity * (len(CUSTOM_STATS) - 10))
+        stats = {
+            'minecraft:custom': {
+                stat_key: rng.randrange(1, 1 + int(10 ** (2 + activity * 6)))
+                for stat_key in rng.sample(CUSTOM_STATS, custom_count)
+            }
+        }
+        # play_time总是存在
+        stats['minecraft:custom'].setdefault('minecraft:play_time', rng.randrange(1, 10 ** 7))
+        for category, max_size in CATEGORY_SIZES.items():
+            size = int(activity * max_size)
+            if size:
+                stats[category] = {item: rng.randrange(1, 1 + int(10 ** (1 + activity * 4))) for item in rng.sample(items, size)}
+
+        content = json.dumps({'stats': stats, 'DataVersion': 3700}, separators=(',', ':'))
+        with open(os.path.join(stats_dir, f'{player_uuid}.json'), 'w', encoding='utf-8') as f:
+            f.write(content)
+        total_bytes += len(content)
+
+    with open(os.path.join(server_dir, 'usercache.json'), 'w', encoding='utf-8') as f:
+        json.dump(usercache, f)
+    with open(os.path.join(server_dir, 'server.properties'), 'w', encoding='utf-8') as f:
+        f.write('level-name=world\n')
+    return {'files': players, 'bytes': total_bytes}
+
+def create_remote(work_dir, publish_mode):
+    """创建本地裸仓库作为推送目标，返回用于发布的本地仓库路径"""
+    import git
+
+    remote_path = os.path.join(work_dir, 'remote.git')
+    git.Repo.init(remote_path, bare=True)
+
+    repo_path = os.path.join(work_dir, 'repo.git' if publish_mode == 'objects' else 'repo')
+    repo = git.Repo.clone_from(remote_path, repo_path, bare=(publish_mode == 'objects'))
+    with repo.config_writer() as writer:
+        writer.set_value('user', 'name', 'benchmark')
+        writer.set_value('user', 'email', 'benchmark@localhost')
+
+    # 在main分支上创建初始提交
+    commit = repo.git.commit_tree(EMPTY_TREE_SHA, '-m', 'init')
+    repo.git.update_ref('refs/heads/main', commit)
+    repo.git.symbolic_ref('HEAD', 'refs/heads/main')
+    if publish_mode != 'objects':
+        repo.git.reset('--hard', 'main')
+    repo.git.push('origin', 'refs/heads/main:refs/heads/main')
+    repo.git.update_ref('refs/remotes/origin/main', 'refs/heads/main')
+    repo.close()
+    return repo_path
+
+def get_peak_rss_kb():
+    """获取进程的内存峰值（KB），不支持时返回None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS以字节为单位，Linux以KB为单位
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+class StageTimer:
+    """记录每个阶段的耗时和内存峰值"""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        info = {}
+        start = time.perf_counter()
+        yield info
+        info['seconds'] = round(time.perf_counter() - start, 6)
+        info['peak_rss_kb'] = get_peak_rss_kb()
+        self.stages[name] = info
+        print(f"[{name}] {info['seconds']:.3f}s", file=sys.stderr)
+
+def measure_parsed_kb(stats_dir, names, parse_keys, compact):
+    """用tracemalloc测量解析结果常驻的内存（KB），不使用也不影响解析缓存"""
+    tracemalloc.start()
+    try:
+        stats_data = parse_all_stats(stats_dir, names, use_cache=False, stat_keys=parse_keys, compact=compact)
+        retained = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del stats_data
+    return retained // 1024
+
+def measure_peak_kb(func):
+    """用tracemalloc测量func运行期间的内存峰值（KB），返回 (峰值, func的返回值)"""
+    tracemalloc.start()
+    try:
+        result = func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak // 1024, result
+
+def run_benchmark(players, work_dir, seed=0, workers=4, selective=True, publish_mode='worktree'):
+    """在work_dir中生成players名玩家的假存档，依次测量各阶段，返回结果字典"""
+    server_dir = os.path.join(work_dir, 'server')
+    output_dir = os.path.join(work_dir, 'output')
+    timer = StageTimer()
+
+    with timer.stage('generate') as info:
+        info.update(generate_world(server_dir, players, seed))
+
+    repo_path = create_remote(work_dir, publish_mode)
+
+    # 配置和生成的文件都放在work_dir中，不影响插件自身的配置
+    set_config_directory(os.path.join(work_dir, 'config'))
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    config['server']['server_dir'] = server_dir
+    config['output']['dir'] = output_dir
+    config['github'].update({'repo_path': repo_path, 'branch': 'main', 'publish_mode': publish_mode})
+    config['performance'].update({'parse_workers': workers, 'selective_parse': selective})
+    save_config(config)
+
+    stat_keys = [stat_key for stat_key, _ in DEFAULT_RANKING_STATS]
+    parse_keys = get_metric_plan().parse_keys(stat_keys) if selective else None
+    stats_dir = os.path.join(server_dir, 'world', 'stats')
+
+    # 统计数据的输出不能混入JSON结果
+    with contextlib.redirect_stdout(sys.stderr):
+        with timer.stage('names') as info:
+            names = get_player_name_index(server_dir)
+            info['players'] = len(names)
+
+        clear_stats_cache()
+        with timer.stage('parse_cold') as info:
+            stats_data = parse_all_stats(stats_dir, names, workers=workers, stat_keys=parse_keys)
+            info['cache'] = get_stats_cache_info()['last_run']
+
+        with timer.stage('parse_warm') as info:
+            stats_data = parse_all_stats(stats_dir, names, workers=workers, stat_keys=parse_keys)
+            info['cache'] = get_stats_cache_info()['last_run']
+
+        # 比较紧凑存储和嵌套字典的解析结果占用的内存
+        with timer.stage('memory') as info:
+            info['dict_kb'] = measure_parsed_kb(stats_dir, names, parse_keys, compact=False)
+            info['compact_kb'] = measure_parsed_kb(stats_dir, names, parse_keys, compact=True)
+            info['reduction'] = round(1 - info['compact_kb'] / max(info['dict_kb'], 1), 3)
+
+        with timer.stage('rank') as info:
+            matrix = build_stat_matrix(stats_data, stat_keys)
+            create_rankings(stats_data, stat_keys, top_n=10, matrix=matrix)
+            info['matrix'] = matrix is not None
+
+        # 流式计算不保留解析结果，内存峰值应与玩家数无关
+        with timer.stage('rank_streaming') as info:
+            start = time.perf_counter()
+            info['streaming_peak_kb'], streamed = measure_peak_kb(
+                lambda: create_rankings_streaming(stats_dir, names, stat_keys, top_n=10))
+            info['streaming_seconds'] = round(time.perf_counter() - start, 6)
+            info['batch_peak_kb'], batch = measure_peak_kb(lambda: create_rankings(
+                parse_all_stats(stats_dir, names, use_cache=False, stat_keys=parse_keys), stat_keys, top_n=10))
+            info['same_rankings'] = streamed == batch
+
+        with timer.stage('render'):
+            generate_ranking_md()
+
+        # 插件重载后从快照恢复排行榜索引
+        with timer.stage('snapshot_restore') as info:
+            index = RankingIndex()
+            info['players'] = restore_index(get_snapshot_path(), index)
+            info['top'] = bool(index.top('minecraft:play_time', 1))
+
+        with timer.stage('publish') as info:
+            result = upload_to_github()
+            info.update(success=result['success'], skipped=result['skipped'])
+
+        with timer.stage('publish_unchanged') as info:
+            result = upload_to_github()
+            info.update(success=result['success'], skipped=result['skipped'])
+
+        close_publisher()
+
+    return {
+        'players': players,
+        'seed': seed,
+        'workers': workers,
+        'selective_parse': selective,
+        'publish_mode': publish_mode,
+        'stages': timer.stages,
+        'peak_rss_kb': get_peak_rss_kb()
+    }
+
+def get_plugin_version():
+    """读取mcdreforged.plugin.json中的插件版本"""
+    metadata_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mcdreforged.plugin.json')
+    try:
+        with open(metadata_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('version')
+    except (OSError, ValueError):
+        return None
+
+def run_isolated(players, args):
+    """在子进程中运行单个规模的测试，使每个规模的内存峰值互不影响"""
+    command = [
+        sys.executable, os.path.abspath(__file__), '--players', str(players), '--single',
+        '--seed', str(args.seed), '--workers', str(args.workers), '--publish-mode', args.publish_mode
+    ]
+    if args.full_parse:
+        command.append('--full-parse')
+    if args.keep:
+        command.append('--keep')
+    if args.work_dir:
+        command += ['--work-dir', os.path.join(args.work_dir, str(players))]
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE).stdout
+    return json.loads(output)
+
+def main():
+    parser = argparse.ArgumentParser(description='生成假存档并测量解析、排行、生成和发布各阶段的性能')
+    parser.add_argument('--players', type=int, nargs='+', default=DEFAULT_PLAYER_COUNTS, help='玩家数量，可以指定多个')
+    parser.add_argument('--seed', type=int, default=0, help='生成假存档的随机种子')
+    parser.add_argument('--workers', type=int, default=4, help='解析stats文件的线程数')
+    parser.add_argument('--full-parse', action='store_true', help='解析完整的stats文件而不是只提取排行需要的统计项')
+    parser.add_argument('--publish-mode', choices=['worktree', 'objects'], default='worktree', help='发布方式')
+    parser.add_argument('--work-dir', help='存放假存档和仓库的目录，默认使用临时目录')
+    parser.add_argument('--keep', action='store_true', help='测试结束后保留生成的文件')
+    parser.add_argument('--output', help='结果JSON的保存路径，默认输出到标准输出')
+    parser.add_argument('--single', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        players = args.players[0]
+        work_dir = args.work_dir or tempfile.mkdtemp(prefix=f'player_stats_bench_{players}_')
+        try:
+            result = run_benchmark(players, work_dir, args.seed, args.workers, not args.full_parse, args.publish_mode)
+        finally:
+            if not args.keep:
+                shutil.rmtree(work_dir, ignore_errors=True)
+            else:
+                print(f'生成的文件保存在: {work_dir}', file=sys.stderr)
+        print(json.dumps(result))
+        return
+
+    report = {
+        'plugin_version': get_plugin_version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': numpy_available(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'runs': [run_isolated(players, args) for players in args.players]
+    }
+
+    content = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(content + '\n')
+    else:
+        print(content)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+import threading
+from array import array
+from bisect import bisect_left
+
+# stats下直接记录数值（而不是分类对象）的统计项归入的分类
+LOOSE_CATEGORY = '#loose'
+# 选择性解析时累加的分类求和输入项（见derived_metrics.category_term）归入的分类
+TOTALS_CATEGORY = '#totals'
+
+class StatVocabulary:
+    """统计项键名的全局词表
+
+    所有玩家共用同一份键名，每个键名（分类、条目名称或分类求和输入项）只保存一次，
+    玩家数据中只记录其编号。编号按加入顺序分配，只增不减，可以在多个线程中同时使用。
+    """
+
+    def __init__(self):
+        self.keys = []
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def intern(self, key):
+        """获取键名的编号，不存在时加入词表"""
+        key_id = self._ids.get(key)
+        if key_id is None:
+            with self._lock:
+                key_id = self._ids.get(key)
+                if key_id is None:
+                    key_id = len(self.keys)
+                    # 先写入keys，读到编号的线程总能取到键名
+                    self.keys.append(key)
+                    self._ids[key] = key_id
+        return key_id
+
+    def intern_all(self, keys):
+        """获取多个键名的编号列表，不存在的键名加入词表"""
+        key_ids = list(map(self._ids.get, keys))
+        if None in key_ids:
+            key_ids = [self.intern(key) if key_id is None else key_id for key, key_id in zip(keys, key_ids)]
+        return key_ids
+
+    def lookup(self, key):
+        """获取键名的编号，不存在时返回None"""
+        return self._ids.get(key)
+
+# 进程内共享的词表，编号只在本进程内有效
+_vocabulary = StatVocabulary()
+
+def get_stat_vocabulary():
+    """获取共享的统计项词表"""
+    return _vocabulary
+
+class CompactStats:
+    """单名玩家紧凑存储的统计数据
+
+    所有分类的条目连续存放在key_ids（词表编号）和values（int64）两个数组中，
+    category_ids为排序后的分类编号，第i个分类的条目位于 [offsets[i], offsets[i + 1])。
+    同一分类的条目保持文件中的顺序，不需要在解析时排序；查找单个统计项时
+    二分查找分类，再在分类的编号切片中由array.index线性查找，
+    分类求和为一次数组切片求和。
+    """
+    __slots__ = ('category_ids', 'offsets', 'key_ids', 'values')
+
+    def __init__(self, category_ids, offsets, key_ids, values):
+        self.category_ids = category_ids
+        self.offsets = offsets
+        self.key_ids = key_ids
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def _category_range(self, category):
+        """分类的条目范围 (起始, 结束)，分类不存在时返回None"""
+        category_id = _vocabulary.lookup(category)
+        if category_id is None:
+            return None
+        i = bisect_left(self.category_ids, category_id)
+        if i == len(self.category_ids) or self.category_ids[i] != category_id:
+            return None
+        return self.offsets[i], self.offsets[i + 1]
+
+    def has_category(self, category):
+        return self._category_range(category) is not None
+
+    def get(self, category, key, default=None):
+        """获取分类中某个条目的值"""
+        bounds = self._category_range(category)
+        key_id = _vocabulary.lookup(key)
+        if bounds is None or key_id is None:
+            return default
+        lo, hi = bounds
+        try:
+            return self.values[lo + self.key_ids[lo:hi].index(key_id)]
+        except ValueError:
+            return default
+
+    def total(self, term):
+        """选择性解析时累加的分类求和输入项，没有记录时返回None"""
+        return self.get(TOTALS_CATEGORY, term)
+
+    def category_sum(self, category, pattern=None):
+        """分类中（名称匹配pattern的）条目之和，pattern为编译好的正则"""
+        bounds = self._category_range(category)
+        if bounds is None:
+            return 0
+        lo, hi = bounds
+        if pattern is None:
+            return sum(self.values[lo:hi])
+        keys = _vocabulary.keys
+        key_ids, values = self.key_ids, self.values
+        return sum(values[j] for j in range(lo, hi) if pattern.match(keys[key_ids[j]]))
+
+    def items(self, category):
+        """遍历分类中的 (条目名称, 值)"""
+        bounds = self._category_range(category)
+        if bounds is None:
+            return
+        keys = _vocabulary.keys
+        for j in range(*bounds):
+            yield keys[self.key_ids[j]], self.values[j]
+
+    def categories(self):
+        """分类名称列表"""
+        return [_vocabulary.keys[category_id] for category_id in self.category_ids]
+
+    def to_dict(self):
+        """还原为stats文件的格式，选择性解析的分类求和输入项放在totals中"""
+        stats = {}
+        totals = {}
+        for category in self.categories():
+            if category == LOOSE_CATEGORY:
+                stats.update(self.items(category))
+            elif category == TOTALS_CATEGORY:
+                totals.update(self.items(category))
+            else:
+                stats[category] = dict(self.items(category))
+        data = {'stats': stats}
+        if totals:
+            data['totals'] = totals
+        return data
+
+def _is_count(value):
+    # bool是int的子类，不是统计数据
+    return type(value) is int
+
+def _entry_columns(entries):
+    """将 {键名: 值} 转换为 (编号数组, 值数组)"""
+    key_ids = _vocabulary.intern_all(list(entries))
+    try:
+        values = array('q', entries.values())
+    except (TypeError, OverflowError):
+        # 正常的stats文件中都是整数，只有格式异常时才需要逐个过滤
+        pairs = [(key_id, value) for key_id, value in zip(key_ids, entries.values()) if _is_count(value)]
+        key_ids = [key_id for key_id, _ in pairs]
+        values = array('q', [value for _, value in pairs])
+    return array('i', key_ids), values
+
+def compact_stats(data):
+    """将解析得到的stats字典（完整的stats文件或extract_selected_stats的结果）转换为CompactStats"""
+    if isinstance(data, CompactStats):
+        return data
+    intern = _vocabulary.intern
+    groups = {}
+    loose = {}
+    stats = data.get('stats') if isinstance(data, dict) else None
+    if isinstance(stats, dict):
+        for category, entries in stats.items():
+            if isinstance(entries, dict):
+                groups[intern(category)] = _entry_columns(entries)
+            elif _is_count(entries):
+                loose[category] = entries
+    if loose:
+        groups[intern(LOOSE_CATEGORY)] = _entry_columns(loose)
+    totals = data.get('totals') if isinstance(data, dict) else None
+    if totals:
+        groups[intern(TOTALS_CATEGORY)] = _entry_columns(totals)
+
+    category_ids = array('i', sorted(groups))
+    offsets = array('i', [0])
+    key_ids = array('i')
+    values = array('q')
+    for category_id in category_ids:
+        entry_ids, entry_values = groups[category_id]
+        key_ids.extend(entry_ids)
+        values.extend(entry_values)
+        offsets.append(len(values))
+    return CompactStats(category_ids, offsets, key_ids, values)
+
+class PlayerRecord:
+    """parse_all_stats返回的单名玩家记录"""
+    __slots__ = ('name', 'filename', 'stats')
+
+    def __init__(self, name, filename, stats=None):
+        self.name = name
+        self.filename = filename
+        self.stats = stats
@@ -0,0 +1,359 @@
+import os
+import copy
+import json
+import logging
+import threading
+
+# 默认配置，配置文件缺少的项会使用这里的值
+DEFAULT_CONFIG = {
+    "github": {
+        "token": "",  # GitHub个人访问令牌
+        "repo_owner": "",  # 仓库所有者
+        "repo_name": "",  # 仓库名称
+        "repo_path": "",  # 本地GitHub仓库路径
+        "file_path": "ranking.md",  # 仓库中的文件路径
+        "branch": "main",
+        "publish_mode": "worktree",  # worktree：复制到工作区后提交；objects：直接写入对象库，支持裸仓库
+        "push_retries": 3  # 推送冲突时拉取、变基后重试的次数
+    },
+    "output": {
+        "json": False,  # 是否同时生成并发布ranking.json
+        "stat_pages": False,  # 是否为每项统计数据生成单独页面
+        "top_n": 10,  # ranking.json和单独页面中的名次数量
+        "dir": ""  # 生成文件的目录，留空时使用插件目录
+    },
+    "ranking_names": {
+        "minecraft:play_time": "在线时长最长",
+        "minecraft:walk_one_cm": "步行距离最远",
+        "minecraft:fly_one_cm": "飞行距离最远",
+        "minecraft:swim_one_cm": "游泳距离最远",
+        "minecraft:jump": "跳跃次数最多",
+        "minecraft:mob_kills": "杀死生物最多",
+        "minecraft:damage_taken": "受到伤害最多",
+        "player_stats:blocks_broken": "破坏方块最多"
+    },
+    "update": {
+        "enabled": True,
+        "mode": "timer",  # timer：定时更新；watch：stats目录变化时立即重新生成排行榜，上传仍按定时进行
+        "interval": 3600,  # 默认1小时更新一次
+        "use_daily": False,
+        "daily_time": 8.5,
+        "watch_debounce": 5,
+        "watch_poll_interval": 10
+    },
+    "plugin": {
+        "enabled": True
+    },
+    "server": {
+        "server_dir": "",  # 服务端目录，留空时自动查找server文件夹
+        "level_name": ""  # 存档名称，留空时从server.properties读取
+    },
+    "network": {
+        # 同一群组中的其他服务端，如 {"name": "lobby", "server_dir": "/srv/lobby", "level_name": ""}；
+        # 所有服务端的数据按uuid合并为一个排行榜
+        "servers": [],
+        # 合并同一玩家在各服务端的数据的方式：sum（求和，默认）、max（取最大值）或
+        # derive（派生统计项：先合并依赖项再重新计算，比值类派生统计项默认使用）
+        "merge_policy": {
+            "minecraft:time_since_death": "max",
+            "minecraft:time_since_rest": "max"
+        }
+    },
+    "history": {
+        "enabled": False,  # 是否记录历史快照以生成时间窗口排行榜
+        "windows": [
+            {"stat": "minecraft:play_time", "days": 7, "name": "本周在线时长最长"},
+            {"stat": "player_stats:blocks_broken", "days": 1, "name": "今日破坏方块最多"}
+        ]
+    },
+    "item_index": {
+        # 为各分类中的每个条目（如挖掘钻石矿石）建立排行榜，供 !!player_stats item 命令查询；
+        # 每名玩家的每个条目都会常驻内存，玩家较多时占用较大；不支持多服务端和流式模式
+        "enabled": False,
+        "categories": ["minecraft:mined", "minecraft:used", "minecraft:killed"]
+    },
+    "performance": {
+        "parse_workers": 4,  # 并行解析stats文件的线程数
+        "use_process_pool": False,  # 是否使用进程池解码JSON
+        "selective_parse": True,  # 只提取排行需要的统计项
+        "snapshot": True,  # 保存排行榜索引快照，重载插件后立即可以查询
+        # 逐个文件流式计算排行榜，不保留任何玩家的数据，内存占用与玩家数无关；
+        # 每次都要重新读取所有文件，并且不提供游戏内查询命令和时间窗口排行榜，只适合内存受限的大型存档
+        "streaming": False
+    },
+    "metrics": {
+        "prometheus_file": ""  # 每次更新后写入的Prometheus文本格式指标文件，留空时不写入
+    },
+    # 派生统计项，格式见derived_metrics.MetricPlan；填写name的统计项会生成排行榜。例如：
+    # "player_stats:ores_mined": {"type": "sum", "category": "minecraft:mined", "match": ["*_ore"], "unit": "个"},
+    # "player_stats:kills_per_death": {"type": "ratio", "numerator": "minecraft:mob_kills", "denominator": "minecraft:deaths"},
+    # "player_stats:play_hours": {"type": "scale", "stat": "minecraft:play_time", "factor": 0.0000138889, "digits": 1, "unit": "小时"}
+    "derived_metrics": {}
+}
+
+# 配置项类型，校验失败的项会被替换为默认值
+CONFIG_SCHEMA = {
+    "github": {
+        "token": str,
+        "repo_owner": str,
+        "repo_name": str,
+        "repo_path": str,
+        "file_path": str,
+        "branch": str,
+        "publish_mode": str,
+        "push_retries": int
+    },
+    "output": {
+        "json": bool,
+        "stat_pages": bool,
+        "top_n": int,
+        "dir": str
+    },
+    "ranking_names": dict,
+    "update": {
+        "enabled": bool,
+        "mode": str,
+        "interval": (int, float),
+        "use_daily": bool,
+        "daily_time": (int, float),
+        "watch_debounce": (int, float),
+        "watch_poll_interval": (int, float)
+    },
+    "plugin": {
+        "enabled": bool
+    },
+    "server": {
+        "server_dir": str,
+        "level_name": str
+    },
+    "network": {
+        "servers": list,
+        "merge_policy": dict
+    },
+    "history": {
+        "enabled": bool,
+        "windows": list
+    },
+    "item_index": {
+        "enabled": bool,
+        "categories": list
+    },
+    "performance": {
+        "parse_workers": int,
+        "use_process_pool": bool,
+        "selective_parse": bool,
+        "snapshot": bool,
+        "streaming": bool
+    },
+    "metrics": {
+        "prometheus_file": str
+    },
+    "derived_metrics": dict
+}
+
+# 数值项的最小值，小于最小值的项会被替换为默认值
+CONFIG_MINIMUMS = {
+    "github": {
+        "push_retries": 0
+    },
+    "output": {
+        "top_n": 1
+    },
+    "update": {
+        "interval": 1,
+        "daily_time": 0,
+        "watch_debounce": 0,
+        "watch_poll_interval": 1
+    },
+    "performance": {
+        "parse_workers": 1
+    }
+}
+
+_lock = threading.RLock()
+_config_dir = None
+_cached_config = None
+_cached_key = None
+# 内存中的配置，设置后load_config直接返回它，不读写配置文件
+_memory_config = None
+
+def find_config_directory():
+    """找到config文件夹，结果会被缓存"""
+    global _config_dir
+    if _config_dir is not None:
+        return _config_dir
+
+    # 获取当前脚本所在目录
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+
+    # 检查当前目录是否有config文件夹
+    config_dir = os.path.join(current_dir, 'config')
+    if not os.path.isdir(config_dir):
+        # 检查上一级目录
+        parent_config_dir = os.path.join(os.path.dirname(current_dir), 'config')
+        if os.path.isdir(parent_config_dir):
+            config_dir = parent_config_dir
+
+    # 如果都没有，在当前目录创建config文件夹
+    os.makedirs(os.path.join(config_dir, 'player_stats'), exist_ok=True)
+    _config_dir = config_dir
+    return _config_dir
+
+def set_config_directory(config_dir):
+    """指定config文件夹，供基准测试等独立运行的工具使用，之后的配置读写都使用该目录"""
+    global _config_dir, _memory_config
+    with _lock:
+        os.makedirs(os.path.join(config_dir, 'player_stats'), exist_ok=True)
+        _config_dir = config_dir
+        _memory_config = None
+    invalidate_config()
+
+def use_default_config():
+    """不读写配置文件，之后的load_config都返回内存中的默认配置
+
+    供不指定config文件夹的离线工具使用，避免在插件目录下创建配置文件；
+    已经在使用内存中的配置时不做任何操作。
+    """
+    global _memory_config
+    with _lock:
+        if _memory_config is None:
+            _memory_config = copy.deepcopy(DEFAULT_CONFIG)
+
+def get_data_dir():
+    """获取插件的数据目录（config/player_stats）"""
+    return os.path.join(find_config_directory(), 'player_stats')
+
+def get_config_path():
+    """获取配置文件路径"""
+    return os.path.join(get_data_dir(), 'config.json')
+
+def _is_type(value, expected):
+    expected = expected if isinstance(expected, tuple) else (expected,)
+    # bool是int的子类，数值项不接受布尔值
+    if isinstance(value, bool) and bool not in expected:
+        return False
+    return isinstance(value, expected)
+
+def validate_config(config):
+    """按CONFIG_SCHEMA和CONFIG_MINIMUMS校验配置，缺失、类型错误或小于最小值的项使用默认值，返回新的配置字典"""
+    if not isinstance(config, dict):
+        logging.error("配置文件格式错误，使用默认配置")
+        return copy.deepcopy(DEFAULT_CONFIG)
+
+    validated = copy.deepcopy(config)
+
+    # 兼容旧版本的顶层update_interval
+    if 'update_interval' in validated and 'interval' not in validated.get('update', {}):
+        validated.setdefault('update', {})['interval'] = validated['update_interval']
+
+    for section, schema in CONFIG_SCHEMA.items():
+        default_section = DEFAULT_CONFIG[section]
+        value = validated.get(section)
+
+        if not isinstance(schema, dict):
+            if not _is_type(value, schema):
+                if value is not None:
+                    logging.warning(f"配置项 {section} 类型错误，使用默认值")
+                validated[section] = copy.deepcopy(default_section)
+            continue
+
+        if not isinstance(value, dict):
+            if value is not None:
+                logging.warning(f"配置项 {section} 类型错误，使用默认值")
+            validated[section] = copy.deepcopy(default_section)
+            continue
+
+        minimums = CONFIG_MINIMUMS.get(section, {})
+        for key, expected in schema.items():
+            if key not in value:
+                value[key] = copy.deepcopy(default_section[key])
+            elif not _is_type(value[key], expected):
+                logging.warning(f"配置项 {section}.{key} 类型错误，使用默认值")
+                value[key] = copy.deepcopy(default_section[key])
+            elif key in minimums and value[key] < minimums[key]:
+                logging.warning(f"配置项 {section}.{key} 不能小于 {minimums[key]}，使用默认值")
+                value[key] = copy.deepcopy(default_section[key])
+
+    return validated
+
+def _file_key(config_path):
+    try:
+        st = os.stat(config_path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def load_config():
+    """获取配置
+
+    配置在内存中缓存，只有配置文件的修改时间或大小变化时才会重新读取和校验；
+    配置文件不存在时写入默认配置。调用过use_default_config时直接返回内存中的默认配置。返回的字典由所有调用者共享，不要直接修改，
+    需要修改时使用save_config或set_config_value。
+    """
+    global _cached_config, _cached_key
+    if _memory_config is not None:
+        return _memory_config
+    config_path = get_config_path()
+
+    with _lock:
+        key = _file_key(config_path)
+        if key is not None and key == _cached_key:
+            return _cached_config
+
+        # 如果配置文件不存在，创建默认配置
+        if key is None:
+            _write_config(config_path, DEFAULT_CONFIG)
+            _cached_config = copy.deepcopy(DEFAULT_CONFIG)
+            _cached_key = _file_key(config_path)
+            return _cached_config
+
+        # 加载配置文件
+        try:
+            with open(config_path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except Exception as e:
+            logging.error(f"加载配置文件时出错: {e}")
+            # 保留上一次成功加载的配置
+            if _cached_config is None:
+                _cached_config = copy.deepcopy(DEFAULT_CONFIG)
+            _cached_key = key
+            return _cached_config
+
+        _cached_config = validate_config(config)
+        _cached_key = key
+        return _cached_config
+
+def _write_config(config_path, config):
+    """原子地写入配置文件"""
+    tmp_path = config_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, config_path)
+
+def save_config(config):
+    """保存配置文件"""
+    global _cached_config, _cached_key
+    config_path = get_config_path()
+    try:
+        with _lock:
+            _write_config(config_path, config)
+            _cached_config = validate_config(config)
+            _cached_key = _file_key(config_path)
+        return True
+    except Exception as e:
+        logging.error(f"保存配置文件时出错: {e}")
+        return False
+
+def set_config_value(section, key, value):
+    """修改单个配置项并保存"""
+    with _lock:
+        config = copy.deepcopy(load_config())
+        config.setdefault(section, {})[key] = value
+        return save_config(config)
+
+def invalidate_config():
+    """丢弃缓存的配置，下次读取时重新加载配置文件"""
+    global _cached_config, _cached_key
+    with _lock:
+        _cached_config = None
+        _cached_key = None
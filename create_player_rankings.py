@@ -5,12 +5,23 @@ import json
 # 处理相对导入问题
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 try:
-    from .parse_player_data import parse_usercache, parse_all_stats
+    from .parse_player_data import get_player_name_index, parse_all_stats, decode_stats_bytes
     from .get_player_data_paths import get_player_data_paths
+    from .stat_matrix import build_stat_matrix as _build_stat_matrix
+    from .ranking_engine import RankingAccumulator
+    from .derived_metrics import get_metric_plan
+    from .compact_stats import CompactStats, LOOSE_CATEGORY
 except ImportError:
     # 当直接运行时使用绝对导入
-    from parse_player_data import parse_usercache, parse_all_stats
+    from parse_player_data import get_player_name_index, parse_all_stats, decode_stats_bytes
     from get_player_data_paths import get_player_data_paths
+    from stat_matrix import build_stat_matrix as _build_stat_matrix
+    from ranking_engine import RankingAccumulator
+    from derived_metrics import get_metric_plan
+    from compact_stats import CompactStats, LOOSE_CATEGORY
+
+# 流式计算时每批计算派生统计项的玩家数，也是任意时刻最多保留原始数据的玩家数
+STREAM_BATCH_SIZE = 256
 
 def get_stat_unit(stat_key):
     """获取统计数据的单位"""
@@ -64,10 +75,19 @@ def get_stat_unit(stat_key):
         'minecraft:damage_dealt': '点',
         'minecraft:damage_taken': '点'
     }
-    return unit_map.get(stat_key, '')
+    if stat_key in unit_map:
+        return unit_map[stat_key]
+    # 派生统计项在定义中指定单位
+    return get_metric_plan().units.get(stat_key, '')
 
-def extract_stat_value(stats, stat_key):
-    """从统计数据中提取特定值"""
+def extract_base_value(stats, stat_key):
+    """提取stats文件中直接记录的统计数据，stats可以是CompactStats或解析得到的字典"""
+    if isinstance(stats, CompactStats):
+        value = stats.get('minecraft:custom', stat_key)
+        if value is None:
+            value = stats.get(LOOSE_CATEGORY, stat_key, 0)
+        return value
+    
     if 'stats' in stats:
         stats_data = stats['stats']
         
@@ -77,41 +97,156 @@ def extract_stat_value(stats, stat_key):
             if stat_key in custom_stats:
                 return custom_stats[stat_key]
         
-        # 处理破坏方块总数（minecraft:mined）
-        if stat_key == 'minecraft:blocks_broken' and 'minecraft:mined' in stats_data:
-            # 计算所有方块类型的破坏数量之和
-            mined_stats = stats_data['minecraft:mined']
-            total_broken = 0
-            for block, count in mined_stats.items():
-                total_broken += count
-            return total_broken
-        
         # 检查其他可能的存储位置
-        if stat_key in stats_data:
-            return stats_data[stat_key]
+        value = stats_data.get(stat_key)
+        if isinstance(value, (int, float)):
+            return value
     return 0
 
-def create_ranking(stats_data, stat_key, top_n=10):
-    """创建特定统计数据的排行榜"""
+def extract_stat_value(stats, stat_key):
+    """从统计数据中提取特定值，派生统计项（如破坏方块总数）按derived_metrics中的定义计算"""
+    plan = get_metric_plan()
+    if plan.is_derived(stat_key):
+        return plan.evaluate([stats], [stat_key], extract_base_value, vectorized=False)[stat_key][0]
+    return extract_base_value(stats, stat_key)
+
+def compute_stat_columns(stats_data, stat_keys, vectorized=False):
+    """按列计算所有玩家的统计数据，返回 (uuid列表, {stat_key: 列})
+
+    派生统计项由编译好的计算计划整列计算，不会为每名玩家重新解析定义。
+    """
+    uuids = sorted(stats_data)
+    rows = [stats_data[uuid].stats or {} for uuid in uuids]
+    return uuids, get_metric_plan().evaluate(rows, list(stat_keys), extract_base_value, vectorized)
+
+def build_stat_matrix(stats_data, stat_keys):
+    """一次性构建所有排行统计项的列式矩阵，numpy不可用时返回None"""
+    plan = get_metric_plan()
+    return _build_stat_matrix(
+        stats_data, stat_keys,
+        lambda rows, keys: plan.evaluate(rows, keys, extract_base_value)
+    )
+
+def create_ranking(stats_data, stat_key, top_n=10, matrix=None):
+    """创建特定统计数据的排行榜
+
+    传入build_stat_matrix构建的矩阵时，直接从矩阵列中取前N名。
+    """
+    if matrix is not None and stat_key in matrix:
+        return matrix.top_n(stat_key, top_n)
+    
     # 提取所有玩家的该统计数据
+    uuids, columns = compute_stat_columns(stats_data, [stat_key])
     player_stats = []
-    for uuid, data in stats_data.items():
-        value = extract_stat_value(data['stats'], stat_key)
+    for uuid, value in zip(uuids, columns[stat_key]):
         if value > 0:
             player_stats.append({
                 'uuid': uuid,
-                'name': data['name'],
+                'name': stats_data[uuid].name,
                 'value': value
             })
     
-    # 按值排序（降序）
-    player_stats.sort(key=lambda x: x['value'], reverse=True)
+    # 按值排序（降序），同值按uuid排序
+    player_stats.sort(key=lambda x: (-x['value'], x['uuid']))
     
     # 只取前N名
     top_players = player_stats[:top_n]
     
     return top_players
 
+def collect_stat_values(stats_data, stat_keys, matrix=None):
+    """获取每名玩家的统计数据，返回 {uuid: {stat_key: 数值}}"""
+    if matrix is not None and all(stat_key in matrix for stat_key in stat_keys):
+        uuids = matrix.uuids
+        columns = [matrix.column(stat_key).tolist() for stat_key in stat_keys]
+    else:
+        uuids, columns_by_key = compute_stat_columns(stats_data, stat_keys)
+        columns = [columns_by_key[stat_key] for stat_key in stat_keys]
+    return {uuid: dict(zip(stat_keys, row)) for uuid, row in zip(uuids, zip(*columns))}
+
+def create_rankings(stats_data, stat_keys, top_n=10, matrix=None):
+    """一次性创建多个统计数据的排行榜，返回 {stat_key: ranking}
+
+    传入统计矩阵时按列取前N名，否则单次遍历所有玩家并用有界堆维护每个排行榜。
+    """
+    if matrix is not None:
+        return {stat_key: create_ranking(stats_data, stat_key, top_n, matrix) for stat_key in stat_keys}
+    
+    accumulator = RankingAccumulator(stat_keys, top_n)
+    uuids, columns = compute_stat_columns(stats_data, accumulator.stat_keys)
+    for i, uuid in enumerate(uuids):
+        values = {stat_key: columns[stat_key][i] for stat_key in accumulator.stat_keys}
+        accumulator.add(uuid, stats_data[uuid].name, values)
+    return accumulator.results()
+
+def iter_stats_files(stats_dir, counters=None):
+    """逐个读取stats目录中的文件，生成 (uuid, 文件原始内容)
+
+    counters不为空时累加读取的文件数（files）和字节数（bytes）。
+    """
+    with os.scandir(stats_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path, 'rb') as f:
+                    raw = f.read()
+            except OSError as e:
+                print(f"Error reading {entry.name}: {e}")
+                continue
+            if counters is not None:
+                counters['files'] = counters.get('files', 0) + 1
+                counters['bytes'] = counters.get('bytes', 0) + len(raw)
+            yield entry.name[:-5], raw
+
+def stream_stat_values(raw_items, stat_keys, batch_size=STREAM_BATCH_SIZE, counters=None):
+    """将 (uuid, stats文件原始内容) 流转换为 (uuid, {stat_key: 数值}) 流
+
+    每个文件解码时只提取stat_keys需要的统计项，凑满batch_size名玩家后按列计算
+    派生统计项并立即丢弃这一批的解析结果，不会同时保留所有玩家的stats；
+    raw_items同样是逐个生成的，内存占用与玩家数无关。
+    counters不为空时累加解析的玩家数（players）和解析失败的文件数（errors）。
+    """
+    plan = get_metric_plan()
+    stat_keys = list(stat_keys)
+    parse_keys = tuple(plan.parse_keys(stat_keys))
+    uuids = []
+    rows = []
+
+    def flush():
+        columns = plan.evaluate(rows, stat_keys, extract_base_value, vectorized=False)
+        for i, uuid in enumerate(uuids):
+            yield uuid, {stat_key: columns[stat_key][i] for stat_key in stat_keys}
+
+    for uuid, raw in raw_items:
+        data = decode_stats_bytes(raw, parse_keys, f"stats of {uuid}")
+        if not data:
+            if counters is not None:
+                counters['errors'] = counters.get('errors', 0) + 1
+            continue
+        if counters is not None:
+            counters['players'] = counters.get('players', 0) + 1
+        uuids.append(uuid)
+        rows.append(data)
+        if len(rows) >= batch_size:
+            yield from flush()
+            uuids = []
+            rows = []
+    if rows:
+        yield from flush()
+
+def create_rankings_streaming(stats_dir, uuid_to_name, stat_keys, top_n=10, counters=None):
+    """不解析出完整的stats_data，逐个文件计算排行值并直接送入有界堆
+
+    内存占用为每个排行榜的前top_n名加上一批正在计算的玩家，与玩家总数无关；
+    不使用parse_all_stats的解析缓存，每次都会重新读取所有文件。
+    """
+    accumulator = RankingAccumulator(stat_keys, top_n)
+    values_stream = stream_stat_values(iter_stats_files(stats_dir, counters), accumulator.stat_keys, counters=counters)
+    for uuid, values in values_stream:
+        accumulator.add(uuid, uuid_to_name.get(uuid, f"Unknown ({uuid[:8]}...)"), values)
+    return accumulator.results()
+
 def format_ranking(ranking, stat_key, stat_name):
     """格式化排行榜输出"""
     unit = get_stat_unit(stat_key)
@@ -158,8 +293,8 @@ def create_all_rankings():
     
     # 解析数据
     if paths['usercache_exists'] and paths['stats_exists']:
-        # 解析usercache.json获取UUID到名称的映射
-        uuid_to_name = parse_usercache(paths['usercache_path'])
+        # 获取UUID到名称的映射
+        uuid_to_name = get_player_name_index(os.path.dirname(paths['usercache_path']))
         
         # 解析所有stats文件
         stats_data = parse_all_stats(paths['stats_dir'], uuid_to_name)
@@ -176,12 +311,17 @@ def create_all_rankings():
             ('minecraft:jump', '跳跃次数'),
             ('minecraft:mob_kills', '杀死生物数'),
             ('minecraft:damage_taken', '受到伤害'),
-            ('minecraft:blocks_broken', '破坏方块数')
+            ('player_stats:blocks_broken', '破坏方块数')
         ]
         
-        # 生成每个统计数据的排行榜
+        # 一次性计算所有排行榜
+        stat_keys = [stat_key for stat_key, _ in ranking_stats]
+        matrix = build_stat_matrix(stats_data, stat_keys)
+        rankings = create_rankings(stats_data, stat_keys, matrix=matrix)
+        
+        # 输出每个统计数据的排行榜
         for stat_key, stat_name in ranking_stats:
-            ranking = create_ranking(stats_data, stat_key)
+            ranking = rankings[stat_key]
             if ranking:
                 formatted_ranking = format_ranking(ranking, stat_key, stat_name)
                 print(formatted_ranking)
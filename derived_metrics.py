@@ -0,0 +1,324 @@
+import os
+import re
+import sys
+import json
+import logging
+import threading
+from fnmatch import translate
+from functools import lru_cache
+
+# numpy为可选依赖，未安装时按列表逐列计算
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 处理相对导入问题
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+try:
+    from .config_service import load_config
+    from .compact_stats import CompactStats
+except ImportError:
+    # 当直接运行时使用绝对导入
+    from config_service import load_config
+    from compact_stats import CompactStats
+
+# 内置的派生统计项（各分类的总数），配置文件中的同名定义会覆盖这里的定义；
+# 使用player_stats:前缀，不会与stats文件中同名的统计项冲突
+BUILTIN_METRICS = {
+    'player_stats:blocks_broken': {'type': 'sum', 'category': 'minecraft:mined', 'unit': '次'},
+    'player_stats:killed_by': {'type': 'sum', 'category': 'minecraft:killed_by', 'unit': '次'},
+    'player_stats:crafted': {'type': 'sum', 'category': 'minecraft:crafted', 'unit': '次'},
+    'player_stats:dropped': {'type': 'sum', 'category': 'minecraft:dropped', 'unit': '次'},
+    'player_stats:broken': {'type': 'sum', 'category': 'minecraft:broken', 'unit': '次'}
+}
+
+# 旧版本中内置派生统计项使用的键名，作为新键名的别名继续有效，
+# 时间窗口、其他派生统计项和API中仍使用旧键名时得到相同的值
+LEGACY_METRIC_KEYS = {
+    'minecraft:blocks_broken': 'player_stats:blocks_broken',
+    'minecraft:mined': 'player_stats:blocks_broken',
+    'minecraft:killed_by': 'player_stats:killed_by',
+    'minecraft:crafted': 'player_stats:crafted',
+    'minecraft:dropped': 'player_stats:dropped',
+    'minecraft:broken': 'player_stats:broken'
+}
+
+# 比值和缩放结果默认保留的小数位数
+DEFAULT_DIGITS = 2
+
+@lru_cache(maxsize=None)
+def compile_item_pattern(patterns, as_bytes=False):
+    """将通配符列表（如 ('*_ore',)）编译为匹配条目名称的正则，patterns为None时返回None"""
+    if patterns is None:
+        return None
+    regex = '|'.join(f'(?:{translate(pattern)})' for pattern in patterns)
+    return re.compile(regex.encode('utf-8') if as_bytes else regex)
+
+def category_term(category, match=None):
+    """构建分类求和的输入项 (分类, 通配符元组或None)，可以作为选择性解析的键"""
+    if isinstance(match, str):
+        match = [match]
+    return (category, tuple(sorted(match)) if match else None)
+
+# 选择性解析时保留分类中所有条目的键 (分类, ITEM_ENTRIES)，用于按条目的排行榜
+ITEM_ENTRIES = '#entries'
+
+def item_category_key(category):
+    """构建保留整个分类的选择性解析键，解析结果中该分类与完整解析时相同"""
+    return (category, ITEM_ENTRIES)
+
+def is_item_category_key(key):
+    return isinstance(key, tuple) and key[1] == ITEM_ENTRIES
+
+def extract_category_term(stats, term):
+    """计算单个玩家的分类求和输入项，选择性解析时直接使用解析阶段累加的结果"""
+    if isinstance(stats, CompactStats):
+        total = stats.total(term)
+        if total is None:
+            total = stats.category_sum(term[0], compile_item_pattern(term[1]))
+        return total
+    totals = stats.get('totals')
+    if totals and term in totals:
+        return totals[term]
+    category, patterns = term
+    entries = stats.get('stats', {}).get(category)
+    if not entries:
+        return 0
+    pattern = compile_item_pattern(patterns)
+    if pattern is None:
+        return sum(entries.values())
+    return sum(value for item, value in entries.items() if pattern.match(item))
+
+def _require(definition, field, types):
+    value = definition.get(field)
+    if not isinstance(value, types) or isinstance(value, bool):
+        raise ValueError(f'缺少或错误的字段 {field}')
+    return value
+
+def _compile_definition(definition):
+    """将单个派生统计项的定义编译为计算步骤"""
+    if not isinstance(definition, dict):
+        raise ValueError('定义必须是对象')
+    metric_type = definition.get('type')
+    if metric_type == 'sum':
+        if 'category' in definition:
+            match = definition.get('match')
+            if match is not None and not isinstance(match, (str, list)):
+                raise ValueError('错误的字段 match')
+            return ('input', category_term(_require(definition, 'category', str), match))
+        stats = _require(definition, 'stats', list)
+        if not stats or not all(isinstance(stat_key, str) for stat_key in stats):
+            raise ValueError('错误的字段 stats')
+        return ('add', tuple(stats))
+    digits = definition.get('digits', DEFAULT_DIGITS)
+    if not isinstance(digits, int) or isinstance(digits, bool) or digits < 0:
+        raise ValueError('错误的字段 digits')
+    if metric_type == 'ratio':
+        return ('ratio', _require(definition, 'numerator', str), _require(definition, 'denominator', str), digits)
+    if metric_type == 'scale':
+        return ('scale', _require(definition, 'stat', str), _require(definition, 'factor', (int, float)), digits)
+    raise ValueError(f'未知的类型 {metric_type}')
+
+def _dependencies(step):
+    """计算步骤引用的其他统计项"""
+    op = step[0]
+    if op == 'add':
+        return step[1]
+    if op == 'ratio':
+        return step[1:3]
+    if op == 'scale':
+        return step[1:2]
+    return ()
+
+def _round(values, digits, use_numpy):
+    """按小数位数取整，digits为0时得到整数"""
+    if use_numpy:
+        return values.round().astype(np.int64) if digits == 0 else values.round(digits)
+    return [int(round(value)) if digits == 0 else round(value, digits) for value in values]
+
+def _apply(step, columns, use_numpy):
+    """对整列执行一个计算步骤"""
+    op = step[0]
+    if op == 'input':
+        return columns[step[1]]
+    if op == 'add':
+        operands = [columns[stat_key] for stat_key in step[1]]
+        if use_numpy:
+            return sum(operands[1:], operands[0])
+        return [sum(values) for values in zip(*operands)]
+    if op == 'ratio':
+        # 分母为0时按1计算，如没有死亡过的玩家的击杀死亡比等于击杀数
+        numerator, denominator = columns[step[1]], columns[step[2]]
+        if use_numpy:
+            return _round(numerator / np.where(denominator > 0, denominator, 1), step[3], use_numpy)
+        return _round([n / (d if d > 0 else 1) for n, d in zip(numerator, denominator)], step[3], use_numpy)
+    # scale
+    column, factor = columns[step[1]], step[2]
+    if use_numpy:
+        return _round(column * factor, step[3], use_numpy)
+    return _round([value * factor for value in column], step[3], use_numpy)
+
+class MetricPlan:
+    """派生统计项的计算计划
+
+    定义只在创建时解析一次：每个统计项编译为一个计算步骤，按依赖关系排序。
+    计算时先为需要的输入项（stats文件中的统计数据或分类求和）各提取一整列，
+    再按顺序对整列执行计算步骤；numpy可用时每个步骤都是一次向量运算。
+
+    支持的定义：
+    - {"type": "sum", "category": 分类, "match": 通配符或通配符列表}：分类中（匹配的）条目之和
+    - {"type": "sum", "stats": [统计项, ...]}：多个统计项之和
+    - {"type": "ratio", "numerator": 统计项, "denominator": 统计项, "digits": 2}：比值，分母为0时按1计算
+    - {"type": "scale", "stat": 统计项, "factor": 系数, "digits": 2}：乘以系数，如换算单位
+    可选字段name（填写后生成该项的排行榜）和unit（显示单位）。
+    """
+
+    def __init__(self, definitions):
+        self.steps = {}
+        self.names = {}
+        self.units = {}
+        self.errors = []
+        for stat_key, definition in definitions.items():
+            try:
+                self.steps[stat_key] = _compile_definition(definition)
+            except ValueError as e:
+                self.errors.append(f'{stat_key}: {e}')
+                continue
+            if isinstance(definition.get('name'), str):
+                self.names[stat_key] = definition['name']
+            if isinstance(definition.get('unit'), str):
+                self.units[stat_key] = definition['unit']
+        self.order = self._sort_steps()
+        self._requirements = {}
+        self._lock = threading.Lock()
+
+    def _sort_steps(self):
+        """按依赖关系排序，存在循环引用的统计项会被移除"""
+        order = []
+        state = {}
+
+        def visit(stat_key, path):
+            if state.get(stat_key) in ('done', 'failed'):
+                return state[stat_key] == 'done'
+            if state.get(stat_key) == 'visiting':
+                self.errors.append(f'{stat_key}: 循环引用 {" -> ".join(path + [stat_key])}')
+                return False
+            state[stat_key] = 'visiting'
+            ok = all(visit(dep, path + [stat_key]) for dep in _dependencies(self.steps[stat_key]) if dep in self.steps)
+            state[stat_key] = 'done' if ok else 'failed'
+            if ok:
+                order.append(stat_key)
+            return ok
+
+        for stat_key in list(self.steps):
+            if state.get(stat_key) is None:
+                visit(stat_key, [])
+        for stat_key, value in state.items():
+            if value == 'failed':
+                del self.steps[stat_key]
+                self.names.pop(stat_key, None)
+                self.units.pop(stat_key, None)
+        return order
+
+    def is_derived(self, stat_key):
+        """是否为派生统计项"""
+        return stat_key in self.steps
+
+    def dependencies(self, stat_key):
+        """派生统计项直接引用的其他统计项，分类求和和非派生的统计项返回空元组"""
+        step = self.steps.get(stat_key)
+        return tuple(_dependencies(step)) if step is not None else ()
+
+    def recompute(self, stat_key, columns):
+        """用依赖项的列表列 {统计项: [数值]} 计算派生统计项，返回列表"""
+        return _apply(self.steps[stat_key], columns, False)
+
+    def ranked_metrics(self):
+        """填写了name的派生统计项 [(stat_key, name)]"""
+        return list(self.names.items())
+
+    def requirements(self, stat_keys):
+        """计算stat_keys需要的输入项和计算步骤，返回 (输入项列表, 派生统计项列表)"""
+        cache_key = tuple(stat_keys)
+        with self._lock:
+            cached = self._requirements.get(cache_key)
+        if cached is not None:
+            return cached
+
+        inputs = []
+        needed = set()
+
+        def visit(stat_key):
+            if stat_key in needed:
+                return
+            needed.add(stat_key)
+            step = self.steps.get(stat_key)
+            if step is None:
+                inputs.append(stat_key)
+            elif step[0] == 'input':
+                if step[1] not in needed:
+                    needed.add(step[1])
+                    inputs.append(step[1])
+            else:
+                for dep in _dependencies(step):
+                    visit(dep)
+
+        for stat_key in stat_keys:
+            visit(stat_key)
+        result = (inputs, [stat_key for stat_key in self.order if stat_key in needed])
+        with self._lock:
+            self._requirements[cache_key] = result
+        return result
+
+    def parse_keys(self, stat_keys):
+        """选择性解析需要提取的键：minecraft:custom中的统计项和分类求和输入项"""
+        return self.requirements(stat_keys)[0]
+
+    def evaluate(self, rows, stat_keys, extract_value, vectorized=True):
+        """为所有玩家计算stat_keys，返回 {stat_key: 列}
+
+        rows为每名玩家的stats，extract_value为 (stats, stat_key) -> 数值，用于提取非派生的统计项。
+        vectorized为True且numpy可用时返回numpy数组，否则返回列表。
+        """
+        inputs, order = self.requirements(stat_keys)
+        use_numpy = vectorized and np is not None
+        columns = {}
+        for key in inputs:
+            if isinstance(key, tuple):
+                values = [extract_category_term(stats, key) for stats in rows]
+            else:
+                values = [extract_value(stats, key) for stats in rows]
+            columns[key] = np.array(values) if use_numpy else values
+        for stat_key in order:
+            columns[stat_key] = _apply(self.steps[stat_key], columns, use_numpy)
+        return {stat_key: columns[stat_key] for stat_key in stat_keys}
+
+# 编译好的计划，派生统计项的定义变化时重新编译
+_plan = None
+_plan_key = None
+_plan_config = None
+_plan_lock = threading.Lock()
+
+def get_metric_plan():
+    """获取根据内置定义（包括旧键名的别名）和配置文件中derived_metrics编译的计算计划"""
+    global _plan, _plan_key, _plan_config
+    config = load_config()
+    # 配置未重新加载时直接使用编译好的计划
+    if _plan is not None and _plan_config is config:
+        return _plan
+
+    definitions = dict(BUILTIN_METRICS)
+    for legacy_key, stat_key in LEGACY_METRIC_KEYS.items():
+        definitions[legacy_key] = {'type': 'sum', 'stats': [stat_key], 'unit': BUILTIN_METRICS[stat_key]['unit']}
+    definitions.update(config.get('derived_metrics', {}))
+    key = json.dumps(definitions, sort_keys=True)
+
+    with _plan_lock:
+        _plan_config = config
+        if _plan is None or _plan_key != key:
+            _plan = MetricPlan(definitions)
+            _plan_key = key
+            for error in _plan.errors:
+                logging.warning(f'派生统计项定义错误，已忽略: {error}')
+        return _plan
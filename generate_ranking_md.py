@@ -1,18 +1,37 @@
 import os
 import sys
 import json
+import time
 
 # 处理相对导入问题
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 try:
-    from .create_player_rankings import create_ranking, get_stat_unit
-    from .parse_player_data import parse_usercache, parse_all_stats
-    from .get_player_data_paths import get_player_data_paths
+    from .create_player_rankings import create_rankings, build_stat_matrix, collect_stat_values, get_stat_unit
+    from .create_player_rankings import create_rankings_streaming
+    from .item_index import get_item_index
+    from .parse_player_data import get_player_name_index, parse_all_stats, get_stats_cache_info, get_stats_cache_entries
+    from .get_player_data_paths import get_server_sources
+    from .stats_history import get_stats_history
+    from .ranking_index import get_ranking_index
+    from .pipeline_metrics import get_metrics
+    from .derived_metrics import get_metric_plan, item_category_key, LEGACY_METRIC_KEYS
+    from .stats_snapshot import write_snapshot, snapshot_is_current
+    from .network_stats import scan_servers, merge_names, merge_ranking, merge_values, resolve_merge_policies
+    from .config_service import load_config, get_data_dir
 except ImportError:
     # 当直接运行时使用绝对导入
-    from create_player_rankings import create_ranking, get_stat_unit
-    from parse_player_data import parse_usercache, parse_all_stats
-    from get_player_data_paths import get_player_data_paths
+    from create_player_rankings import create_rankings, build_stat_matrix, collect_stat_values, get_stat_unit
+    from create_player_rankings import create_rankings_streaming
+    from item_index import get_item_index
+    from parse_player_data import get_player_name_index, parse_all_stats, get_stats_cache_info, get_stats_cache_entries
+    from get_player_data_paths import get_server_sources
+    from stats_history import get_stats_history
+    from ranking_index import get_ranking_index
+    from pipeline_metrics import get_metrics
+    from derived_metrics import get_metric_plan, item_category_key, LEGACY_METRIC_KEYS
+    from stats_snapshot import write_snapshot, snapshot_is_current
+    from network_stats import scan_servers, merge_names, merge_ranking, merge_values, resolve_merge_policies
+    from config_service import load_config, get_data_dir
 
 def get_top_player(ranking):
     """获取排行榜的第一名"""
@@ -26,72 +45,168 @@ def format_time_days(days):
     minutes = days * 1440
     return f"{int(minutes)}分钟"
 
-def find_config_directory():
-    """找到config文件夹"""
-    # 获取当前脚本所在目录
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    
-    # 检查当前目录是否有config文件夹
-    config_dir = os.path.join(current_dir, 'config')
-    if os.path.exists(config_dir) and os.path.isdir(config_dir):
-        return config_dir
-    
-    # 检查上一级目录
-    parent_dir = os.path.dirname(current_dir)
-    config_dir = os.path.join(parent_dir, 'config')
-    if os.path.exists(config_dir) and os.path.isdir(config_dir):
-        return config_dir
-    
-    # 如果都没有，在当前目录创建config文件夹
-    config_dir = os.path.join(current_dir, 'config')
-    os.makedirs(config_dir, exist_ok=True)
-    return config_dir
-
-def get_config_path():
-    """获取配置文件路径"""
-    config_dir = find_config_directory()
-    player_stats_dir = os.path.join(config_dir, 'player_stats')
-    os.makedirs(player_stats_dir, exist_ok=True)
-    return os.path.join(player_stats_dir, 'config.json')
-
-def load_config():
-    """加载配置文件"""
-    config_path = get_config_path()
-    
-    # 如果配置文件不存在，创建默认配置
-    if not os.path.exists(config_path):
-        default_config = {
-            "github": {
-                "repo_path": "",  # 本地GitHub仓库路径
-                "branch": "main",
-                "file_path": "ranking.md"  # 仓库中的文件路径
-            },
-            "ranking_names": {
-                "minecraft:play_time": "在线时长最长",
-                "minecraft:walk_one_cm": "步行距离最远",
-                "minecraft:fly_one_cm": "飞行距离最远",
-                "minecraft:swim_one_cm": "游泳距离最远",
-                "minecraft:jump": "跳跃次数最多",
-                "minecraft:mob_kills": "杀死生物最多",
-                "minecraft:damage_taken": "受到伤害最多",
-                "minecraft:blocks_broken": "破坏方块最多"
-            },
-            "update_interval": 3600  # 默认1小时更新一次
-        }
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(default_config, f, indent=2, ensure_ascii=False)
-        return default_config
-    
-    # 加载配置文件
-    with open(config_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+def format_display_value(stat_key, value):
+    """将统计数据格式化为显示文本"""
+    unit = get_stat_unit(stat_key)
+    
+    # 特殊处理单位
+    if unit == '天':
+        # 游戏刻转换为天，再转换为分钟
+        days = value / 24000
+        return format_time_days(days)
+    elif unit == '米':
+        # 厘米转换为米
+        return f"{value / 100:.1f}米"
+    else:
+        # 比值等派生统计项为小数，整数值不显示小数点
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return f"{value}{unit}"
+
+# 默认生成排行榜的统计数据
+DEFAULT_RANKING_STATS = [
+    ('minecraft:play_time', '在线时长最长'),
+    ('minecraft:walk_one_cm', '步行距离最远'),
+    ('minecraft:fly_one_cm', '飞行距离最远'),
+    ('minecraft:swim_one_cm', '游泳距离最远'),
+    ('minecraft:jump', '跳跃次数最多'),
+    ('minecraft:mob_kills', '杀死生物最多'),
+    ('minecraft:damage_taken', '受到伤害最多'),
+    ('player_stats:blocks_broken', '破坏方块最多')
+]
+
+def get_ranking_stats(config):
+    """获取要生成排行榜的统计数据及其显示名称，包括填写了name的派生统计项"""
+    ranking_names = config.get('ranking_names', {})
+    ranking_stats = []
+    stats = list(DEFAULT_RANKING_STATS)
+    default_keys = {stat_key for stat_key, _ in stats}
+    stats += [item for item in get_metric_plan().ranked_metrics() if item[0] not in default_keys]
+    for stat_key, default_name in stats:
+        # 使用配置文件中的名称，如果不存在则使用默认名称
+        display_name = ranking_names.get(stat_key, default_name)
+        if display_name == default_name:
+            # 配置文件中仍按旧键名设置的显示名称继续有效
+            for legacy_key, new_key in LEGACY_METRIC_KEYS.items():
+                if new_key == stat_key and legacy_key in ranking_names:
+                    display_name = ranking_names[legacy_key]
+                    break
+        ranking_stats.append((stat_key, display_name))
+    return ranking_stats
+
+def is_valid_window(window):
+    """时间窗口排行榜配置是否有效：stat为字符串，days（可选）为正数，name（可选）为字符串"""
+    if not isinstance(window, dict) or not isinstance(window.get('stat'), str):
+        return False
+    days = window.get('days', 1)
+    if isinstance(days, bool) or not isinstance(days, (int, float)) or days <= 0:
+        return False
+    return isinstance(window.get('name', ''), str)
+
+def get_history_windows(config):
+    """获取启用的时间窗口排行榜配置，跳过格式错误的项"""
+    history_config = config.get('history', {})
+    if not history_config.get('enabled', False):
+        return []
+    windows = []
+    for window in history_config.get('windows', []):
+        if is_valid_window(window):
+            windows.append(window)
+        else:
+            print(f"Skipping invalid history window: {window!r}")
+    return windows
+
+def get_index_stat_keys(config):
+    """获取需要解析并写入排行榜索引的统计项：所有排行榜以及时间窗口排行榜使用的统计项"""
+    stat_keys = [stat_key for stat_key, _ in get_ranking_stats(config)]
+    for window in get_history_windows(config):
+        if window['stat'] not in stat_keys:
+            stat_keys.append(window['stat'])
+    return stat_keys
+
+def get_item_categories(config):
+    """获取需要建立条目索引的分类，未启用时返回空列表"""
+    item_config = config.get('item_index', {})
+    return item_config.get('categories', []) if item_config.get('enabled', False) else []
+
+def get_parse_keys(config, stat_keys, item_categories=()):
+    """选择性解析需要提取的键，关闭选择性解析时返回None；item_categories中的分类保留所有条目"""
+    if not config.get('performance', {}).get('selective_parse', True):
+        return None
+    return get_metric_plan().parse_keys(stat_keys) + [item_category_key(category) for category in item_categories]
+
+def get_output_dir():
+    """获取生成文件的输出目录，默认为插件目录"""
+    output_dir = load_config().get('output', {}).get('dir', '')
+    return output_dir or os.path.dirname(os.path.abspath(__file__))
+
+def get_stat_page_name(stat_key):
+    """获取单项排行榜页面的文件名，如 minecraft:play_time -> play_time.md"""
+    return stat_key.split(':', 1)[-1].replace(':', '_') + '.md'
+
+def get_output_files(config):
+    """获取本次要发布的所有文件，返回 {仓库中的路径: 本地路径}
+
+    总是包含ranking.md；output.json为True时包含ranking.json，
+    output.stat_pages为True时包含每项统计数据的单独页面。
+    """
+    output_dir = get_output_dir()
+    output_config = config.get('output', {})
+    file_path = config.get('github', {}).get('file_path', 'ranking.md')
+    repo_dir = os.path.dirname(file_path)
+    
+    files = {file_path: os.path.join(output_dir, 'ranking.md')}
+    if output_config.get('json', False):
+        files[os.path.splitext(file_path)[0] + '.json'] = os.path.join(output_dir, 'ranking.json')
+    if output_config.get('stat_pages', False):
+        for stat_key, _ in get_ranking_stats(config):
+            page_name = get_stat_page_name(stat_key)
+            files[os.path.join(repo_dir, 'rankings', page_name)] = os.path.join(output_dir, 'rankings', page_name)
+    return files
+
+def write_output_file(path, content):
+    """原子地写入生成的文件"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+def format_stat_page(stat_name, stat_key, ranking):
+    """生成单项排行榜页面的markdown内容"""
+    lines = [f"# {stat_name}", "", "| 排名 | 玩家 | 数值 |", "| --- | --- | --- |"]
+    for i, player in enumerate(ranking, 1):
+        lines.append(f"| {i} | {player['name']} | {format_display_value(stat_key, player['value'])} |")
+    if not ranking:
+        lines.append("| - | 无数据 | - |")
+    return '\n'.join(lines) + '\n'
+
+def get_history_db_path():
+    """获取历史快照数据库路径"""
+    return os.path.join(get_data_dir(), 'history.db')
+
+def get_snapshot_path():
+    """获取排行榜索引快照的路径"""
+    return os.path.join(get_data_dir(), 'stats_snapshot.bin')
 
 def generate_ranking_md():
     """生成ranking.md文件"""
-    # 获取路径
-    paths = get_player_data_paths()
+    metrics = get_metrics()
+    
+    # 获取路径，配置了network.servers时包含多个服务端
+    with metrics.stage('paths'):
+        sources = get_server_sources()
+    paths = sources[0]
+    network = len(sources) > 1
     
-    if not paths['usercache_exists'] or not paths['stats_exists']:
+    if network:
+        available = [source for source in sources if source['usercache_exists'] and source['stats_exists']]
+        for source in sources:
+            if source not in available:
+                print(f"Skipping server {source['label']}: usercache.json or stats directory not found")
+        if not available:
+            return
+    elif not paths['usercache_exists'] or not paths['stats_exists']:
         print("Missing required files:")
         if not paths['usercache_exists']:
             print("- usercache.json not found")
@@ -102,70 +217,192 @@ def generate_ranking_md():
     # 加载配置
     config = load_config()
     ranking_names = config.get('ranking_names', {})
-    
-    # 解析数据
-    uuid_to_name = parse_usercache(paths['usercache_path'])
-    stats_data = parse_all_stats(paths['stats_dir'], uuid_to_name)
-    
-    # 定义要生成排行榜的统计数据
-    default_ranking_stats = [
-        ('minecraft:play_time', '在线时长最长'),
-        ('minecraft:walk_one_cm', '步行距离最远'),
-        ('minecraft:fly_one_cm', '飞行距离最远'),
-        ('minecraft:swim_one_cm', '游泳距离最远'),
-        ('minecraft:jump', '跳跃次数最多'),
-        ('minecraft:mob_kills', '杀死生物最多'),
-        ('minecraft:damage_taken', '受到伤害最多'),
-        ('minecraft:blocks_broken', '破坏方块最多')
-    ]
+    performance_config = config.get('performance', {})
+    history_windows = get_history_windows(config)
     
     # 从配置文件中获取项目名称
-    ranking_stats = []
-    for stat_key, default_name in default_ranking_stats:
-        # 使用配置文件中的名称，如果不存在则使用默认名称
-        display_name = ranking_names.get(stat_key, default_name)
-        ranking_stats.append((stat_key, display_name))
+    ranking_stats = get_ranking_stats(config)
+    ranking_keys = [stat_key for stat_key, _ in ranking_stats]
+    
+    # 时间窗口排行榜需要的统计项也要一并解析
+    stat_keys = get_index_stat_keys(config)
+    
+    # 只生成ranking.md时只需要榜一
+    output_config = config.get('output', {})
+    write_full_rankings = output_config.get('json', False) or output_config.get('stat_pages', False)
+    top_n = output_config.get('top_n', 10) if write_full_rankings else 1
+    
+    # 流式模式下边读取边排行，不保留解析结果；多个服务端需要按uuid合并，不支持流式计算
+    streaming = performance_config.get('streaming', False) and not network
+    if streaming and history_windows:
+        print("Streaming mode: history windows need every player's values and are skipped")
+        history_windows = []
+    # 条目索引需要每名玩家的完整分类，只在单个服务端的普通模式下建立
+    item_categories = get_item_categories(config) if not network and not streaming else []
+    
+    # 解析数据；多个服务端时并发解析，每个服务端只保留需要排行的统计项
+    parse_options = {
+        'workers': performance_config.get('parse_workers', 4),
+        'use_process_pool': performance_config.get('use_process_pool', False),
+        'stat_keys': get_parse_keys(config, stat_keys, item_categories)
+    }
+    cache_before = get_stats_cache_info()
+    if network:
+        # derive策略的统计项需要各服务端依赖项的值，一并计算
+        policies = resolve_merge_policies(stat_keys, config.get('network', {}).get('merge_policy', {}))
+        with metrics.stage('parse'):
+            servers = scan_servers(
+                available,
+                list(policies),
+                workers=parse_options['workers'],
+                use_process_pool=parse_options['use_process_pool'],
+                parse_keys=parse_options['stat_keys']
+            )
+    else:
+        with metrics.stage('names'):
+            uuid_to_name = get_player_name_index(os.path.dirname(paths['usercache_path']))
+        if streaming:
+            # 排行榜由有界堆维护，不保留任何玩家的数据，也不更新游戏内查询使用的排行榜索引
+            stream_counters = {'files': 0, 'bytes': 0, 'errors': 0}
+            with metrics.stage('parse'):
+                rankings = create_rankings_streaming(
+                    paths['stats_dir'], uuid_to_name, ranking_keys, top_n, counters=stream_counters)
+        else:
+            with metrics.stage('parse'):
+                stats_data = parse_all_stats(paths['stats_dir'], uuid_to_name, **parse_options)
+    if streaming:
+        metrics.incr('stats_files_read', stream_counters['files'])
+        metrics.incr('stats_bytes_read', stream_counters['bytes'])
+        metrics.incr('stats_parse_errors', stream_counters['errors'])
+        print(f"Stats streamed: {stream_counters['files']} files, {stream_counters['bytes']} bytes read, "
+              f"{stream_counters['errors']} errors")
+    else:
+        # 用累计值之差统计本次解析，多个服务端的解析结果会一并计入
+        cache_after = get_stats_cache_info()
+        last_run = {key: cache_after[key] - cache_before[key] for key in cache_after['last_run']}
+        metrics.incr('stats_files_read', last_run['misses'])
+        metrics.incr('stats_bytes_read', last_run['bytes_read'])
+        metrics.incr('stats_parse_errors', last_run['errors'])
+        metrics.incr('stats_cache_hits', last_run['hits'])
+        print(f"Stats cache: {last_run['hits']} hits, {last_run['misses']} misses, "
+              f"{last_run['evictions']} evictions, {last_run['bytes_read']} bytes read, {last_run['errors']} errors")
+    
+    # 一次性计算所有排行榜；流式模式下排行榜已在读取时算出
+    with metrics.stage('rank'):
+        if network:
+            # 全网排行榜由各服务端的排序结果合并得到；只有derive的统计项需要合并整列
+            names = merge_names(servers)
+            rankings = {
+                stat_key: merge_ranking(servers, stat_key, top_n=top_n, policies=policies, names=names)
+                for stat_key in ranking_keys
+            }
+        elif not streaming:
+            matrix = build_stat_matrix(stats_data, stat_keys)
+            rankings = create_rankings(stats_data, ranking_keys, top_n=top_n, matrix=matrix)
+    
+    # 更新游戏内查询命令使用的排行榜索引；流式模式下没有每名玩家的数据，不更新索引
+    changes = {}
+    if not streaming:
+        with metrics.stage('index'):
+            if network:
+                stat_values = merge_values(servers, stat_keys, policies)
+            else:
+                stat_values = collect_stat_values(stats_data, stat_keys, matrix)
+                names = {uuid: data.name for uuid, data in stats_data.items()}
+            stat_names = dict(ranking_stats)
+            for window in history_windows:
+                stat_names.setdefault(window['stat'], window['stat'])
+            changes = get_ranking_index().update(stat_values, names, stat_names=stat_names, updated_at=time.time())
+    
+    # 更新按条目的倒排索引，只有文件发生变化的玩家需要重新比较
+    if item_categories:
+        with metrics.stage('items'):
+            item_changes = get_item_index().update(stats_data, item_categories, updated_at=time.time())
+        print(f"Item index: {item_changes} entries changed")
+    
+    # 保存索引快照，插件重载后可以立即恢复索引和解析缓存；
+    # 索引没有变化时，排行统计项或解析键在配置中修改过也要重新写入
+    snapshot_path = get_snapshot_path()
+    if performance_config.get('snapshot', True) and not streaming:
+        snapshot_args = {} if network else {'stats_dir': paths['stats_dir'], 'parse_keys': parse_options['stat_keys']}
+        if any(changes.values()) or not snapshot_is_current(snapshot_path, stat_keys, **snapshot_args):
+            with metrics.stage('snapshot'):
+                if network:
+                    write_snapshot(snapshot_path, get_ranking_index())
+                else:
+                    write_snapshot(snapshot_path, get_ranking_index(),
+                                   cache_entries=get_stats_cache_entries(paths['stats_dir']), **snapshot_args)
     
     # 提取所有榜一数据
     top_players = []
     for stat_key, stat_name in ranking_stats:
-        ranking = create_ranking(stats_data, stat_key)
+        ranking = rankings[stat_key]
         top_player = get_top_player(ranking)
         if top_player:
-            unit = get_stat_unit(stat_key)
-            value = top_player['value']
-            
-            # 特殊处理单位
-            if unit == '天':
-                # 游戏刻转换为天，再转换为分钟
-                days = value / 24000
-                display_value = format_time_days(days)
-            elif unit == '米':
-                # 厘米转换为米
-                display_value = f"{value / 100:.1f}米"
-            else:
-                display_value = f"{value}{unit}"
-            
             top_players.append({
                 'stat_name': stat_name,
                 'player_name': top_player['name'],
-                'value': display_value
+                'value': format_display_value(stat_key, top_player['value'])
             })
     
-    # 生成markdown内容
-    md_content = "本排行榜自动更新，展示服务器各项数据的第一名\n\n"
-    
-    for item in top_players:
-        md_content += f"## {item['stat_name']}\n"
-        md_content += f"- **{item['player_name']}** {item['value']}\n\n"
+    # 记录历史快照并提取时间窗口排行榜的第一名
+    if history_windows:
+        history = get_stats_history(get_history_db_path())
+        with metrics.stage('history'):
+            written = history.record_snapshot(stat_values)
+        print(f"History snapshot: {written} values changed")
+        
+        now = time.time()
+        for window in history_windows:
+            stat_key = window['stat']
+            ranking = history.window_ranking(stat_key, now - window.get('days', 1) * 86400, top_n=1)
+            top_player = get_top_player(ranking)
+            if top_player:
+                top_players.append({
+                    'stat_name': window.get('name', stat_key),
+                    'player_name': names.get(top_player['uuid'], top_player['uuid']),
+                    'value': format_display_value(stat_key, top_player['value'])
+                })
     
-    # 写入文件
-    md_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ranking.md')
-    with open(md_path, 'w', encoding='utf-8') as f:
-        f.write(md_content)
+    with metrics.stage('render'):
+        # 生成markdown内容
+        md_content = "本排行榜自动更新，展示服务器各项数据的第一名\n\n"
+        
+        for item in top_players:
+            md_content += f"## {item['stat_name']}\n"
+            md_content += f"- **{item['player_name']}** {item['value']}\n\n"
+        
+        # 写入文件
+        output_files = get_output_files(config)
+        md_path = os.path.join(get_output_dir(), 'ranking.md')
+        write_output_file(md_path, md_content)
+        
+        # 写入完整排行榜的JSON，不包含生成时间，内容不变时文件也不变
+        if output_config.get('json', False):
+            json_content = {
+                stat_key: {
+                    'name': stat_name,
+                    'ranking': [
+                        {'rank': i, 'uuid': player['uuid'], 'name': player['name'], 'value': player['value']}
+                        for i, player in enumerate(rankings[stat_key], 1)
+                    ]
+                }
+                for stat_key, stat_name in ranking_stats
+            }
+            write_output_file(
+                os.path.join(get_output_dir(), 'ranking.json'),
+                json.dumps(json_content, indent=2, ensure_ascii=False) + '\n'
+            )
+        
+        # 写入每项统计数据的单独页面
+        if output_config.get('stat_pages', False):
+            for stat_key, stat_name in ranking_stats:
+                page_path = os.path.join(get_output_dir(), 'rankings', get_stat_page_name(stat_key))
+                write_output_file(page_path, format_stat_page(stat_name, stat_key, rankings[stat_key]))
     
     print(f"Ranking.md generated successfully at: {md_path}")
-    print(f"Generated {len(top_players)} top rankings")
+    print(f"Generated {len(top_players)} top rankings, {len(output_files)} output files")
+    return output_files
 
 if __name__ == '__main__':
     generate_ranking_md()
@@ -1,7 +1,42 @@
 import os
+import sys
+import threading
 
-def get_player_data_paths():
-    """获取玩家数据文件路径"""
+# 处理相对导入问题
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+try:
+    from .config_service import load_config
+except ImportError:
+    # 当直接运行时使用绝对导入
+    from config_service import load_config
+
+# 缓存的路径信息，在on_load时解析一次，reload或路径失效时重新解析
+_cached_paths = None
+_cached_settings = None
+# network.servers中其他服务端的路径信息
+_cached_sources = None
+_cached_network_settings = None
+# 已经提示过格式错误的配置，同一次加载的配置只提示一次
+_warned_config = None
+_paths_lock = threading.Lock()
+
+def read_level_name(server_dir):
+    """从server.properties中读取存档名称，读取失败时返回world"""
+    properties_path = os.path.join(server_dir, 'server.properties')
+    try:
+        with open(properties_path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('level-name='):
+                    level_name = line[len('level-name='):].strip()
+                    if level_name:
+                        return level_name
+    except OSError:
+        pass
+    return 'world'
+
+def find_server_directory():
+    """在插件目录附近查找server文件夹"""
     # 获取当前脚本所在目录
     current_dir = os.path.dirname(os.path.abspath(__file__))
     
@@ -16,38 +51,136 @@ def get_player_data_paths():
     ]
     
     # 找到实际的server目录
-    server_dir = None
     for path in possible_paths:
         if os.path.exists(path) and os.path.isdir(path):
-            server_dir = path
-            break
+            return path
+    return None
+
+def resolve_player_data_paths(server_dir=None, level_name=None):
+    """解析玩家数据文件路径
+
+    server_dir为空时在插件目录附近查找server文件夹，
+    level_name为空时从server.properties读取。
+    """
+    # 获取当前脚本所在目录
+    current_dir = os.path.dirname(os.path.abspath(__file__))
     
     if server_dir:
+        server_dir = os.path.abspath(server_dir)
+        if not os.path.isdir(server_dir):
+            server_dir = None
+    else:
+        server_dir = find_server_directory()
+    
+    if server_dir:
+        if not level_name:
+            level_name = read_level_name(server_dir)
+        
         # 构建usercache.json的路径
         usercache_path = os.path.join(server_dir, 'usercache.json')
         
         # 构建stats文件夹的路径
-        stats_dir = os.path.join(server_dir, 'world', 'stats')
+        stats_dir = os.path.join(server_dir, level_name, 'stats')
         
         # 检查文件和目录是否存在
         usercache_exists = os.path.exists(usercache_path)
         stats_exists = os.path.exists(stats_dir)
     else:
         # 如果找不到server目录，使用默认路径
+        level_name = level_name or 'world'
         usercache_path = os.path.join(current_dir, 'server', 'usercache.json')
-        stats_dir = os.path.join(current_dir, 'server', 'world', 'stats')
+        stats_dir = os.path.join(current_dir, 'server', level_name, 'stats')
         usercache_exists = False
         stats_exists = False
     
     return {
         'current_dir': current_dir,
         'server_dir': server_dir,
+        'level_name': level_name,
         'usercache_path': usercache_path,
         'usercache_exists': usercache_exists,
         'stats_dir': stats_dir,
         'stats_exists': stats_exists
     }
 
+def _get_server_settings():
+    """读取配置中的server_dir和level_name"""
+    server_config = load_config().get('server', {})
+    return (server_config.get('server_dir', ''), server_config.get('level_name', ''))
+
+def _paths_still_valid(paths):
+    """检查缓存的路径是否仍然可用"""
+    if not paths['usercache_exists'] or not paths['stats_exists']:
+        # 上次没有找到完整的数据，需要重新查找
+        return False
+    return os.path.isdir(paths['stats_dir'])
+
+def get_player_data_paths(refresh=False):
+    """获取玩家数据文件路径
+
+    结果会被缓存；配置中的server_dir/level_name变化、缓存的stats目录消失，
+    或refresh为True时重新解析。
+    """
+    global _cached_paths, _cached_settings
+    settings = _get_server_settings()
+    
+    with _paths_lock:
+        if (not refresh and _cached_paths is not None and _cached_settings == settings
+                and _paths_still_valid(_cached_paths)):
+            return dict(_cached_paths)
+        
+        _cached_paths = resolve_player_data_paths(*settings)
+        _cached_settings = settings
+        return dict(_cached_paths)
+
+def _get_network_settings():
+    """读取配置中network.servers的 (名称, server_dir, level_name)，忽略格式错误的项"""
+    global _warned_config
+    config = load_config()
+    # 配置重新加载前load_config返回同一个对象，格式错误的项只提示一次
+    warn = config is not _warned_config
+    _warned_config = config
+    settings = []
+    for server in config.get('network', {}).get('servers', []):
+        if not isinstance(server, dict) or not isinstance(server.get('server_dir'), str) or not server['server_dir']:
+            if warn:
+                print(f"Ignoring invalid network server entry: {server}")
+            continue
+        settings.append((str(server.get('name', '')), server['server_dir'], str(server.get('level_name', ''))))
+    return tuple(settings)
+
+def get_server_sources(refresh=False):
+    """获取所有需要统计的服务端的路径信息列表
+
+    第一项为本服务端（与get_player_data_paths相同），之后为配置中network.servers
+    列出的其他服务端，每项额外包含用于显示的label。结果会被缓存，失效规则与
+    get_player_data_paths相同。
+    """
+    global _cached_sources, _cached_network_settings
+    paths = get_player_data_paths(refresh)
+    paths['label'] = os.path.basename(paths['server_dir'] or '') or 'server'
+    settings = _get_network_settings()
+    
+    with _paths_lock:
+        if (refresh or _cached_sources is None or _cached_network_settings != settings
+                or not all(_paths_still_valid(source) for source in _cached_sources)):
+            _cached_sources = []
+            for name, server_dir, level_name in settings:
+                source = resolve_player_data_paths(server_dir, level_name)
+                source['label'] = name or os.path.basename(os.path.normpath(server_dir))
+                _cached_sources.append(source)
+            _cached_network_settings = settings
+        return [paths] + [dict(source) for source in _cached_sources]
+
+def invalidate_player_data_paths():
+    """丢弃缓存的路径信息，下次获取时重新解析"""
+    global _cached_paths, _cached_settings, _cached_sources, _cached_network_settings
+    with _paths_lock:
+        _cached_paths = None
+        _cached_settings = None
+        _cached_sources = None
+        _cached_network_settings = None
+
 # 如果直接运行脚本
 if __name__ == '__main__':
     paths = get_player_data_paths()
@@ -55,6 +188,8 @@ if __name__ == '__main__':
     # 输出结果
     print('=== Player Data Paths ===')
     print(f'Current directory: {paths["current_dir"]}')
+    print(f'Server directory: {paths["server_dir"]}')
+    print(f'Level name: {paths["level_name"]}')
     print(f'Usercache.json path: {paths["usercache_path"]}')
     print(f'Usercache.json exists: {paths["usercache_exists"]}')
     print(f'Stats directory path: {paths["stats_dir"]}')
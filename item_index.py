@@ -0,0 +1,171 @@
+import os
+import sys
+import threading
+
+# 处理相对导入问题
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+try:
+    from .ranking_index import OrderStatistic, REBUILD_RATIO
+    from .compact_stats import CompactStats
+except ImportError:
+    # 当直接运行时使用绝对导入
+    from ranking_index import OrderStatistic, REBUILD_RATIO
+    from compact_stats import CompactStats
+
+# 默认建立倒排索引的分类：挖掘、使用和击杀
+DEFAULT_ITEM_CATEGORIES = ('minecraft:mined', 'minecraft:used', 'minecraft:killed')
+
+# 游戏内命令中可以使用的分类简称，其余分类可以省略minecraft:前缀
+CATEGORY_ALIASES = {
+    'mine': 'minecraft:mined',
+    'use': 'minecraft:used',
+    'kill': 'minecraft:killed',
+    'kills': 'minecraft:killed'
+}
+
+def _player_items(stats, categories):
+    """玩家在各分类中的条目 {(分类, 条目): 数值}，只保留大于0的值"""
+    items = {}
+    if stats is None:
+        return items
+    for category in categories:
+        if isinstance(stats, CompactStats):
+            entries = stats.items(category)
+        else:
+            entries = stats.get('stats', {}).get(category, {}).items()
+        for item, value in entries:
+            if value > 0:
+                items[(category, item)] = value
+    return items
+
+class ItemIndex:
+    """按条目的倒排索引：(分类, 条目) -> 按值降序排列的 (值, uuid) 倒排表
+
+    倒排表复用OrderStatistic，查询前N名为数组切片，名次为一次二分查找。
+    随每次解析增量更新：解析缓存命中的玩家得到的是同一个stats对象，
+    直接跳过；只有文件发生变化的玩家才会比较新旧条目并更新对应的倒排表。
+    """
+
+    def __init__(self, categories=DEFAULT_ITEM_CATEGORIES):
+        self._lock = threading.Lock()
+        self.categories = tuple(categories)
+        self._postings = {}
+        self._items_by_category = {}
+        self._sources = {}
+        self._names = {}
+        self.updated_at = None
+
+    def update(self, stats_data, categories=None, updated_at=None):
+        """用parse_all_stats的结果 {uuid: PlayerRecord} 同步索引，返回变化的 (玩家, 条目) 数
+
+        categories与上次不同时整体重建。
+        """
+        categories = tuple(categories) if categories is not None else self.categories
+        with self._lock:
+            if categories != self.categories:
+                self.categories = categories
+                self._postings = {}
+                self._items_by_category = {}
+                self._sources = {}
+            sources = self._sources
+
+            # 收集每个倒排表的变化，None表示移除该玩家
+            changes = {}
+            for uuid in [uuid for uuid in sources if uuid not in stats_data]:
+                for key in _player_items(sources.pop(uuid), categories):
+                    changes.setdefault(key, {})[uuid] = None
+            for uuid, record in stats_data.items():
+                old_stats = sources.get(uuid)
+                if record.stats is old_stats and uuid in sources:
+                    continue
+                old_items = _player_items(old_stats, categories)
+                new_items = _player_items(record.stats, categories)
+                for key in old_items:
+                    if key not in new_items:
+                        changes.setdefault(key, {})[uuid] = None
+                for key, value in new_items.items():
+                    if old_items.get(key) != value:
+                        changes.setdefault(key, {})[uuid] = value
+                sources[uuid] = record.stats
+
+            count = 0
+            for key, column in changes.items():
+                count += len(column)
+                posting = self._postings.get(key)
+                if posting is None:
+                    posting = self._postings[key] = OrderStatistic()
+                    self._items_by_category.setdefault(key[0], set()).add(key[1])
+                if len(column) > len(posting) * REBUILD_RATIO:
+                    values = dict(posting.values)
+                    values.update(column)
+                    posting.rebuild({uuid: value for uuid, value in values.items() if value is not None})
+                else:
+                    for uuid, value in column.items():
+                        if value is None:
+                            posting.remove(uuid)
+                        else:
+                            posting.set(uuid, value)
+                if not posting:
+                    del self._postings[key]
+                    self._items_by_category[key[0]].discard(key[1])
+
+            self._names = {uuid: record.name for uuid, record in stats_data.items()}
+            self.updated_at = updated_at
+        return count
+
+    def is_ready(self):
+        """索引是否已经生成"""
+        return self.updated_at is not None
+
+    def resolve_category(self, name):
+        """将命令中的分类名称（完整键名、去掉minecraft:前缀的名称或简称）解析为键名，未知时返回None"""
+        for category in (name, f'minecraft:{name}', CATEGORY_ALIASES.get(name.lower())):
+            if category in self.categories:
+                return category
+        return None
+
+    def resolve_item(self, category, name):
+        """将条目名称（完整键名或去掉minecraft:前缀的名称）解析为键名，没有数据时返回None"""
+        items = self._items_by_category.get(category, ())
+        for item in (name, f'minecraft:{name}'):
+            if item in items:
+                return item
+        return None
+
+    def items(self, category):
+        """分类中有数据的条目，按名称排序"""
+        with self._lock:
+            return sorted(self._items_by_category.get(category, ()))
+
+    def top(self, category, item, n=10):
+        """获取条目排行榜的前n名，返回 [{'uuid', 'name', 'value'}]"""
+        with self._lock:
+            posting = self._postings.get((category, item))
+            entries = posting.top(n) if posting is not None else []
+        names = self._names
+        return [{'uuid': uuid, 'name': names.get(uuid, uuid), 'value': value} for uuid, value in entries]
+
+    def rank(self, uuid, category, item):
+        """获取玩家在条目排行榜中的名次，返回 {'rank', 'value', 'total', 'percentile'}，没有数据时返回None"""
+        with self._lock:
+            posting = self._postings.get((category, item))
+            if posting is None or uuid not in posting:
+                return None
+            return {
+                'rank': posting.rank(uuid),
+                'value': posting.values[uuid],
+                'total': len(posting),
+                'percentile': posting.percentile(uuid)
+            }
+
+    def stats(self):
+        """索引规模：条目数和 (玩家, 条目) 数"""
+        with self._lock:
+            return {'items': len(self._postings), 'entries': sum(len(posting) for posting in self._postings.values())}
+
+# 插件内共享的条目索引
+_item_index = ItemIndex()
+
+def get_item_index():
+    """获取共享的条目索引"""
+    return _item_index
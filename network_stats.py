@@ -0,0 +1,211 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# 处理相对导入问题
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+try:
+    from .parse_player_data import get_player_name_index, parse_all_stats
+    from .create_player_rankings import compute_stat_columns
+    from .ranking_engine import RankingAccumulator
+    from .derived_metrics import get_metric_plan
+except ImportError:
+    # 当直接运行时使用绝对导入
+    from parse_player_data import get_player_name_index, parse_all_stats
+    from create_player_rankings import compute_stat_columns
+    from ranking_engine import RankingAccumulator
+    from derived_metrics import get_metric_plan
+
+# 多个服务端的数据按uuid合并时可用的策略
+MERGE_POLICIES = {
+    'sum': sum,
+    'max': max
+}
+# 派生统计项的合并策略：先合并其依赖项，再用合并后的值重新计算
+DERIVE_POLICY = 'derive'
+
+def resolve_merge_policies(stat_keys, merge_policy):
+    """确定每项统计数据的合并方式，返回 {stat_key: 'sum'、'max' 或 'derive'}
+
+    merge_policy为配置中的network.merge_policy；未配置的统计项按sum合并。
+    比值不能在服务端之间相加或取最大值（全网击杀死亡比不是各服务端比值的最大值），
+    比值类派生统计项以及依赖它们的派生统计项默认为derive：先按各自的策略合并
+    分子和分母，再重新计算。derive的依赖项也会出现在结果中，扫描服务端时需要一并计算。
+    """
+    plan = get_metric_plan()
+    resolved = {}
+
+    def resolve(stat_key):
+        if stat_key in resolved:
+            return resolved[stat_key]
+        dependencies = plan.dependencies(stat_key)
+        dependency_policies = [resolve(dependency) for dependency in dependencies]
+        policy = merge_policy.get(stat_key)
+        valid = policy in MERGE_POLICIES or (policy == DERIVE_POLICY and dependencies)
+        if not valid:
+            if policy is not None:
+                print(f"Unknown merge policy {policy!r} for {stat_key}, using default")
+            step = plan.steps.get(stat_key)
+            derive = step is not None and (step[0] == 'ratio' or DERIVE_POLICY in dependency_policies)
+            policy = DERIVE_POLICY if derive else 'sum'
+        resolved[stat_key] = policy
+        return policy
+
+    policies = {}
+    pending = list(stat_keys)
+    while pending:
+        stat_key = pending.pop()
+        if stat_key in policies:
+            continue
+        policies[stat_key] = resolve(stat_key)
+        if policies[stat_key] == DERIVE_POLICY:
+            pending.extend(plan.dependencies(stat_key))
+    # 保持stat_keys的顺序在前
+    return {stat_key: policies[stat_key] for stat_key in list(stat_keys) + sorted(set(policies) - set(stat_keys))}
+
+class ServerStats:
+    """单个服务端的统计数据
+
+    每项统计数据保存 {uuid: 数值} 用于按uuid随机访问，以及按值降序排列的
+    [(数值, uuid)] 用于顺序访问；只保留需要排行的统计项，不保存原始stats。
+    """
+
+    def __init__(self, paths, names, uuids, columns):
+        self.paths = paths
+        self.names = names
+        self.values = {}
+        self.sorted = {}
+        for stat_key, column in columns.items():
+            values = dict(zip(uuids, column))
+            self.values[stat_key] = values
+            self.sorted[stat_key] = sorted(((value, uuid) for uuid, value in values.items() if value > 0),
+                                           key=lambda item: (-item[0], item[1]))
+
+    @property
+    def label(self):
+        return self.paths.get('label') or self.paths['server_dir']
+
+def scan_server(paths, stat_keys, workers=1, use_process_pool=False, parse_keys=None):
+    """解析单个服务端的stats目录，返回ServerStats"""
+    uuid_to_name = get_player_name_index(os.path.dirname(paths['usercache_path']))
+    stats_data = parse_all_stats(
+        paths['stats_dir'],
+        uuid_to_name,
+        workers=workers,
+        use_process_pool=use_process_pool,
+        stat_keys=parse_keys
+    )
+    uuids, columns = compute_stat_columns(stats_data, stat_keys)
+    names = {uuid: stats_data[uuid].name for uuid in uuids}
+    return ServerStats(paths, names, uuids, columns)
+
+def scan_servers(paths_list, stat_keys, workers=1, use_process_pool=False, parse_keys=None):
+    """并发解析多个服务端，返回与paths_list顺序一致的ServerStats列表
+
+    缺少usercache.json或stats目录的服务端会被跳过。
+    """
+    available = [paths for paths in paths_list if paths['usercache_exists'] and paths['stats_exists']]
+    if not available:
+        return []
+    with ThreadPoolExecutor(max_workers=len(available)) as executor:
+        futures = [
+            executor.submit(scan_server, paths, stat_keys, workers, use_process_pool, parse_keys)
+            for paths in available
+        ]
+        return [future.result() for future in futures]
+
+def merge_names(servers):
+    """合并玩家名称，同一uuid以排在前面的服务端为准"""
+    names = {}
+    for server in reversed(servers):
+        names.update(server.names)
+    return names
+
+def merge_top_n(servers, stat_key, top_n=10, policy='sum', names=None):
+    """用阈值算法（Fagin's TA）从各服务端的排序结果中合并出全网前top_n名
+
+    轮流从每个服务端的降序列表中顺序读取一名玩家，首次读到的玩家按uuid在所有服务端
+    随机访问其数值并按policy合并；每轮结束后用各列表当前位置的数值按policy计算
+    尚未读到的玩家可能达到的上界，前top_n名都严格高于上界时即可停止，
+    通常只需要读取每个列表的前面一小部分。排序规则与create_ranking一致。
+    """
+    combine = MERGE_POLICIES[policy]
+    lists = [server.sorted.get(stat_key, []) for server in servers]
+    lookups = [server.values.get(stat_key, {}) for server in servers]
+    names = names if names is not None else merge_names(servers)
+
+    accumulator = RankingAccumulator([stat_key], top_n)
+    heap = accumulator.heaps[stat_key]
+    seen = set()
+    position = 0
+    while True:
+        frontier = []
+        for sorted_list in lists:
+            if position >= len(sorted_list):
+                # 读完的列表对上界没有贡献
+                frontier.append(0)
+                continue
+            value, uuid = sorted_list[position]
+            frontier.append(value)
+            if uuid in seen:
+                continue
+            seen.add(uuid)
+            total = combine(lookup.get(uuid, 0) for lookup in lookups)
+            if total > 0:
+                accumulator.push(stat_key, total, uuid, names.get(uuid, uuid))
+        position += 1
+
+        threshold = combine(frontier)
+        if threshold <= 0:
+            break
+        if len(heap) >= top_n and heap[0][0] > threshold:
+            break
+    return accumulator.ranking(stat_key)
+
+def merge_column(servers, stat_key, policies):
+    """按uuid合并所有服务端的单项统计数据，返回 {uuid: 数值}
+
+    derive策略的统计项由合并后的依赖项重新计算。
+    """
+    policy = policies[stat_key]
+    if policy == DERIVE_POLICY:
+        plan = get_metric_plan()
+        dependencies = plan.dependencies(stat_key)
+        merged = [merge_column(servers, dependency, policies) for dependency in dependencies]
+        uuids = sorted(set().union(*merged))
+        columns = {
+            dependency: [column.get(uuid, 0) for uuid in uuids]
+            for dependency, column in zip(dependencies, merged)
+        }
+        return dict(zip(uuids, plan.recompute(stat_key, columns)))
+    combine = MERGE_POLICIES[policy]
+    lookups = [server.values.get(stat_key, {}) for server in servers]
+    return {uuid: combine(lookup.get(uuid, 0) for lookup in lookups) for uuid in set().union(*lookups)}
+
+def merge_ranking(servers, stat_key, top_n=10, policies=None, names=None):
+    """合并出单项统计数据的全网前top_n名
+
+    sum和max是单调的合并方式，用merge_top_n只读取各服务端排序结果的前面一部分；
+    derive的结果与各服务端的值没有单调关系，阈值算法不适用，需要合并整列后再取前top_n名。
+    """
+    policy = (policies or {}).get(stat_key, 'sum')
+    names = names if names is not None else merge_names(servers)
+    if policy != DERIVE_POLICY:
+        return merge_top_n(servers, stat_key, top_n, policy, names)
+    accumulator = RankingAccumulator([stat_key], top_n)
+    for uuid, value in merge_column(servers, stat_key, policies).items():
+        accumulator.add(uuid, names.get(uuid, uuid), {stat_key: value})
+    return accumulator.ranking(stat_key)
+
+def merge_values(servers, stat_keys, policies):
+    """按uuid合并所有服务端的统计数据，返回 {uuid: {stat_key: 数值}}
+
+    policies为resolve_merge_policies的结果。结果包含出现在任一服务端的所有玩家，
+    只用于更新游戏内查询使用的排行榜索引和历史快照，它们本来就要保存每名玩家的值；
+    全网排行榜本身不需要这一步。
+    """
+    merged = {}
+    for stat_key in stat_keys:
+        for uuid, value in merge_column(servers, stat_key, policies).items():
+            merged.setdefault(uuid, {})[stat_key] = value
+    return merged
@@ -1,14 +1,22 @@
+import io
 import os
+import re
 import sys
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 # 处理相对导入问题
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 try:
     from .get_player_data_paths import get_player_data_paths
+    from .derived_metrics import compile_item_pattern, is_item_category_key
+    from .compact_stats import PlayerRecord, compact_stats
 except ImportError:
     # 当直接运行时使用绝对导入
     from get_player_data_paths import get_player_data_paths
+    from derived_metrics import compile_item_pattern, is_item_category_key
+    from compact_stats import PlayerRecord, compact_stats
 
 def parse_usercache(usercache_path):
     """解析usercache.json文件，返回uuid到玩家名称的映射"""
@@ -29,9 +37,352 @@ def parse_usercache(usercache_path):
         print(f"Error parsing usercache.json: {e}")
         return {}
 
-def parse_stats_file(stats_file_path):
-    """解析单个stats JSON文件"""
+# 流式扫描时每次读取的字节数
+SCAN_CHUNK_SIZE = 1 << 16
+# 跨越两次读取的未完成记号最多保留的字节数，超过时视为格式不符合预期
+_MAX_PENDING = 1 << 12
+
+_WHITESPACE_PATTERN = re.compile(rb'\s*')
+# JSON记号：标点、不含转义的字符串、数字和字面量；含转义的字符串按格式不符合预期处理
+_TOKEN_PATTERN = re.compile(rb'([{}\[\]:,])|"([^"\\]*)"|(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)|(true|false|null)')
+# 分类中连续的 "键": 整数, 条目，整段交给findall处理
+_ENTRY_RUN_PATTERN = re.compile(rb'(?:\s*"[^"\\]+"\s*:\s*-?\d+\s*,)+')
+_ENTRY_PATTERN = re.compile(rb'"([^"\\]+)"\s*:\s*(-?\d+)')
+_INTEGER_PATTERN = re.compile(rb'-?\d+')
+
+# 扫描状态：对象中等待键或结束、等待键、等待冒号、等待值、等待逗号或结束；数组中等待值或结束
+_KEY_OR_END, _KEY, _COLON, _VALUE, _NEXT, _VALUE_OR_END = range(6)
+
+class _ScanError(ValueError):
+    """stats文件的格式不符合预期"""
+
+class _StatsScanner:
+    """逐块扫描stats文件，只为需要的统计项构建字典
+
+    按JSON语法检查每个记号，只有完整扫描到顶层对象的结尾才算成功，
+    被截断或格式不符合预期的文件不会得到部分结果。
+    同时驻留内存的只有当前读取的一块和跨块的未完成记号。
+    """
+
+    def __init__(self, stat_keys):
+        self.wanted_keys = set()
+        self.wanted_totals = {}
+        self.wanted_categories = set()
+        for stat_key in stat_keys:
+            if is_item_category_key(stat_key):
+                self.wanted_categories.add(stat_key[0].encode('utf-8'))
+            elif isinstance(stat_key, tuple):
+                category, patterns = stat_key
+                pattern = compile_item_pattern(patterns, as_bytes=True)
+                self.wanted_totals.setdefault(category.encode('utf-8'), []).append((stat_key, pattern))
+            else:
+                self.wanted_keys.add(stat_key.encode('utf-8'))
+
+        # 每层为 [是否为对象, 状态, 当前键]
+        self.stack = []
+        self.done = False
+        self.stats_seen = False
+        self.stats = {}
+        self.custom = {}
+        self.totals = {}
+        # 正在扫描的分类，以及该分类的条目需要写入的位置
+        self.category = None
+        self.category_custom = False
+        self.category_entries = None
+        self.category_terms = ()
+
+    def scan(self, f):
+        """从二进制文件对象中逐块读取并扫描，格式不符合预期时返回None"""
+        pending = b''
+        try:
+            while True:
+                chunk = f.read(SCAN_CHUNK_SIZE)
+                pending = self._feed(pending + chunk, not chunk)
+                if not chunk:
+                    break
+        except _ScanError:
+            return None
+        if not self.done or not self.stats_seen:
+            return None
+        self.stats['minecraft:custom'] = self.custom
+        return {
+            'stats': self.stats,
+            'totals': self.totals
+        }
+
+    def _feed(self, buf, final):
+        """扫描一块内容，返回需要与下一块拼接的未完成部分"""
+        pos = 0
+        end = len(buf)
+        while True:
+            pos = _WHITESPACE_PATTERN.match(buf, pos).end()
+            if pos == end:
+                return b''
+            if self.done:
+                raise _ScanError('顶层对象之后还有内容')
+
+            if self.category is not None and len(self.stack) == 3 and self.stack[-1][1] in (_KEY_OR_END, _KEY):
+                run = _ENTRY_RUN_PATTERN.match(buf, pos)
+                if run is not None:
+                    self._record_run(buf, pos, run.end())
+                    pos = run.end()
+                    self.stack[-1][1] = _KEY
+                    continue
+
+            match = _TOKEN_PATTERN.match(buf, pos)
+            if match is None or (match.end() == end and not final):
+                if final or end - pos > _MAX_PENDING:
+                    raise _ScanError('无法识别的内容')
+                return buf[pos:]
+            pos = match.end()
+            self._token(*match.groups())
+
+    def _token(self, punct, string, number, literal):
+        if not self.stack:
+            if punct != b'{':
+                raise _ScanError('顶层不是对象')
+            self._push(True)
+            return
+
+        top = self.stack[-1]
+        state = top[1]
+        if top[0]:
+            if state in (_KEY_OR_END, _KEY):
+                if string is not None:
+                    top[2] = string
+                    top[1] = _COLON
+                elif punct == b'}' and state == _KEY_OR_END:
+                    self._pop()
+                else:
+                    raise _ScanError('缺少键')
+            elif state == _COLON:
+                if punct != b':':
+                    raise _ScanError('缺少冒号')
+                top[1] = _VALUE
+            elif state == _VALUE:
+                self._value(punct, string, number, literal)
+            elif punct == b',':
+                top[1] = _KEY
+            elif punct == b'}':
+                self._pop()
+            else:
+                raise _ScanError('缺少逗号')
+        elif state == _VALUE_OR_END and punct == b']':
+            self._pop()
+        elif state in (_VALUE_OR_END, _VALUE):
+            self._value(punct, string, number, literal)
+        elif punct == b',':
+            top[1] = _VALUE
+        elif punct == b']':
+            self._pop()
+        else:
+            raise _ScanError('缺少逗号')
+
+    def _value(self, punct, string, number, literal):
+        if punct == b'{' or punct == b'[':
+            self._push(punct == b'{')
+            return
+        if punct is not None:
+            raise _ScanError('缺少值')
+        if self.category is not None and len(self.stack) == 3:
+            # 分类中的条目必须是整数
+            if number is None or not _INTEGER_PATTERN.fullmatch(number):
+                raise _ScanError('条目不是整数')
+            self._record(self.stack[-1][2], int(number))
+        self.stack[-1][1] = _NEXT
+
+    def _push(self, is_object):
+        depth = len(self.stack)
+        if depth == 1 and self.stack[0][2] == b'stats':
+            if not is_object:
+                raise _ScanError('stats不是对象')
+            self.stats_seen = True
+        elif depth == 2 and self.stack[0][2] == b'stats':
+            if not is_object:
+                raise _ScanError('分类不是对象')
+            self._open_category(self.stack[1][2])
+        elif self.category is not None:
+            raise _ScanError('分类中的条目不是整数')
+        self.stack.append([is_object, _KEY_OR_END if is_object else _VALUE_OR_END, None])
+
+    def _pop(self):
+        self.stack.pop()
+        if self.category is not None and len(self.stack) == 2:
+            self.category = None
+        if self.stack:
+            self.stack[-1][1] = _NEXT
+        else:
+            self.done = True
+
+    def _open_category(self, category):
+        self.category = category
+        self.category_custom = category == b'minecraft:custom'
+        self.category_entries = None
+        self.category_terms = ()
+        # minecraft:custom只提取需要的键，其余分类按需保留条目或累加总和
+        if self.category_custom:
+            return
+        if category in self.wanted_categories:
+            self.category_entries = self.stats[category.decode('utf-8')] = {}
+        self.category_terms = self.wanted_totals.get(category, ())
+        for term, _ in self.category_terms:
+            self.totals[term] = 0
+
+    def _record_run(self, buf, start, end):
+        """记录当前分类中buf[start:end]范围内的一段完整条目"""
+        if self.category_custom:
+            for key, value in _ENTRY_PATTERN.findall(buf, start, end):
+                if key in self.wanted_keys:
+                    self.custom[key.decode('utf-8')] = int(value)
+            return
+        if self.category_entries is None and not self.category_terms:
+            return
+        entries = _ENTRY_PATTERN.findall(buf, start, end)
+        if self.category_entries is not None:
+            self.category_entries.update((key.decode('utf-8'), int(value)) for key, value in entries)
+        for term, pattern in self.category_terms:
+            if pattern is None:
+                self.totals[term] += sum(int(value) for _, value in entries)
+            else:
+                self.totals[term] += sum(int(value) for key, value in entries if pattern.match(key))
+
+    def _record(self, key, value):
+        """记录当前分类中的一个条目"""
+        if self.category_custom:
+            if key in self.wanted_keys:
+                self.custom[key.decode('utf-8')] = value
+            return
+        if self.category_entries is not None:
+            self.category_entries[key.decode('utf-8')] = value
+        for term, pattern in self.category_terms:
+            if pattern is None or pattern.match(key):
+                self.totals[term] += value
+
+def scan_selected_stats(f, stat_keys):
+    """从以二进制模式打开的stats文件中逐块扫描，只提取需要的统计项
+
+    stat_keys中的字符串为minecraft:custom中要保留的键；(分类, 通配符元组或None)
+    形式的分类求和输入项（见derived_metrics.category_term）只在扫描时累加
+    （匹配的）条目之和，不会为其构建字典；derived_metrics.item_category_key形式的键
+    保留该分类的所有条目；其余分类只检查语法后跳过。
+    返回 {'stats': {'minecraft:custom': {...}, 保留的分类: {...}}, 'totals': {输入项: 总和}}，
+    文件被截断或格式不符合预期时返回None。
+    """
+    return _StatsScanner(stat_keys).scan(f)
+
+def extract_selected_stats(raw, stat_keys):
+    """从stats文件的原始内容中只提取需要的统计项，见scan_selected_stats"""
+    return scan_selected_stats(io.BytesIO(raw), stat_keys)
+
+# 可以提供玩家名称的服务端文件，按优先级排列
+NAME_SOURCE_FILES = ('usercache.json', 'whitelist.json', 'ops.json', 'banned-players.json')
+
+class PlayerNameIndex:
+    """uuid与玩家名称的双向索引
+
+    合并usercache.json、whitelist.json、ops.json和banned-players.json中的名称，
+    同一uuid以优先级较高的文件为准。每个文件按 (mtime_ns, size) 缓存解析结果，
+    refresh时只重新读取发生变化的文件；名称到uuid的反查不区分大小写。
+    可以直接作为parse_all_stats的uuid_to_name参数使用。
+    """
+
+    def __init__(self, server_dir, source_files=NAME_SOURCE_FILES):
+        self.server_dir = server_dir
+        self.source_files = tuple(source_files)
+        self._source_keys = {}
+        self._source_entries = {}
+        self._uuid_to_name = {}
+        self._name_to_uuid = {}
+        self._lock = threading.Lock()
+
+    def _load_source(self, filename):
+        """解析单个名称文件，返回 {uuid: name}"""
+        path = os.path.join(self.server_dir, filename)
+        if filename == 'usercache.json':
+            return parse_usercache(path)
+        
+        entries = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for entry in data:
+                uuid = entry.get('uuid', '')
+                name = entry.get('name', '')
+                if uuid and name:
+                    entries[uuid] = name
+        except Exception as e:
+            print(f"Error parsing {filename}: {e}")
+        return entries
+
+    def refresh(self):
+        """重新读取发生变化的名称文件，返回索引是否发生变化"""
+        with self._lock:
+            changed = False
+            for filename in self.source_files:
+                try:
+                    st = os.stat(os.path.join(self.server_dir, filename))
+                    key = (st.st_mtime_ns, st.st_size)
+                except OSError:
+                    key = None
+                
+                if key == self._source_keys.get(filename, False):
+                    continue
+                self._source_keys[filename] = key
+                self._source_entries[filename] = self._load_source(filename) if key is not None else {}
+                changed = True
+            
+            if changed:
+                # 从低优先级到高优先级合并，高优先级覆盖低优先级
+                uuid_to_name = {}
+                for filename in reversed(self.source_files):
+                    uuid_to_name.update(self._source_entries.get(filename, {}))
+                self._uuid_to_name = uuid_to_name
+                self._name_to_uuid = {name.lower(): uuid for uuid, name in uuid_to_name.items()}
+            return changed
+
+    def get(self, uuid, default=None):
+        """获取uuid对应的玩家名称"""
+        return self._uuid_to_name.get(uuid, default)
+
+    def uuid_of(self, name):
+        """获取玩家名称对应的uuid，不区分大小写"""
+        return self._name_to_uuid.get(name.lower())
+
+    def items(self):
+        return self._uuid_to_name.items()
+
+    def __contains__(self, uuid):
+        return uuid in self._uuid_to_name
+
+    def __len__(self):
+        return len(self._uuid_to_name)
+
+# 每个服务端目录一个名称索引，在多次更新之间复用
+_name_indexes = {}
+
+def get_player_name_index(server_dir):
+    """获取server_dir对应的PlayerNameIndex，并重新读取发生变化的名称文件"""
+    index = _name_indexes.get(server_dir)
+    if index is None:
+        index = _name_indexes.setdefault(server_dir, PlayerNameIndex(server_dir))
+    index.refresh()
+    return index
+
+def parse_stats_file(stats_file_path, stat_keys=None):
+    """解析单个stats JSON文件
+
+    传入stat_keys时逐块扫描文件，只提取排行需要的统计项，见scan_selected_stats。
+    """
     try:
+        if stat_keys is not None:
+            with open(stats_file_path, 'rb') as f:
+                data = scan_selected_stats(f, stat_keys)
+                if data is None:
+                    # 扫描没有完整结束时完整解码，被截断的文件会在这里报错
+                    f.seek(0)
+                    data = json.loads(f.read().decode('utf-8'))
+            return data
+        
         with open(stats_file_path, 'r', encoding='utf-8') as f:
             data = json.load(f)
         return data
@@ -39,27 +390,189 @@ def parse_stats_file(stats_file_path):
         print(f"Error parsing {os.path.basename(stats_file_path)}: {e}")
         return {}
 
-def parse_all_stats(stats_dir, uuid_to_name):
-    """解析stats文件夹中的所有文件"""
+def _read_stats_bytes(stats_file_path):
+    """读取单个stats文件的原始内容，读取失败时返回None"""
+    try:
+        with open(stats_file_path, 'rb') as f:
+            return f.read()
+    except Exception as e:
+        print(f"Error reading {os.path.basename(stats_file_path)}: {e}")
+        return None
+
+def decode_stats_bytes(raw, stat_keys=None, source=''):
+    """解码stats文件的原始内容，传入stat_keys时只提取这些统计项；失败时返回空字典"""
+    if raw is None:
+        return {}
+    try:
+        if stat_keys is not None:
+            data = extract_selected_stats(raw, stat_keys)
+            if data is not None:
+                return data
+        return json.loads(raw.decode('utf-8'))
+    except Exception as e:
+        print(f"Error parsing {source}: {e}")
+        return {}
+
+def _decode_stats_bytes(item):
+    """解码stats文件内容，item为 (文件路径, 原始内容, stat_keys)"""
+    stats_file_path, raw, stat_keys = item
+    return decode_stats_bytes(raw, stat_keys, os.path.basename(stats_file_path))
+
+# 进程池解码时每批读取的文件数，同时驻留内存的原始内容不超过一批
+PARSE_CHUNK_SIZE = 256
+
+def parse_stats_files(file_paths, workers=1, use_process_pool=False, stat_keys=None):
+    """批量解析stats文件，返回与file_paths顺序一致的结果列表
+
+    workers大于1时使用线程池，每个任务读取一个文件后立即解码，只保留解码结果；
+    use_process_pool为True时，JSON解码交给进程池完成，文件按PARSE_CHUNK_SIZE分批
+    读取后送入进程池，进程池不可用时退回到线程池。
+    """
+    if stat_keys is not None:
+        stat_keys = tuple(stat_keys)
+    
+    if workers <= 1 or len(file_paths) <= 1:
+        return [parse_stats_file(path, stat_keys) for path in file_paths]
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        if use_process_pool:
+            try:
+                return _parse_stats_files_in_processes(file_paths, workers, stat_keys, executor)
+            except Exception as e:
+                print(f"Process pool unavailable, decoding in threads: {e}")
+        
+        return list(executor.map(lambda path: parse_stats_file(path, stat_keys), file_paths))
+
+def _parse_stats_files_in_processes(file_paths, workers, stat_keys, executor):
+    """在线程池中分批读取文件，在进程池中解码"""
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as process_executor:
+        for start in range(0, len(file_paths), PARSE_CHUNK_SIZE):
+            chunk = file_paths[start:start + PARSE_CHUNK_SIZE]
+            items = [(path, raw, stat_keys) for path, raw in zip(chunk, executor.map(_read_stats_bytes, chunk))]
+            chunksize = max(1, len(items) // (workers * 4))
+            results.extend(process_executor.map(_decode_stats_bytes, items, chunksize=chunksize))
+    return results
+
+# 增量解析缓存：{stats_dir: {uuid: (文件标识, stats)}}
+# 文件标识为 (inode, mtime_ns, size, 提取的统计项, 是否紧凑存储)，只有标识变化的文件才会被重新读取
+_stats_cache = {}
+# 累计命中统计，以及最近一次 parse_all_stats 的命中统计；
+# misses即重新读取的文件数，bytes_read为这些文件的大小之和，errors为读取或解析失败的文件数
+_stats_cache_counters = {
+    'hits': 0,
+    'misses': 0,
+    'evictions': 0,
+    'bytes_read': 0,
+    'errors': 0
+}
+_stats_cache_last_run = dict(_stats_cache_counters)
+# 多个服务端的stats目录可能被同时解析
+_stats_cache_lock = threading.Lock()
+
+def get_stats_cache_entries(stats_dir):
+    """获取stats_dir的解析缓存 {uuid: (文件标识, stats)} 的副本"""
+    return dict(_stats_cache.get(stats_dir, {}))
+
+def seed_stats_cache(stats_dir, entries):
+    """用 {uuid: (文件标识, stats)} 预先填充解析缓存，已有的缓存项不会被覆盖
+
+    用于从快照恢复：之后的parse_all_stats只会重新读取标识发生变化的文件。
+    """
+    cache = _stats_cache.setdefault(stats_dir, {})
+    for uuid, entry in entries.items():
+        cache.setdefault(uuid, entry)
+
+def get_stats_cache_info():
+    """获取解析缓存的命中统计"""
+    info = dict(_stats_cache_counters)
+    info['entries'] = sum(len(entries) for entries in _stats_cache.values())
+    info['last_run'] = dict(_stats_cache_last_run)
+    return info
+
+def clear_stats_cache():
+    """清空解析缓存和命中统计"""
+    _stats_cache.clear()
+    for key in _stats_cache_counters:
+        _stats_cache_counters[key] = 0
+        _stats_cache_last_run[key] = 0
+
+def _record_cache_run(hits, misses, evictions, bytes_read=0, errors=0):
+    """记录一次解析的命中统计"""
+    with _stats_cache_lock:
+        _stats_cache_last_run.update(hits=hits, misses=misses, evictions=evictions, bytes_read=bytes_read, errors=errors)
+        for key, value in _stats_cache_last_run.items():
+            _stats_cache_counters[key] += value
+
+def parse_all_stats(stats_dir, uuid_to_name, use_cache=True, workers=1, use_process_pool=False,
+                    stat_keys=None, compact=True):
+    """解析stats文件夹中的所有文件，返回 {uuid: PlayerRecord}
+
+    启用缓存时，只有 (inode, mtime_ns, size) 发生变化的文件才会被重新解析，
+    已删除文件对应的uuid会从缓存中移除。
+    workers和use_process_pool用于并行解析需要重新读取的文件，见parse_stats_files。
+    传入stat_keys时每个文件只提取这些统计项，见scan_selected_stats。
+    compact为True时每名玩家的统计数据转换为CompactStats，缓存在两次更新之间常驻内存，
+    紧凑存储比嵌套字典小得多；为False时保留解析得到的字典。
+    """
     if not os.path.exists(stats_dir):
+        _stats_cache.pop(stats_dir, None)
         return {}
     
+    cache = _stats_cache.setdefault(stats_dir, {}) if use_cache else {}
+    # 提取的统计项不同时缓存内容也不同，需要一并作为缓存键
+    selection = frozenset(stat_keys) if stat_keys is not None else None
+    
     stats_data = {}
-    for filename in os.listdir(stats_dir):
-        if filename.endswith('.json'):
+    hits = evictions = 0
+    pending = []
+    with os.scandir(stats_dir) as entries:
+        for entry in entries:
+            filename = entry.name
+            if not filename.endswith('.json'):
+                continue
+            
             # 从文件名提取uuid（去掉.json后缀）
             uuid = filename[:-5]  # 去掉.json后缀
             player_name = uuid_to_name.get(uuid, f"Unknown ({uuid[:8]}...)")
             
-            file_path = os.path.join(stats_dir, filename)
-            stats = parse_stats_file(file_path)
+            try:
+                st = entry.stat()
+                file_key = (st.st_ino, st.st_mtime_ns, st.st_size, selection, compact)
+            except OSError:
+                # 文件在列目录之后被删除
+                continue
             
-            stats_data[uuid] = {
-                'name': player_name,
-                'filename': filename,
-                'stats': stats
-            }
+            stats_data[uuid] = PlayerRecord(player_name, filename)
+            
+            cached = cache.get(uuid)
+            if cached is not None and cached[0] == file_key:
+                stats_data[uuid].stats = cached[1]
+                hits += 1
+            else:
+                pending.append((uuid, entry.path, file_key))
+    
+    # 重新解析发生变化的文件
+    results = parse_stats_files([path for _, path, _ in pending], workers, use_process_pool, stat_keys)
+    bytes_read = errors = 0
+    for (uuid, _, file_key), stats in zip(pending, results):
+        bytes_read += file_key[2]
+        if not stats:
+            # 读取或解析失败时结果为空字典
+            errors += 1
+        if compact:
+            stats = compact_stats(stats)
+        stats_data[uuid].stats = stats
+        if use_cache:
+            cache[uuid] = (file_key, stats)
+    
+    # 移除已删除文件对应的缓存
+    if use_cache:
+        for uuid in [uuid for uuid in cache if uuid not in stats_data]:
+            del cache[uuid]
+            evictions += 1
     
+    _record_cache_run(hits, len(pending), evictions, bytes_read, errors)
     return stats_data
 
 def get_stat_description(stat_key):
@@ -169,15 +682,15 @@ def display_player_data():
             print()
             
             for uuid, data in stats_data.items():
-                print(f"   玩家: {data['name']}")
+                print(f"   玩家: {data.name}")
                 print(f"   UUID: {uuid}")
-                print(f"   统计数据文件: {data['filename']}")   
+                print(f"   统计数据文件: {data.filename}")   
                 print()
                 
                 # 详细显示所有统计数据
                 print("   Detailed Stats:")
-                if data['stats']:
-                    display_stats_recursive(data['stats'])
+                if data.stats:
+                    display_stats_recursive(data.stats.to_dict())
                 else:
                     print("   No stats available")
                 print()
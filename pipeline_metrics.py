@@ -0,0 +1,141 @@
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# 每个阶段保留最近多少次耗时用于计算分位数
+DEFAULT_WINDOW = 128
+
+# 导出的分位数及其在snapshot中的键名
+QUANTILES = ((0.5, 'p50'), (0.95, 'p95'))
+
+# 更新流程各阶段的先后顺序，用于显示
+STAGE_ORDER = ('cycle', 'paths', 'names', 'parse', 'rank', 'index', 'items', 'snapshot', 'history', 'render', 'commit', 'push')
+
+# 指标名前缀
+METRIC_PREFIX = 'player_stats'
+
+def _quantile(sorted_values, q):
+    """最近秩法计算分位数，sorted_values需要已排序"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(q * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+class _StageStats:
+    """单个阶段的耗时统计"""
+    __slots__ = ('durations', 'count', 'errors', 'total', 'last')
+
+    def __init__(self, window):
+        self.durations = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.last = None
+
+class PipelineMetrics:
+    """更新流程的阶段耗时和计数器
+
+    用stage()包裹每个阶段，记录耗时和出错次数，并保留最近window次的耗时
+    计算p50/p95；incr()累加计数器，如读取的文件数和字节数。
+    可以在多个线程中同时使用。
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+
+    @contextmanager
+    def stage(self, name):
+        """记录一个阶段的耗时，阶段中抛出的异常计为一次错误"""
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, failed)
+
+    def observe(self, name, seconds, failed=False):
+        """记录一次阶段耗时"""
+        with self._lock:
+            stats = self._stages.get(name)
+            if stats is None:
+                stats = self._stages[name] = _StageStats(self.window)
+            stats.durations.append(seconds)
+            stats.count += 1
+            stats.total += seconds
+            stats.last = seconds
+            if failed:
+                stats.errors += 1
+
+    def incr(self, name, amount=1):
+        """累加计数器"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def reset(self):
+        """清空所有统计"""
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        """获取当前统计，返回 {'stages': {阶段: {...}}, 'counters': {计数器: 值}}"""
+        with self._lock:
+            stages = {}
+            for name, stats in self._stages.items():
+                durations = sorted(stats.durations)
+                stages[name] = {
+                    'count': stats.count,
+                    'errors': stats.errors,
+                    'total': stats.total,
+                    'last': stats.last
+                }
+                for q, key in QUANTILES:
+                    stages[name][key] = _quantile(durations, q)
+            return {'stages': stages, 'counters': dict(self._counters)}
+
+    def to_prometheus(self):
+        """生成Prometheus文本格式的指标"""
+        snapshot = self.snapshot()
+        lines = [
+            f'# HELP {METRIC_PREFIX}_stage_duration_seconds Duration of update pipeline stages.',
+            f'# TYPE {METRIC_PREFIX}_stage_duration_seconds summary'
+        ]
+        for name, stats in sorted(snapshot['stages'].items()):
+            for q, key in QUANTILES:
+                lines.append(f'{METRIC_PREFIX}_stage_duration_seconds{{stage="{name}",quantile="{q}"}} {stats[key]}')
+            lines.append(f'{METRIC_PREFIX}_stage_duration_seconds_sum{{stage="{name}"}} {stats["total"]}')
+            lines.append(f'{METRIC_PREFIX}_stage_duration_seconds_count{{stage="{name}"}} {stats["count"]}')
+
+        lines.append(f'# HELP {METRIC_PREFIX}_stage_errors_total Update pipeline stages that raised an error.')
+        lines.append(f'# TYPE {METRIC_PREFIX}_stage_errors_total counter')
+        for name, stats in sorted(snapshot['stages'].items()):
+            lines.append(f'{METRIC_PREFIX}_stage_errors_total{{stage="{name}"}} {stats["errors"]}')
+
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f'# TYPE {METRIC_PREFIX}_{name}_total counter')
+            lines.append(f'{METRIC_PREFIX}_{name}_total {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus_file(self, path):
+        """原子地写入Prometheus文本格式的指标文件，供node_exporter的textfile收集器读取"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+# 插件内共享的指标
+_metrics = PipelineMetrics()
+
+def get_metrics():
+    """获取共享的PipelineMetrics"""
+    return _metrics
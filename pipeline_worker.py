@@ -0,0 +1,108 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+class PipelineWorker:
+    """在后台线程中执行排行榜更新任务
+
+    任务按key合并（single-flight）：同一key的任务还在排队时再次提交，
+    不会重复执行，而是返回同一个Future，所有调用者共享同一次执行的结果。
+    提交时可以通过covered_by指定能够代替本任务的其他key，例如“生成并上传”
+    还在排队时，“仅生成”的请求直接复用它的结果。
+    已经开始执行的任务读到的可能是提交之前的数据，不再参与合并，
+    此时提交的任务会在其完成后重新执行一次。
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        # 排队中的任务 {key: Future}，开始执行时移除
+        self._inflight = {}
+        self._running = None
+        self._thread = None
+        self._stopping = False
+        self.runs = 0
+        self.coalesced = 0
+
+    def start(self):
+        """启动后台线程"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='PlayerStatsWorker', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        """停止后台线程，正在执行的任务会先完成"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+            self._stopping = True
+        if thread is not None:
+            self._queue.put(None)
+            if thread is not threading.current_thread():
+                thread.join(timeout=timeout)
+
+    def submit(self, key, func, covered_by=()):
+        """提交任务，返回Future；同key或covered_by中的任务还在排队时直接返回其Future"""
+        with self._lock:
+            if self._stopping:
+                raise RuntimeError('worker is stopped')
+            for existing_key in (key,) + tuple(covered_by):
+                future = self._inflight.get(existing_key)
+                if future is not None:
+                    self.coalesced += 1
+                    return future
+
+            future = Future()
+            self._inflight[key] = future
+            self._queue.put((key, func, future))
+            return future
+
+    def is_busy(self):
+        """是否有任务在排队或执行"""
+        with self._lock:
+            return bool(self._inflight) or self._running is not None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            key, func, future = item
+            self._take(key, future)
+            if not future.set_running_or_notify_cancel():
+                self._finish()
+                continue
+            self.runs += 1
+            try:
+                result = func()
+            except BaseException as e:
+                self._finish()
+                future.set_exception(e)
+            else:
+                self._finish()
+                future.set_result(result)
+
+        # 线程退出前取消未执行的任务
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self._take(item[0], item[2])
+                item[2].cancel()
+
+    def _take(self, key, future):
+        """任务离开队列，之后提交的同key任务不再与它合并"""
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            self._running = key
+
+    def _finish(self):
+        with self._lock:
+            self._running = None
@@ -0,0 +1,62 @@
+import heapq
+
+class _DescendingKey:
+    """反转比较方向的包装，用于在最小堆中让uuid较大的玩家先被淘汰"""
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return self.key > other.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+class RankingAccumulator:
+    """单次遍历同时计算多个排行榜
+
+    每个统计项维护一个大小不超过top_n的最小堆，堆顶为当前最差的上榜玩家；
+    总复杂度为 O(玩家数 × 统计项数 × log top_n)。top_n小于1时抛出ValueError。
+    排序规则：按值降序，同值按uuid升序，与create_ranking一致。
+    """
+
+    def __init__(self, stat_keys, top_n=10):
+        if top_n < 1:
+            raise ValueError(f'top_n必须大于0: {top_n}')
+        self.stat_keys = list(stat_keys)
+        self.top_n = top_n
+        self.heaps = {stat_key: [] for stat_key in self.stat_keys}
+
+    def add(self, uuid, name, values):
+        """加入一名玩家，values为 {stat_key: 数值}，值不大于0的统计项不上榜"""
+        for stat_key in self.stat_keys:
+            value = values.get(stat_key, 0)
+            if value <= 0:
+                continue
+            self.push(stat_key, value, uuid, name)
+
+    def push(self, stat_key, value, uuid, name):
+        """向单个排行榜加入一条记录"""
+        heap = self.heaps[stat_key]
+        item = (value, _DescendingKey(uuid), name)
+        if len(heap) < self.top_n:
+            heapq.heappush(heap, item)
+        elif heap[0] < item:
+            heapq.heapreplace(heap, item)
+
+    def ranking(self, stat_key):
+        """获取单个排行榜，格式与create_ranking一致"""
+        items = sorted(self.heaps[stat_key], reverse=True)
+        return [
+            {
+                'uuid': key.key,
+                'name': name,
+                'value': value
+            }
+            for value, key, name in items
+        ]
+
+    def results(self):
+        """获取所有排行榜 {stat_key: ranking}"""
+        return {stat_key: self.ranking(stat_key) for stat_key in self.stat_keys}
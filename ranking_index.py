@@ -0,0 +1,238 @@
+import threading
+from bisect import bisect_left, insort
+
+# 游戏内命令中可以使用的统计项简称
+STAT_ALIASES = {
+    'time': 'minecraft:play_time',
+    'playtime': 'minecraft:play_time',
+    'walk': 'minecraft:walk_one_cm',
+    'fly': 'minecraft:fly_one_cm',
+    'swim': 'minecraft:swim_one_cm',
+    'kills': 'minecraft:mob_kills',
+    'damage': 'minecraft:damage_taken',
+    'mined': 'player_stats:blocks_broken',
+    'blocks': 'player_stats:blocks_broken'
+}
+
+# 一次刷新中变化的玩家超过该比例时，整体重新排序比逐个更新更快
+REBUILD_RATIO = 0.25
+
+class OrderStatistic:
+    """单项统计数据的顺序统计结构
+
+    维护按 (-值, uuid) 升序排列的数组，即按值降序、同值按uuid升序；
+    玩家的值变化时用二分查找删除旧键、插入新键。名次、百分位和
+    超过某个值的人数都只需要一次二分查找，复杂度为 O(log n)。
+    """
+    __slots__ = ('keys', 'values')
+
+    def __init__(self, values_by_uuid=None):
+        self.keys = []
+        self.values = {}
+        if values_by_uuid:
+            self.rebuild(values_by_uuid)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, uuid):
+        return uuid in self.values
+
+    def rebuild(self, values_by_uuid):
+        """用 {uuid: 数值} 整体重建"""
+        self.values = dict(values_by_uuid)
+        self.keys = sorted((-value, uuid) for uuid, value in self.values.items())
+
+    def set(self, uuid, value):
+        """设置玩家的值，值未变化时不做任何操作"""
+        old_value = self.values.get(uuid)
+        if old_value == value:
+            return
+        if old_value is not None:
+            del self.keys[bisect_left(self.keys, (-old_value, uuid))]
+        insort(self.keys, (-value, uuid))
+        self.values[uuid] = value
+
+    def remove(self, uuid):
+        """移除玩家"""
+        old_value = self.values.pop(uuid, None)
+        if old_value is not None:
+            del self.keys[bisect_left(self.keys, (-old_value, uuid))]
+
+    def update(self, values_by_uuid):
+        """同步为 {uuid: 数值}，只更新变化的玩家；变化较多时整体重建。返回变化的玩家数"""
+        changed = [(uuid, value) for uuid, value in values_by_uuid.items() if self.values.get(uuid) != value]
+        removed = [uuid for uuid in self.values if uuid not in values_by_uuid]
+        count = len(changed) + len(removed)
+        if count > max(len(self.keys), len(values_by_uuid)) * REBUILD_RATIO:
+            self.rebuild(values_by_uuid)
+            return count
+        for uuid in removed:
+            self.remove(uuid)
+        for uuid, value in changed:
+            self.set(uuid, value)
+        return count
+
+    def top(self, n):
+        """前n名，返回 [(uuid, 值)]"""
+        return [(uuid, -neg_value) for neg_value, uuid in self.keys[:n]]
+
+    def count_above(self, threshold):
+        """值严格大于threshold的玩家数"""
+        return bisect_left(self.keys, (-threshold,))
+
+    def count_at_most(self, value):
+        """值不大于value的玩家数"""
+        return len(self.keys) - self.count_above(value)
+
+    def rank(self, uuid):
+        """玩家的名次，同值玩家名次并列，没有数据时返回None"""
+        value = self.values.get(uuid)
+        if value is None:
+            return None
+        return self.count_above(value) + 1
+
+    def percentile(self, uuid):
+        """玩家的百分位：值不高于该玩家的玩家所占的百分比，没有数据时返回None"""
+        value = self.values.get(uuid)
+        if value is None:
+            return None
+        return self.count_at_most(value) * 100.0 / len(self.keys)
+
+class RankingIndex:
+    """内存中的排行榜索引
+
+    每项统计数据维护一个OrderStatistic。后台刷新时只更新值发生变化的玩家，
+    游戏内的查询命令只读取索引，不访问磁盘也不重新解析stats文件。
+    查询前N名为数组切片，名次、百分位和人数查询为一次二分查找。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._orders = {}
+        self._names = {}
+        self._uuids_by_name = {}
+        self._stat_names = {}
+        self.updated_at = None
+
+    def update(self, values_by_player, names, stat_names=None, updated_at=None):
+        """用 {uuid: {stat_key: 数值}} 和 {uuid: 名称} 同步索引，stat_names为统计项的显示名称
+
+        返回 {stat_key: 变化的玩家数}。
+        """
+        columns = {}
+        for uuid, values in values_by_player.items():
+            for stat_key, value in values.items():
+                columns.setdefault(stat_key, {})[uuid] = value
+        uuids_by_name = {name.lower(): uuid for uuid, name in names.items()}
+
+        changes = {}
+        with self._lock:
+            for stat_key in list(self._orders):
+                if stat_key not in columns:
+                    del self._orders[stat_key]
+            for stat_key, column in columns.items():
+                order = self._orders.get(stat_key)
+                if order is None:
+                    self._orders[stat_key] = OrderStatistic(column)
+                    changes[stat_key] = len(column)
+                else:
+                    changes[stat_key] = order.update(column)
+            self._names = dict(names)
+            self._uuids_by_name = uuids_by_name
+            self._stat_names = dict(stat_names or {})
+            self.updated_at = updated_at
+        return changes
+
+    def restore(self, orders, names, stat_names=None, updated_at=None):
+        """用 {stat_key: OrderStatistic} 整体替换索引内容，用于从快照恢复"""
+        uuids_by_name = {name.lower(): uuid for uuid, name in names.items()}
+        with self._lock:
+            self._orders = dict(orders)
+            self._names = dict(names)
+            self._uuids_by_name = uuids_by_name
+            self._stat_names = dict(stat_names or {})
+            self.updated_at = updated_at
+
+    def export(self):
+        """获取索引内容的副本 (orders, names, stat_names, updated_at)，orders为 {stat_key: 排序键列表}"""
+        with self._lock:
+            orders = {stat_key: list(order.keys) for stat_key, order in self._orders.items()}
+            return orders, dict(self._names), dict(self._stat_names), self.updated_at
+
+    def is_ready(self):
+        """索引是否已经生成"""
+        return bool(self._orders)
+
+    def stat_keys(self):
+        """索引中的统计项"""
+        return list(self._orders)
+
+    def get_stat_name(self, stat_key):
+        """获取统计项的显示名称"""
+        return self._stat_names.get(stat_key, stat_key)
+
+    def resolve_stat(self, name):
+        """将命令中的统计项名称（完整键名、去掉minecraft:或player_stats:前缀的名称或简称）解析为键名，未知时返回None"""
+        orders = self._orders
+        for stat_key in (name, f'minecraft:{name}', f'player_stats:{name}', STAT_ALIASES.get(name.lower())):
+            if stat_key in orders:
+                return stat_key
+        return None
+
+    def find_player(self, name):
+        """按名称查找玩家uuid（不区分大小写），也接受uuid本身，找不到时返回None"""
+        uuid = self._uuids_by_name.get(name.lower())
+        if uuid is None and name in self._names:
+            uuid = name
+        return uuid
+
+    def get_name(self, uuid):
+        """获取玩家名称"""
+        return self._names.get(uuid, uuid)
+
+    def top(self, stat_key, n=10):
+        """获取前n名，返回 [{'uuid', 'name', 'value'}]，值不大于0的玩家不上榜"""
+        with self._lock:
+            order = self._orders.get(stat_key)
+            if order is None:
+                return []
+            items = order.top(n)
+        names = self._names
+        return [
+            {'uuid': uuid, 'name': names.get(uuid, uuid), 'value': value}
+            for uuid, value in items
+            if value > 0
+        ]
+
+    def rank(self, uuid, stat_key):
+        """获取玩家的名次，返回 {'rank', 'value', 'total', 'percentile'}；同值玩家名次并列，没有数据时返回None"""
+        with self._lock:
+            order = self._orders.get(stat_key)
+            if order is None or uuid not in order:
+                return None
+            return {
+                'rank': order.rank(uuid),
+                'value': order.values[uuid],
+                'total': len(order),
+                'percentile': order.percentile(uuid)
+            }
+
+    def percentile(self, uuid, stat_key):
+        """获取玩家的百分位（0~100），没有数据时返回None"""
+        with self._lock:
+            order = self._orders.get(stat_key)
+            return order.percentile(uuid) if order is not None else None
+
+    def count_above(self, stat_key, threshold):
+        """获取该项统计数据严格大于threshold的玩家数"""
+        with self._lock:
+            order = self._orders.get(stat_key)
+            return order.count_above(threshold) if order is not None else 0
+
+# 插件内共享的排行榜索引
+_ranking_index = RankingIndex()
+
+def get_ranking_index():
+    """获取共享的排行榜索引"""
+    return _ranking_index
@@ -0,0 +1,79 @@
+# numpy为可选依赖，未安装时排行榜退回到逐个玩家计算
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def numpy_available():
+    """检查numpy是否可用"""
+    return np is not None
+
+class StatMatrix:
+    """玩家 × 统计项 的列式存储
+
+    columns为 {stat_key: 一维数组}，行按uuid排序；每列单独保存，
+    整数统计项为int64，比值等派生统计项可以是float64。
+    同值玩家按uuid升序排列，保证排行结果稳定。
+    """
+
+    def __init__(self, uuids, names, columns):
+        self.uuids = uuids
+        self.names = names
+        self.columns = columns
+        self.stat_keys = list(columns)
+        self.uuid_index = {uuid: i for i, uuid in enumerate(uuids)}
+
+    def __contains__(self, stat_key):
+        return stat_key in self.columns
+
+    def column(self, stat_key):
+        """获取某项统计数据的整列"""
+        return self.columns[stat_key]
+
+    def total(self, stat_key):
+        """计算某项统计数据的全服总和"""
+        return self.column(stat_key).sum().item()
+
+    def get_value(self, uuid, stat_key):
+        """获取单个玩家的某项统计数据"""
+        return self.columns[stat_key][self.uuid_index[uuid]].item()
+
+    def top_n(self, stat_key, top_n=10):
+        """获取某项统计数据的前N名，格式与create_ranking一致"""
+        column = self.column(stat_key)
+        rows = np.flatnonzero(column > 0)
+        if top_n is not None and 0 < top_n < len(rows):
+            # 先用argpartition找出第N名的值，再取出所有不低于该值的玩家，避免截断同值玩家
+            candidates = column[rows]
+            kth = np.argpartition(-candidates, top_n - 1)[top_n - 1]
+            rows = rows[candidates >= candidates[kth]]
+
+        # 按值降序排序，同值按行号（即uuid）升序
+        order = rows[np.lexsort((rows, -column[rows]))]
+        if top_n is not None:
+            order = order[:top_n]
+
+        return [
+            {
+                'uuid': self.uuids[i],
+                'name': self.names[i],
+                'value': column[i].item()
+            }
+            for i in order
+        ]
+
+def build_stat_matrix(stats_data, stat_keys, evaluate_columns):
+    """根据解析后的stats数据构建StatMatrix
+
+    evaluate_columns为 (每名玩家的stats列表, stat_keys) -> {stat_key: 列} 的计算函数，
+    如MetricPlan.evaluate；numpy不可用时返回None。
+    """
+    if np is None:
+        return None
+
+    uuids = sorted(stats_data)
+    names = [stats_data[uuid].name for uuid in uuids]
+    rows = [stats_data[uuid].stats or {} for uuid in uuids]
+    columns = evaluate_columns(rows, list(stat_keys))
+
+    return StatMatrix(uuids, names, {stat_key: np.asarray(column) for stat_key, column in columns.items()})
@@ -0,0 +1,146 @@
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS samples (
+    uuid TEXT NOT NULL,
+    stat_key TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (uuid, stat_key, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS latest (
+    uuid TEXT NOT NULL,
+    stat_key TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (uuid, stat_key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS latest_by_stat ON latest (stat_key);
+"""
+
+# 玩家在窗口内的增量 = 当前值 - 窗口起点的值；
+# 窗口起点之前没有记录时（新玩家或历史不足），以窗口内第一条记录为起点
+_WINDOW_QUERY = """
+SELECT uuid, value - COALESCE(
+    (SELECT s.value FROM samples s
+     WHERE s.uuid = l.uuid AND s.stat_key = l.stat_key AND s.ts <= :since
+     ORDER BY s.ts DESC LIMIT 1),
+    (SELECT s.value FROM samples s
+     WHERE s.uuid = l.uuid AND s.stat_key = l.stat_key AND s.ts > :since
+     ORDER BY s.ts ASC LIMIT 1)
+) AS delta
+FROM latest l
+WHERE l.stat_key = :stat_key
+ORDER BY delta DESC, uuid ASC
+LIMIT :top_n
+"""
+
+class StatsHistory:
+    """基于SQLite的统计数据快照历史
+
+    samples表按 (uuid, stat_key, ts) 建立主键索引，只在值发生变化时写入新行；
+    latest表保存每个玩家每项统计数据的最新值，用于判断变化和窗口查询。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('schema_version', ?)",
+                (str(SCHEMA_VERSION),)
+            )
+        # 内存中的最新值，避免每次写入前查询数据库
+        self._latest = {}
+        for uuid, stat_key, value in self._conn.execute('SELECT uuid, stat_key, value FROM latest'):
+            self._latest[(uuid, stat_key)] = value
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def record_snapshot(self, values_by_player, ts=None):
+        """记录一次快照，values_by_player为 {uuid: {stat_key: 数值}}
+
+        只写入与上一次记录不同的值，返回写入的行数。
+        """
+        if ts is None:
+            ts = int(time.time())
+
+        changed = []
+        for uuid, values in values_by_player.items():
+            for stat_key, value in values.items():
+                # 比值、换算单位等派生统计项是小数，不能取整；INTEGER列会原样保存为REAL
+                value = float(value) if isinstance(value, float) else int(value)
+                if self._latest.get((uuid, stat_key)) != value:
+                    changed.append((uuid, stat_key, ts, value))
+
+        if not changed:
+            return 0
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO samples (uuid, stat_key, ts, value) VALUES (?, ?, ?, ?)',
+                changed
+            )
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO latest (uuid, stat_key, ts, value) VALUES (?, ?, ?, ?)',
+                changed
+            )
+        for uuid, stat_key, _, value in changed:
+            self._latest[(uuid, stat_key)] = value
+        return len(changed)
+
+    def value_at(self, uuid, stat_key, ts):
+        """获取玩家在ts时刻的统计数据，没有记录时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value FROM samples WHERE uuid = ? AND stat_key = ? AND ts <= ? '
+                'ORDER BY ts DESC LIMIT 1',
+                (uuid, stat_key, ts)
+            ).fetchone()
+        return row[0] if row else None
+
+    def window_ranking(self, stat_key, since, top_n=10):
+        """获取从since时刻至今增量最大的玩家，返回 [{'uuid', 'value'}]"""
+        with self._lock:
+            rows = self._conn.execute(
+                _WINDOW_QUERY,
+                {'since': int(since), 'stat_key': stat_key, 'top_n': top_n}
+            ).fetchall()
+        return [{'uuid': uuid, 'value': delta} for uuid, delta in rows if delta and delta > 0]
+
+# 每个数据库文件只打开一次，在定时任务之间复用
+_histories = {}
+_histories_lock = threading.Lock()
+
+def get_stats_history(db_path):
+    """获取db_path对应的StatsHistory，首次调用时创建"""
+    with _histories_lock:
+        history = _histories.get(db_path)
+        if history is None:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            history = StatsHistory(db_path)
+            _histories[db_path] = history
+        return history
+
+def close_stats_histories():
+    """关闭所有打开的数据库连接"""
+    with _histories_lock:
+        for history in _histories.values():
+            history.close()
+        _histories.clear()
@@ -0,0 +1,419 @@
+import gc
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+from array import array
+from operator import itemgetter, neg
+
+# 处理相对导入问题
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+try:
+    from .ranking_index import OrderStatistic
+    from .parse_player_data import seed_stats_cache
+    from .create_player_rankings import extract_base_value
+    from .derived_metrics import extract_category_term, is_item_category_key
+    from .compact_stats import compact_stats
+except ImportError:
+    # 当直接运行时使用绝对导入
+    from ranking_index import OrderStatistic
+    from parse_player_data import seed_stats_cache
+    from create_player_rankings import extract_base_value
+    from derived_metrics import extract_category_term, is_item_category_key
+    from compact_stats import compact_stats
+
+# 快照文件格式
+#
+# 文件头之后依次为字符串表、玩家表和列目录，所有数组都是8字节宽的小端整数或浮点数，
+# 起始位置按8字节对齐，读取时可以直接把映射的内存转换为数组，不需要逐项解码。
+# - 字符串表：count + 1个偏移量，之后为UTF-8编码的字符串内容；0号字符串为JSON格式的元数据
+# - 玩家表：uuid、名称（字符串编号）、inode、mtime_ns、size各一列，按uuid排序；
+#   没有文件标识的玩家size为-1
+# - 列目录：每列为 (键名编号, 类型, 数据类型, 排序数组长度, 值数组偏移, 排序数组偏移)；
+#   类型0为排行榜索引的统计项，附带按 (-值, uuid) 排列的玩家序号；
+#   类型1为选择性解析的输入项，用于预先填充解析缓存
+SNAPSHOT_MAGIC = b'PSSN'
+SNAPSHOT_VERSION = 1
+
+_HEADER = struct.Struct('<4sHHIIIIdQQQ')
+_COLUMN = struct.Struct('<QQQQQQ')
+
+COLUMN_INDEX = 0
+COLUMN_INPUT = 1
+
+def _encode_key(key):
+    """将统计项或分类求和输入项编码为字符串"""
+    return json.dumps(key, ensure_ascii=False)
+
+def _decode_key(text):
+    key = json.loads(text)
+    if isinstance(key, list):
+        category, patterns = key
+        return (category, tuple(patterns) if patterns is not None else None)
+    return key
+
+def _take(items, positions):
+    """按positions依次取出items中的元素，返回列表"""
+    if len(positions) < 2:
+        return [items[i] for i in positions]
+    return list(itemgetter(*positions)(items))
+
+def _copy_array(view):
+    """将映射的内存中的数组复制为array"""
+    copied = array(view.format)
+    with view.cast('B') as raw:
+        copied.frombytes(raw)
+    return copied
+
+def _pad(buffer):
+    buffer.extend(b'\0' * (-len(buffer) % 8))
+
+def _int_array(values):
+    return array('q', values)
+
+def _value_array(values):
+    """统计项的值数组，包含小数时使用float64"""
+    if any(isinstance(value, float) for value in values):
+        return array('d', values)
+    return array('q', values)
+
+class _SnapshotOrder(OrderStatistic):
+    """从快照恢复的OrderStatistic
+
+    恢复时只复制快照中的值数组和排序数组，第一次使用时才按保存的顺序创建排序键，
+    不需要重新排序；恢复的耗时因此与统计项数和玩家数几乎无关。
+    """
+    __slots__ = ('_pending',)
+
+    def __init__(self, uuids, values, order):
+        self._pending = (uuids, values, order)
+
+    def __getattr__(self, name):
+        # 只有keys和values尚未赋值时才会调用到这里
+        if name not in ('keys', 'values') or self._pending is None:
+            raise AttributeError(name)
+        uuids, values, order = self._pending
+        self._pending = None
+        order = order.tolist()
+        gc_enabled = gc.isenabled()
+        # 一次创建大量元组，暂停垃圾回收避免反复扫描
+        gc.disable()
+        try:
+            sorted_values = _take(values.tolist(), order)
+            sorted_uuids = _take(uuids, order)
+            self.keys = list(zip(map(neg, sorted_values), sorted_uuids))
+            self.values = dict(zip(sorted_uuids, sorted_values))
+        finally:
+            if gc_enabled:
+                gc.enable()
+        return getattr(self, name)
+
+class _StringTable:
+    def __init__(self):
+        self.strings = []
+        self.ids = {}
+
+    def add(self, text):
+        string_id = self.ids.get(text)
+        if string_id is None:
+            string_id = self.ids[text] = len(self.strings)
+            self.strings.append(text)
+        return string_id
+
+def write_snapshot(path, index, stats_dir=None, parse_keys=None, cache_entries=None):
+    """将排行榜索引写入快照文件，返回写入的玩家数
+
+    index为RankingIndex；传入stats_dir、parse_keys（选择性解析的键）和该目录的解析缓存
+    cache_entries（见parse_player_data.get_stats_cache_entries）时，一并保存每名玩家的
+    文件标识和输入项，恢复时可以预先填充解析缓存，之后只需重新读取发生变化的文件。
+    保留整个分类的解析键（条目索引使用）无法保存为输入项，此时不保存解析缓存。
+    """
+    orders, names, stat_names, updated_at = index.export()
+    if cache_entries is None or parse_keys is None or any(map(is_item_category_key, parse_keys)):
+        cache_entries = {}
+    uuid_set = set(names).union(cache_entries)
+    for keys in orders.values():
+        uuid_set.update(uuid for _, uuid in keys)
+    uuids = sorted(uuid_set)
+    position = {uuid: i for i, uuid in enumerate(uuids)}
+
+    strings = _StringTable()
+    strings.add(json.dumps({
+        'stats_dir': stats_dir if cache_entries else None,
+        'parse_keys': [_encode_key(key) for key in parse_keys] if cache_entries else None,
+        'stat_names': stat_names,
+        'updated_at': updated_at,
+        'created_at': time.time()
+    }, ensure_ascii=False))
+
+    # 玩家表
+    player_columns = [[strings.add(uuid) for uuid in uuids], [strings.add(names.get(uuid, uuid)) for uuid in uuids]]
+    identities = [cache_entries[uuid][0][:3] if uuid in cache_entries else (0, 0, -1) for uuid in uuids]
+    player_columns += [list(column) for column in zip(*identities)] if uuids else [[], [], []]
+
+    # 排行榜索引的统计项：值按玩家表顺序存放，排序数组为玩家序号
+    columns = []
+    for stat_key, keys in orders.items():
+        values = [0] * len(uuids)
+        order = []
+        for neg_value, uuid in keys:
+            i = position[uuid]
+            values[i] = -neg_value
+            order.append(i)
+        columns.append((strings.add(_encode_key(stat_key)), COLUMN_INDEX, _value_array(values), _int_array(order)))
+
+    # 选择性解析的输入项
+    if cache_entries:
+        rows = [cache_entries[uuid][1] if uuid in cache_entries else None for uuid in uuids]
+        for key in parse_keys:
+            extract = extract_category_term if isinstance(key, tuple) else extract_base_value
+            values = [extract(stats, key) if stats else 0 for stats in rows]
+            columns.append((strings.add(_encode_key(key)), COLUMN_INPUT, _int_array(values), None))
+
+    # 按布局拼接文件内容
+    body = bytearray(b'\0' * _HEADER.size)
+    _pad(body)
+    strings_offset = len(body)
+    encoded = [text.encode('utf-8') for text in strings.strings]
+    offsets = [0]
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+    body += _int_array(offsets).tobytes()
+    body += b''.join(encoded)
+    _pad(body)
+
+    players_offset = len(body)
+    for column in player_columns:
+        body += _int_array(column).tobytes()
+
+    columns_offset = len(body)
+    body += b'\0' * (_COLUMN.size * len(columns))
+    for i, (key_id, kind, values, order) in enumerate(columns):
+        values_offset = len(body)
+        body += values.tobytes()
+        order_offset = 0
+        if order is not None:
+            order_offset = len(body)
+            body += order.tobytes()
+        _COLUMN.pack_into(body, columns_offset + i * _COLUMN.size, key_id, kind, ord(values.typecode),
+                          len(order) if order is not None else 0, values_offset, order_offset)
+
+    _HEADER.pack_into(body, 0, SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, len(uuids), len(columns), len(encoded), 0,
+                      time.time(), strings_offset, players_offset, columns_offset)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+    return len(uuids)
+
+class StatsSnapshot:
+    """以内存映射方式读取的快照文件
+
+    打开时只校验文件头，数组在读取时直接由映射的内存转换得到。
+    使用完毕后需要调用close()，或用with语句。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._views = []
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空文件不能映射
+            self._file.close()
+            raise ValueError('快照文件为空')
+        self._view = memoryview(self._mmap)
+        try:
+            self._read_header()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read_header(self):
+        if len(self._view) < _HEADER.size:
+            raise ValueError('快照文件不完整')
+        (magic, version, _, self.player_count, self.column_count, self.string_count, _,
+         self.created_at, self._strings_offset, self._players_offset, self._columns_offset) = _HEADER.unpack_from(self._view)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError('不是快照文件')
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f'不支持的快照版本 {version}')
+        end = self._columns_offset + self.column_count * _COLUMN.size
+        if end > len(self._view):
+            raise ValueError('快照文件不完整')
+        self._string_offsets = self._array(self._strings_offset, self.string_count + 1, 'q')
+        self._string_data = self._strings_offset + (self.string_count + 1) * 8
+        self.meta = json.loads(self.string(0))
+
+    def _array(self, offset, count, typecode):
+        if offset + count * 8 > len(self._view):
+            raise ValueError('快照文件不完整')
+        view = self._view[offset:offset + count * 8].cast(typecode)
+        self._views.append(view)
+        return view
+
+    def string(self, string_id):
+        start = self._string_data + self._string_offsets[string_id]
+        end = self._string_data + self._string_offsets[string_id + 1]
+        return bytes(self._view[start:end]).decode('utf-8')
+
+    def strings(self, string_ids):
+        """批量读取字符串，返回列表"""
+        offsets = self._string_offsets.tolist()
+        data = bytes(self._view[self._string_data:self._string_data + offsets[-1]])
+        return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in string_ids.tolist()]
+
+    def player_column(self, i):
+        """玩家表的第i列：0 uuid，1 名称（字符串编号），2 inode，3 mtime_ns，4 size"""
+        return self._array(self._players_offset + i * self.player_count * 8, self.player_count, 'q')
+
+    def columns(self):
+        """遍历列目录，返回 [(键, 类型, 值数组, 排序数组或None)]"""
+        result = []
+        for i in range(self.column_count):
+            key_id, kind, typecode, order_count, values_offset, order_offset = _COLUMN.unpack_from(
+                self._view, self._columns_offset + i * _COLUMN.size)
+            values = self._array(values_offset, self.player_count, chr(typecode))
+            order = self._array(order_offset, order_count, 'q') if kind == COLUMN_INDEX else None
+            result.append((_decode_key(self.string(key_id)), kind, values, order))
+        return result
+
+    def parse_keys(self):
+        """保存输入项时使用的选择性解析的键，没有保存输入项时返回None"""
+        keys = self.meta.get('parse_keys')
+        return [_decode_key(key) for key in keys] if keys is not None else None
+
+    def read_index(self):
+        """读取排行榜索引，返回 ({stat_key: OrderStatistic}, {uuid: 名称})"""
+        uuids = self.strings(self.player_column(0))
+        names = dict(zip(uuids, self.strings(self.player_column(1))))
+        orders = {}
+        for stat_key, kind, values, order in self.columns():
+            if kind == COLUMN_INDEX:
+                # 复制出映射的内存，快照文件关闭后仍然可用
+                orders[stat_key] = _SnapshotOrder(uuids, _copy_array(values), _copy_array(order))
+        return orders, names
+
+    def read_cache_entries(self):
+        """读取用于填充解析缓存的 {uuid: (文件标识, CompactStats)}，没有保存输入项时返回空字典"""
+        parse_keys = self.parse_keys()
+        if parse_keys is None:
+            return {}
+        uuids = self.strings(self.player_column(0))
+        inodes, mtimes, sizes = (self.player_column(i).tolist() for i in (2, 3, 4))
+        inputs = [(key, values.tolist()) for key, kind, values, _ in self.columns() if kind == COLUMN_INPUT]
+        selection = frozenset(parse_keys)
+
+        entries = {}
+        for i, uuid in enumerate(uuids):
+            if sizes[i] < 0:
+                continue
+            custom = {}
+            totals = {}
+            for key, values in inputs:
+                if values[i]:
+                    if isinstance(key, tuple):
+                        totals[key] = values[i]
+                    else:
+                        custom[key] = values[i]
+            stats = compact_stats({'stats': {'minecraft:custom': custom}, 'totals': totals})
+            entries[uuid] = ((inodes[i], mtimes[i], sizes[i], selection, True), stats)
+        return entries
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if getattr(self, '_view', None) is not None:
+            self._view.release()
+            self._view = None
+            self._mmap.close()
+        self._file.close()
+
+def open_snapshot(path):
+    """打开快照文件，文件不存在或无法使用时返回None"""
+    if not os.path.exists(path):
+        return None
+    try:
+        return StatsSnapshot(path)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring stats snapshot {path}: {e}")
+        return None
+
+def _saved_parse_keys(stats_dir, parse_keys):
+    """write_snapshot会为这些参数保存的选择性解析键，不保存解析缓存时为None"""
+    if stats_dir is None or parse_keys is None or any(map(is_item_category_key, parse_keys)):
+        return None
+    return set(parse_keys)
+
+def snapshot_is_current(path, stat_keys, stats_dir=None, parse_keys=None):
+    """快照是否与当前的排行统计项、stats目录和选择性解析的键一致
+
+    参数与write_snapshot相同；排行统计项或解析键在配置中发生变化后快照需要重新写入，
+    即使排行榜索引中的值没有变化。快照不存在或无法使用时返回False。
+    """
+    snapshot = open_snapshot(path)
+    if snapshot is None:
+        return False
+    with snapshot:
+        saved_keys = snapshot.parse_keys()
+        expected_keys = _saved_parse_keys(stats_dir, parse_keys)
+        if set(snapshot.meta.get('stat_names') or {}) != set(stat_keys):
+            return False
+        if expected_keys is None:
+            return saved_keys is None
+        return snapshot.meta.get('stats_dir') == stats_dir and saved_keys is not None and set(saved_keys) == expected_keys
+
+def restore_index(path, index, stat_keys=None):
+    """从快照恢复排行榜索引，返回恢复的玩家数，快照无法使用时返回None
+
+    传入stat_keys时，快照中的统计项与之不同（配置已经修改）则不恢复。
+    """
+    snapshot = open_snapshot(path)
+    if snapshot is None:
+        return None
+    try:
+        with snapshot:
+            if stat_keys is not None and set(snapshot.meta.get('stat_names') or {}) != set(stat_keys):
+                print(f"Ignoring stats snapshot {path}: ranked stats have changed")
+                return None
+            orders, names = snapshot.read_index()
+    except (ValueError, KeyError, IndexError, TypeError) as e:
+        print(f"Ignoring stats snapshot {path}: {e}")
+        return None
+    index.restore(orders, names, stat_names=snapshot.meta.get('stat_names'), updated_at=snapshot.meta.get('updated_at'))
+    return len(names)
+
+def restore_stats_cache(path, stats_dir, parse_keys):
+    """用快照中的输入项填充stats_dir的解析缓存，返回填充的玩家数
+
+    快照保存的stats目录和选择性解析的键与当前一致时才会填充，否则返回0；
+    快照无法使用时返回None。
+    """
+    if parse_keys is None:
+        return 0
+    snapshot = open_snapshot(path)
+    if snapshot is None:
+        return None
+    with snapshot:
+        saved_keys = snapshot.parse_keys()
+        if snapshot.meta.get('stats_dir') != stats_dir or saved_keys is None or set(saved_keys) != set(parse_keys):
+            return 0
+        try:
+            entries = snapshot.read_cache_entries()
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            print(f"Ignoring stats snapshot {path}: {e}")
+            return None
+    seed_stats_cache(stats_dir, entries)
+    return len(entries)
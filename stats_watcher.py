@@ -0,0 +1,223 @@
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+# inotify事件掩码（见 <sys/inotify.h>）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+_EVENT_HEADER = struct.Struct('iIII')
+
+def _load_inotify():
+    """加载libc中的inotify函数，非Linux或加载失败时返回None"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+def _ctypes_errno():
+    """获取最近一次ctypes调用的errno"""
+    import ctypes
+    return ctypes.get_errno()
+
+def _uuid_from_filename(filename):
+    """从stats文件名中提取uuid，不是stats文件时返回None"""
+    if filename.endswith('.json'):
+        return filename[:-5]
+    return None
+
+class StatsWatcher:
+    """监视stats目录，在文件变化后回调
+
+    Linux下使用inotify，其他平台或inotify不可用时退回到定时扫描目录。
+    一次save-all会在短时间内写入大量文件，变化的uuid会先收集起来，
+    直到debounce秒内没有新的变化（或距第一次变化超过max_wait秒）才调用
+    callback(changed_uuids)；事件队列溢出时changed_uuids为None，表示需要全量刷新。
+    """
+
+    def __init__(self, stats_dir, callback, debounce=5.0, max_wait=60.0, poll_interval=10.0, logger=None):
+        self.stats_dir = stats_dir
+        self.callback = callback
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.logger = logger
+        self.mode = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._changed = set()
+        self._full_refresh = False
+        self._first_change = None
+        self._last_change = None
+
+    def start(self):
+        """启动监视线程"""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='PlayerStatsWatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止监视线程"""
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def _log(self, level, message):
+        if self.logger is not None:
+            getattr(self.logger, level)(message)
+        else:
+            print(message)
+
+    def _run(self):
+        libc = _load_inotify()
+        if libc is not None:
+            try:
+                self._run_inotify(libc)
+                return
+            except OSError as e:
+                self._log('warning', f'inotify不可用，改为定时扫描stats目录: {e}')
+        self._run_polling()
+
+    def _note_change(self, uuid):
+        """记录一次文件变化"""
+        now = time.monotonic()
+        if uuid is None:
+            self._full_refresh = True
+        else:
+            self._changed.add(uuid)
+        if self._first_change is None:
+            self._first_change = now
+        self._last_change = now
+
+    def _flush_if_quiet(self):
+        """变化平息后触发回调"""
+        if self._first_change is None:
+            return
+        now = time.monotonic()
+        if now - self._last_change < self.debounce and now - self._first_change < self.max_wait:
+            return
+        changed = None if self._full_refresh else self._changed
+        self._changed = set()
+        self._full_refresh = False
+        self._first_change = None
+        self._last_change = None
+        try:
+            self.callback(changed)
+        except Exception as e:
+            self._log('error', f'处理stats目录变化时出错: {e}')
+
+    def _wait_timeout(self, idle_timeout):
+        """计算下一次等待的超时时间"""
+        if self._first_change is None:
+            return idle_timeout
+        return max(0.05, min(self.debounce, 1.0))
+
+    def _run_inotify(self, libc):
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(_ctypes_errno(), 'inotify_init1 failed')
+        try:
+            wd = libc.inotify_add_watch(fd, os.fsencode(self.stats_dir), _WATCH_MASK)
+            if wd < 0:
+                raise OSError(_ctypes_errno(), f'inotify_add_watch failed: {self.stats_dir}')
+            self.mode = 'inotify'
+            self._log('info', f'正在使用inotify监视stats目录: {self.stats_dir}')
+
+            while not self._stop_event.is_set():
+                readable, _, _ = select.select([fd], [], [], self._wait_timeout(1.0))
+                if readable:
+                    if not self._read_inotify_events(fd):
+                        # 目录被删除或移动，改为定时扫描等待其重新出现
+                        self._log('warning', 'stats目录已被移除，改为定时扫描')
+                        break
+                self._flush_if_quiet()
+        finally:
+            os.close(fd)
+
+        if not self._stop_event.is_set():
+            self._run_polling()
+
+    def _read_inotify_events(self, fd):
+        """读取并处理inotify事件，被监视的目录失效时返回False"""
+        try:
+            buffer = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            return True
+
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buffer):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(buffer, offset)
+            offset += _EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b'\0').decode('utf-8', 'replace')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                self._note_change(None)
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                self._note_change(None)
+                return False
+            else:
+                uuid = _uuid_from_filename(name)
+                if uuid is not None:
+                    self._note_change(uuid)
+        return True
+
+    def _scan(self):
+        """扫描stats目录，返回 {uuid: (mtime_ns, size)}"""
+        snapshot = {}
+        try:
+            with os.scandir(self.stats_dir) as entries:
+                for entry in entries:
+                    uuid = _uuid_from_filename(entry.name)
+                    if uuid is None:
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    snapshot[uuid] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            pass
+        return snapshot
+
+    def _run_polling(self):
+        self.mode = 'polling'
+        self._log('info', f'正在定时扫描stats目录: {self.stats_dir}')
+        previous = self._scan()
+        next_scan = time.monotonic() + self.poll_interval
+        while not self._stop_event.is_set():
+            self._stop_event.wait(self._wait_timeout(self.poll_interval))
+            if time.monotonic() >= next_scan:
+                current = self._scan()
+                for uuid, key in current.items():
+                    if previous.get(uuid) != key:
+                        self._note_change(uuid)
+                for uuid in previous:
+                    if uuid not in current:
+                        self._note_change(uuid)
+                previous = current
+                next_scan = time.monotonic() + self.poll_interval
+            self._flush_if_quiet()
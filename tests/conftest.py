@@ -0,0 +1,51 @@
+import os
+import sys
+
+# 插件的模块都在仓库根目录，测试时按直接运行的方式导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import random
+import uuid as uuid_lib
+
+import pytest
+
+@pytest.fixture
+def config_dir(tmp_path):
+    """使用临时的config文件夹，写入默认配置"""
+    from config_service import set_config_directory, load_config
+    
+    path = tmp_path / 'config'
+    set_config_directory(str(path))
+    load_config()
+    return path
+
+@pytest.fixture
+def make_stats_dir(tmp_path):
+    """生成假的stats目录，返回 (目录, {uuid: stats})"""
+    def make(players=50, seed=0, name='stats'):
+        rng = random.Random(seed)
+        stats_dir = tmp_path / name
+        stats_dir.mkdir()
+        data = {}
+        for _ in range(players):
+            uuid = str(uuid_lib.UUID(int=rng.getrandbits(128)))
+            stats = {
+                'stats': {
+                    'minecraft:custom': {
+                        'minecraft:play_time': rng.randrange(0, 10 ** 6),
+                        'minecraft:jump': rng.randrange(0, 5000),
+                        'minecraft:mob_kills': rng.randrange(0, 500),
+                        'minecraft:deaths': rng.randrange(0, 50)
+                    },
+                    'minecraft:mined': {
+                        f'minecraft:{block}': rng.randrange(0, 100)
+                        for block in rng.sample(['stone', 'dirt', 'diamond_ore', 'iron_ore', 'sand'], 3)
+                    }
+                },
+                'DataVersion': 3700
+            }
+            (stats_dir / f'{uuid}.json').write_text(json.dumps(stats), encoding='utf-8')
+            data[uuid] = stats
+        return stats_dir, data
+    return make
@@ -0,0 +1,25 @@
+import sys
+import json
+import tarfile
+
+import config_service
+import archive_rankings
+
+def test_main_without_config_dir_writes_no_config(make_stats_dir, tmp_path, monkeypatch):
+    stats_dir, players = make_stats_dir(players=20)
+    archive = tmp_path / 'backup.tar.gz'
+    with tarfile.open(archive, 'w:gz') as tar:
+        tar.add(stats_dir, arcname='world/stats')
+    output = tmp_path / 'result.json'
+
+    def no_config_directory():
+        raise AssertionError('不应读写配置文件')
+    monkeypatch.setattr(config_service, 'find_config_directory', no_config_directory)
+    monkeypatch.setattr(config_service, '_memory_config', None)
+    monkeypatch.setattr(sys, 'argv', ['archive_rankings.py', str(archive), '--output', str(output), '--top', '3'])
+    archive_rankings.main()
+
+    result = json.loads(output.read_text(encoding='utf-8'))[0]
+    assert result['players'] == 20
+    best = min(players, key=lambda uuid: (-players[uuid]['stats']['minecraft:custom']['minecraft:jump'], uuid))
+    assert result['rankings']['minecraft:jump'][0]['uuid'] == best
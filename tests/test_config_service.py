@@ -0,0 +1,26 @@
+import copy
+
+from config_service import DEFAULT_CONFIG, validate_config
+
+def test_invalid_values_fall_back_to_defaults():
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    config['output']['top_n'] = 0
+    config['performance']['parse_workers'] = -2
+    config['update'].update(interval=0, watch_debounce=-1, watch_poll_interval=0.0, daily_time=True)
+    config['github']['push_retries'] = '3'
+    validated = validate_config(config)
+    assert validated['output']['top_n'] == DEFAULT_CONFIG['output']['top_n']
+    assert validated['performance']['parse_workers'] == DEFAULT_CONFIG['performance']['parse_workers']
+    for key in ('interval', 'watch_debounce', 'watch_poll_interval', 'daily_time'):
+        assert validated['update'][key] == DEFAULT_CONFIG['update'][key]
+    assert validated['github']['push_retries'] == DEFAULT_CONFIG['github']['push_retries']
+
+def test_valid_values_are_kept():
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    config['output']['top_n'] = 1
+    config['update'].update(interval=30.5, watch_debounce=0, watch_poll_interval=2)
+    config['performance']['parse_workers'] = 1
+    validated = validate_config(config)
+    assert validated['output']['top_n'] == 1
+    assert (validated['update']['interval'], validated['update']['watch_debounce']) == (30.5, 0)
+    assert validated['performance']['parse_workers'] == 1
@@ -0,0 +1,57 @@
+import re
+import copy
+import json
+
+import config_service
+from config_service import DEFAULT_CONFIG, load_config, save_config
+from derived_metrics import get_metric_plan, category_term
+from create_player_rankings import extract_stat_value
+from compact_stats import compact_stats
+from generate_ranking_md import get_ranking_stats
+
+STATS = {
+    'stats': {
+        'minecraft:custom': {'minecraft:blocks_broken': 7, 'minecraft:mob_kills': 9, 'minecraft:deaths': 2},
+        'minecraft:mined': {'minecraft:stone': 30, 'minecraft:diamond_ore': 4}
+    }
+}
+
+def test_builtin_totals_use_namespaced_keys(config_dir):
+    for stats in (STATS, compact_stats(STATS)):
+        assert extract_stat_value(stats, 'player_stats:blocks_broken') == 34
+        assert extract_stat_value(stats, 'minecraft:mob_kills') == 9
+
+def test_legacy_keys_resolve_to_builtin_totals(config_dir):
+    config = copy.deepcopy(load_config())
+    # 其他派生统计项引用旧键名
+    config['derived_metrics'] = {
+        'player_stats:blocks_per_death': {'type': 'ratio', 'numerator': 'minecraft:blocks_broken', 'denominator': 'minecraft:deaths'}
+    }
+    save_config(config)
+    for stats in (STATS, compact_stats(STATS)):
+        assert extract_stat_value(stats, 'minecraft:blocks_broken') == 34
+        assert extract_stat_value(stats, 'minecraft:mined') == 34
+        assert extract_stat_value(stats, 'player_stats:blocks_per_death') == 17
+    plan = get_metric_plan()
+    assert plan.units['minecraft:blocks_broken'] == '次'
+    # 选择性解析只需要分类求和
+    assert plan.parse_keys(['minecraft:blocks_broken']) == [category_term('minecraft:mined')]
+
+def test_config_examples_are_valid_json():
+    with open(config_service.__file__, encoding='utf-8') as f:
+        source = f.read()
+    examples = re.findall(r'^\s*# (".+": \{.*\}),?$', source, re.MULTILINE)
+    assert len(examples) == 3
+    for example in examples:
+        json.loads('{' + example + '}')
+
+def test_default_config_has_no_derived_metrics(config_dir):
+    assert DEFAULT_CONFIG['derived_metrics'] == {}
+    assert load_config()['derived_metrics'] == {}
+
+def test_legacy_ranking_name_is_kept(config_dir):
+    config = dict(load_config())
+    config['ranking_names'] = dict(config['ranking_names'], **{'minecraft:blocks_broken': '挖掘王'})
+    assert dict(get_ranking_stats(config))['player_stats:blocks_broken'] == '挖掘王'
+    config['ranking_names']['player_stats:blocks_broken'] = '破坏之王'
+    assert dict(get_ranking_stats(config))['player_stats:blocks_broken'] == '破坏之王'
@@ -0,0 +1,111 @@
+import copy
+import random
+
+from compact_stats import PlayerRecord, compact_stats
+from item_index import ItemIndex
+
+CATEGORIES = ('minecraft:mined', 'minecraft:used')
+
+def brute_force(players):
+    """直接排序得到每个条目的 [(uuid, 值)]，按值降序、同值按uuid升序"""
+    postings = {}
+    for uuid, stats in players.items():
+        for category in CATEGORIES:
+            for item, value in stats['stats'].get(category, {}).items():
+                if value > 0:
+                    postings.setdefault((category, item), []).append((uuid, value))
+    return {key: sorted(entries, key=lambda entry: (-entry[1], entry[0])) for key, entries in postings.items()}
+
+def assert_matches(index, players):
+    expected = brute_force(players)
+    for category in CATEGORIES:
+        assert index.items(category) == sorted(item for c, item in expected if c == category)
+    for (category, item), entries in expected.items():
+        assert index.top(category, item, len(players)) == [
+            {'uuid': uuid, 'name': uuid[:6], 'value': value} for uuid, value in entries]
+        for uuid, value in entries:
+            result = index.rank(uuid, category, item)
+            assert result['rank'] == 1 + sum(1 for _, other in entries if other > value)
+            assert result['total'] == len(entries)
+    assert index.stats() == {'items': len(expected), 'entries': sum(len(entries) for entries in expected.values())}
+
+def records(players, previous=None, changed=()):
+    """构建parse_all_stats形式的结果，未变化的玩家沿用上一次的stats对象（模拟缓存命中）"""
+    result = {}
+    for uuid, stats in players.items():
+        if previous is not None and uuid in previous and uuid not in changed:
+            result[uuid] = PlayerRecord(uuid[:6], f'{uuid}.json', previous[uuid].stats)
+        else:
+            result[uuid] = PlayerRecord(uuid[:6], f'{uuid}.json', compact_stats(copy.deepcopy(stats)))
+    return result
+
+def test_incremental_updates_match_brute_force(make_stats_dir):
+    _, players = make_stats_dir(players=60)
+    rng = random.Random(1)
+    for stats in players.values():
+        stats['stats']['minecraft:used'] = {'minecraft:torch': rng.randrange(0, 20)}
+    index = ItemIndex(CATEGORIES)
+    data = records(players)
+    assert index.update(data, updated_at=1.0) > 0
+    assert index.is_ready()
+    assert_matches(index, players)
+
+    # 缓存命中的玩家是同一个对象，直接跳过
+    assert index.update(records(players, data), updated_at=2.0) == 0
+
+    for round_number in range(5):
+        uuids = sorted(players)
+        changed = set(rng.sample(uuids, 8))
+        for uuid in changed:
+            mined = players[uuid]['stats']['minecraft:mined']
+            item = rng.choice(sorted(mined))
+            if rng.random() < 0.3:
+                del mined[item]
+            else:
+                mined[item] = rng.randrange(0, 100)
+            mined[rng.choice(['minecraft:gold_ore', 'minecraft:gravel'])] = rng.randrange(1, 100)
+        for uuid in rng.sample(uuids, 3):
+            del players[uuid]
+        new_uuid = f'{round_number:08d}-0000-0000-0000-000000000000'
+        players[new_uuid] = {'stats': {'minecraft:mined': {'minecraft:stone': 50}, 'minecraft:used': {}}}
+        changed.add(new_uuid)
+        data = records(players, data, changed)
+        index.update(data, updated_at=3.0 + round_number)
+        assert_matches(index, players)
+
+    # 分类变化时整体重建
+    index.update(data, categories=CATEGORIES[:1])
+    assert index.items('minecraft:used') == []
+    assert index.resolve_category('use') is None
+
+def test_removed_items_and_players():
+    players = {
+        'a': {'stats': {'minecraft:mined': {'minecraft:stone': 5, 'minecraft:dirt': 1}}},
+        'b': {'stats': {'minecraft:mined': {'minecraft:stone': 9}}}
+    }
+    index = ItemIndex(CATEGORIES)
+    data = records(players)
+    index.update(data, updated_at=1.0)
+    assert index.rank('a', 'minecraft:mined', 'minecraft:stone')['rank'] == 2
+
+    # 最后一名玩家的条目被移除后，条目不再出现
+    players['a']['stats']['minecraft:mined'] = {'minecraft:stone': 5}
+    data = records(players, data, {'a'})
+    index.update(data, updated_at=2.0)
+    assert index.items('minecraft:mined') == ['minecraft:stone']
+    assert index.resolve_item('minecraft:mined', 'dirt') is None
+
+    del players['b']
+    index.update(records(players, data), updated_at=3.0)
+    assert index.rank('b', 'minecraft:mined', 'minecraft:stone') is None
+    assert index.rank('a', 'minecraft:mined', 'minecraft:stone')['rank'] == 1
+
+def test_resolve_names():
+    index = ItemIndex(CATEGORIES)
+    index.update(records({'a': {'stats': {'minecraft:mined': {'minecraft:diamond_ore': 3}}}}), updated_at=1.0)
+    assert index.resolve_category('mine') == 'minecraft:mined'
+    assert index.resolve_category('used') == 'minecraft:used'
+    assert index.resolve_category('minecraft:killed') is None
+    assert index.resolve_item('minecraft:mined', 'diamond_ore') == 'minecraft:diamond_ore'
+    assert index.resolve_item('minecraft:mined', 'minecraft:diamond_ore') == 'minecraft:diamond_ore'
+    assert index.resolve_item('minecraft:used', 'diamond_ore') is None
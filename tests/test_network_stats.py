@@ -0,0 +1,58 @@
+import copy
+import random
+
+import pytest
+
+from config_service import load_config, save_config
+from network_stats import (
+    ServerStats, DERIVE_POLICY, resolve_merge_policies, merge_top_n, merge_ranking, merge_column, merge_values
+)
+
+KD = 'player_stats:kd'
+
+@pytest.fixture
+def kd_config(config_dir):
+    config = copy.deepcopy(load_config())
+    config['derived_metrics'] = {
+        KD: {'type': 'ratio', 'numerator': 'minecraft:mob_kills', 'denominator': 'minecraft:deaths', 'digits': 2}
+    }
+    save_config(config)
+
+def make_server(rng, uuids, stat_keys):
+    members = rng.sample(uuids, rng.randrange(1, len(uuids)))
+    columns = {stat_key: [rng.choice([0, rng.randrange(1, 40)]) for _ in members] for stat_key in stat_keys}
+    return ServerStats({'server_dir': 'srv'}, {uuid: uuid[:4] for uuid in members}, members, columns)
+
+def brute_force(servers, stat_key, top_n, combine):
+    uuids = set().union(*(server.values[stat_key] for server in servers))
+    merged = {uuid: combine(server.values[stat_key].get(uuid, 0) for server in servers) for uuid in uuids}
+    ranked = sorted(((value, uuid) for uuid, value in merged.items() if value > 0), key=lambda item: (-item[0], item[1]))
+    return [(uuid, value) for value, uuid in ranked[:top_n]]
+
+@pytest.mark.parametrize('policy, combine', [('sum', sum), ('max', max)])
+def test_merge_top_n_matches_brute_force(policy, combine):
+    rng = random.Random(policy)
+    uuids = [f'{i:04d}-uuid' for i in range(60)]
+    for _ in range(200):
+        servers = [make_server(rng, uuids, ['stat']) for _ in range(rng.randrange(1, 5))]
+        top_n = rng.randrange(1, 12)
+        result = merge_top_n(servers, 'stat', top_n, policy)
+        assert [(player['uuid'], player['value']) for player in result] == brute_force(servers, 'stat', top_n, combine)
+
+def test_ratio_is_recomputed_from_merged_inputs(kd_config):
+    policies = resolve_merge_policies([KD], {})
+    assert policies == {KD: DERIVE_POLICY, 'minecraft:deaths': 'sum', 'minecraft:mob_kills': 'sum'}
+
+    a = ServerStats({'server_dir': 'a'}, {'p1': 'P1', 'p2': 'P2'}, ['p1', 'p2'],
+                    {'minecraft:mob_kills': [30, 5], 'minecraft:deaths': [10, 0], KD: [3.0, 5.0]})
+    b = ServerStats({'server_dir': 'b'}, {'p1': 'P1'}, ['p1'],
+                    {'minecraft:mob_kills': [2], 'minecraft:deaths': [6], KD: [0.33]})
+    # p1: (30 + 2) / (10 + 6) = 2.0，而不是各服务端比值的最大值3.0
+    assert merge_column([a, b], KD, policies) == {'p1': 2.0, 'p2': 5.0}
+    ranking = merge_ranking([a, b], KD, top_n=1, policies=policies)
+    assert [(player['name'], player['value']) for player in ranking] == [('P2', 5.0)]
+    assert merge_values([a, b], [KD], policies)['p1'] == {KD: 2.0}
+
+def test_configured_policy_overrides_default(kd_config):
+    policies = resolve_merge_policies([KD, 'minecraft:play_time'], {KD: 'max', 'minecraft:play_time': 'bogus'})
+    assert policies == {KD: 'max', 'minecraft:play_time': 'sum'}
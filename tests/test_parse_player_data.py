@@ -0,0 +1,113 @@
+import os
+import json
+
+import pytest
+
+import parse_player_data
+from derived_metrics import item_category_key
+from parse_player_data import parse_stats_files, parse_stats_file, extract_selected_stats
+
+PARSE_KEYS = ('minecraft:jump', ('minecraft:mined', None))
+
+@pytest.mark.parametrize('stat_keys', [None, PARSE_KEYS])
+@pytest.mark.parametrize('use_process_pool', [False, True])
+def test_parallel_parse_matches_sequential(make_stats_dir, monkeypatch, stat_keys, use_process_pool):
+    stats_dir, _ = make_stats_dir(players=40)
+    paths = sorted(str(path) for path in stats_dir.iterdir())
+    (stats_dir / 'broken.json').write_text('{"stats": ', encoding='utf-8')
+    paths.append(str(stats_dir / 'broken.json'))
+    # 分批读取时每批只有几个文件
+    monkeypatch.setattr(parse_player_data, 'PARSE_CHUNK_SIZE', 7)
+    expected = parse_stats_files(paths, workers=1, stat_keys=stat_keys)
+    assert parse_stats_files(paths, workers=4, use_process_pool=use_process_pool, stat_keys=stat_keys) == expected
+    assert expected[-1] == {}
+
+def last_run():
+    return parse_player_data.get_stats_cache_info()['last_run']
+
+def test_cache_key_invalidation(make_stats_dir):
+    stats_dir, players = make_stats_dir(players=20)
+    uuids = sorted(players)
+    parse_player_data.clear_stats_cache()
+    parse_all_stats = parse_player_data.parse_all_stats
+
+    first = parse_all_stats(str(stats_dir), {}, stat_keys=PARSE_KEYS)
+    assert last_run()['misses'] == 20
+    # 文件未变化时全部命中，并且得到同一个stats对象
+    second = parse_all_stats(str(stats_dir), {}, stat_keys=PARSE_KEYS)
+    assert (last_run()['hits'], last_run()['misses']) == (20, 0)
+    assert all(second[uuid].stats is first[uuid].stats for uuid in uuids)
+
+    # 修改文件后只重新读取该文件
+    path = stats_dir / f'{uuids[0]}.json'
+    path.write_text('{"stats": {"minecraft:custom": {"minecraft:jump": 123456}}}', encoding='utf-8')
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    third = parse_all_stats(str(stats_dir), {}, stat_keys=PARSE_KEYS)
+    assert (last_run()['hits'], last_run()['misses']) == (19, 1)
+    assert third[uuids[0]].stats is not second[uuids[0]].stats
+
+    # 提取的统计项或存储方式变化时缓存全部失效
+    parse_all_stats(str(stats_dir), {}, stat_keys=PARSE_KEYS[:1])
+    assert (last_run()['hits'], last_run()['misses']) == (0, 20)
+    parse_all_stats(str(stats_dir), {}, stat_keys=PARSE_KEYS[:1], compact=False)
+    assert (last_run()['hits'], last_run()['misses']) == (0, 20)
+    parse_all_stats(str(stats_dir), {}, stat_keys=PARSE_KEYS[:1], compact=False)
+    assert (last_run()['hits'], last_run()['misses']) == (20, 0)
+
+    # 删除文件后移除对应的缓存
+    (stats_dir / f'{uuids[1]}.json').unlink()
+    result = parse_all_stats(str(stats_dir), {}, stat_keys=PARSE_KEYS[:1], compact=False)
+    assert uuids[1] not in result
+    assert (last_run()['hits'], last_run()['evictions']) == (19, 1)
+    assert uuids[1] not in parse_player_data.get_stats_cache_entries(str(stats_dir))
+
+SELECTED_KEYS = ('minecraft:jump', ('minecraft:mined', None), ('minecraft:mined', ('*_ore',)),
+                 item_category_key('minecraft:mined'))
+
+def expected_selection(stats):
+    mined = stats['stats']['minecraft:mined']
+    return {
+        'stats': {
+            'minecraft:mined': mined,
+            'minecraft:custom': {'minecraft:jump': stats['stats']['minecraft:custom']['minecraft:jump']}
+        },
+        'totals': {
+            SELECTED_KEYS[1]: sum(mined.values()),
+            SELECTED_KEYS[2]: sum(value for item, value in mined.items() if item.endswith('_ore'))
+        }
+    }
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 64, 1 << 16])
+def test_scan_matches_json_across_chunk_boundaries(make_stats_dir, monkeypatch, chunk_size):
+    stats_dir, players = make_stats_dir(players=10)
+    monkeypatch.setattr(parse_player_data, 'SCAN_CHUNK_SIZE', chunk_size)
+    for uuid, stats in players.items():
+        assert parse_stats_file(str(stats_dir / f'{uuid}.json'), SELECTED_KEYS) == expected_selection(stats)
+        # 带缩进的文件
+        raw = json.dumps(stats, indent=2).encode('utf-8')
+        assert extract_selected_stats(raw, SELECTED_KEYS) == expected_selection(stats)
+
+def test_truncated_file_is_a_parse_error(make_stats_dir):
+    stats_dir, players = make_stats_dir(players=5)
+    uuid = sorted(players)[0]
+    path = stats_dir / f'{uuid}.json'
+    raw = path.read_bytes()
+    # 写入中途被截断：截断在minecraft:mined之前，剩余内容仍以}结尾
+    path.write_bytes(raw[:raw.index(b'"minecraft:mined"')].rstrip(b', ') + b'}')
+    assert extract_selected_stats(path.read_bytes(), SELECTED_KEYS) is None
+    assert parse_stats_file(str(path), SELECTED_KEYS) == {}
+    for cut in range(1, len(raw) - 1, 13):
+        assert extract_selected_stats(raw[:cut], SELECTED_KEYS) is None
+
+    parse_player_data.clear_stats_cache()
+    parse_player_data.parse_all_stats(str(stats_dir), {}, stat_keys=SELECTED_KEYS)
+    assert last_run()['errors'] == 1
+
+def test_unexpected_format_falls_back_to_json(tmp_path):
+    path = tmp_path / 'old.json'
+    # 旧版本的扁平格式和分类中的非整数值都完整解码
+    path.write_text('{"stat.jump": 3}', encoding='utf-8')
+    assert parse_stats_file(str(path), SELECTED_KEYS) == {'stat.jump': 3}
+    path.write_text('{"stats": {"minecraft:mined": {"minecraft:stone": 1.5}}}', encoding='utf-8')
+    assert parse_stats_file(str(path), SELECTED_KEYS) == {'stats': {'minecraft:mined': {'minecraft:stone': 1.5}}}
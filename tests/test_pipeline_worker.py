@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from pipeline_worker import PipelineWorker
+
+@pytest.fixture
+def worker():
+    worker = PipelineWorker()
+    worker.start()
+    yield worker
+    worker.stop()
+
+def test_queued_jobs_are_coalesced(worker):
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def blocker():
+        started.set()
+        release.wait(5)
+
+    worker.submit('block', blocker)
+    assert started.wait(5)
+    first = worker.submit('render', lambda: calls.append('render'))
+    second = worker.submit('render', lambda: calls.append('again'))
+    covered = worker.submit('render2', lambda: calls.append('covered'), covered_by=('render',))
+    assert first is second is covered
+    release.set()
+    first.result(5)
+    assert calls == ['render']
+    assert worker.coalesced == 2
+
+def test_submit_during_run_runs_again(worker):
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def update():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            started.set()
+            release.wait(5)
+
+    running = worker.submit('update', update)
+    assert started.wait(5)
+    # 正在执行的任务可能读到旧数据，新的提交不能复用它的结果
+    again = worker.submit('update', update)
+    covered = worker.submit('render', update, covered_by=('update',))
+    assert again is not running
+    assert covered is again
+    release.set()
+    running.result(5)
+    again.result(5)
+    assert calls == [0, 1]
+    assert not worker.is_busy()
+
+def test_exception_is_propagated(worker):
+    def fail():
+        raise ValueError('boom')
+
+    future = worker.submit('render', fail)
+    with pytest.raises(ValueError):
+        future.result(5)
+    assert worker.submit('render', lambda: 1).result(5) == 1
+
+def test_submit_after_stop_is_rejected():
+    worker = PipelineWorker()
+    worker.start()
+    assert worker.submit('render', lambda: 1).result(5) == 1
+    worker.stop()
+    with pytest.raises(RuntimeError):
+        worker.submit('render', lambda: None)
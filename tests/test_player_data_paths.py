@@ -0,0 +1,39 @@
+import copy
+
+from config_service import load_config, save_config
+from get_player_data_paths import get_server_sources, invalidate_player_data_paths
+
+def make_server(path, level_name='world'):
+    (path / level_name / 'stats').mkdir(parents=True)
+    (path / 'usercache.json').write_text('[]', encoding='utf-8')
+    (path / 'server.properties').write_text(f'level-name={level_name}\n', encoding='utf-8')
+    return path
+
+def test_invalid_network_entries_warn_once_per_config_load(config_dir, tmp_path, capsys):
+    lobby = make_server(tmp_path / 'lobby')
+    config = copy.deepcopy(load_config())
+    config['network']['servers'] = [{'name': 'lobby', 'server_dir': str(lobby)}, {'server_dir': ''}]
+    save_config(config)
+
+    for _ in range(3):
+        sources = get_server_sources()
+    assert [source['label'] for source in sources[1:]] == ['lobby']
+    assert capsys.readouterr().out.count('Ignoring invalid network server entry') == 1
+
+    # 重新加载配置后再提示一次
+    save_config(copy.deepcopy(load_config()))
+    get_server_sources()
+    assert capsys.readouterr().out.count('Ignoring invalid network server entry') == 1
+
+def test_invalidate_re_resolves_level_name(config_dir, tmp_path):
+    server_dir = make_server(tmp_path / 'server')
+    config = copy.deepcopy(load_config())
+    config['network']['servers'] = [{'name': 'lobby', 'server_dir': str(server_dir)}]
+    save_config(config)
+    assert get_server_sources()[1]['level_name'] == 'world'
+
+    # server.properties中的存档名称变化不会改变配置，缓存的路径需要显式丢弃
+    make_server(server_dir, 'survival')
+    assert get_server_sources()[1]['level_name'] == 'world'
+    invalidate_player_data_paths()
+    assert get_server_sources()[1]['level_name'] == 'survival'
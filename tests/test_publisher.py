@@ -0,0 +1,100 @@
+import git
+import pytest
+
+from update_and_upload_ranking import GitPublisher, commit_files_to_branch, git_blob_sha
+
+def configure(repo):
+    with repo.config_writer() as config:
+        config.set_value('user', 'name', 'test')
+        config.set_value('user', 'email', 'test@example.com')
+    return repo
+
+@pytest.fixture
+def remote(tmp_path):
+    """本地的裸仓库作为远程仓库，main分支上有一个初始提交"""
+    path = tmp_path / 'remote.git'
+    git.Repo.init(path, bare=True, initial_branch='main')
+    seed = configure(git.Repo.init(tmp_path / 'seed', initial_branch='main'))
+    (tmp_path / 'seed' / 'README.md').write_text('pages\n', encoding='utf-8')
+    seed.index.add(['README.md'])
+    seed.index.commit('init')
+    seed.git.push(str(path), 'main')
+    return path
+
+def clone(remote, path, bare=False):
+    return configure(git.Repo.clone_from(str(remote), str(path), bare=bare))
+
+def remote_file(remote, path, branch='main'):
+    return git.Repo(remote).git.show(f'{branch}:{path}')
+
+@pytest.mark.parametrize('publish_mode', ['worktree', 'objects'])
+def test_first_publish_and_unchanged_republish(remote, tmp_path, publish_mode):
+    clone(remote, tmp_path / 'pages')
+    publisher = GitPublisher(str(tmp_path / 'pages'), publish_mode=publish_mode)
+    files = {'ranking.md': b'# ranking\n', 'stats/jump.md': b'jump\n'}
+
+    result = publisher.publish(files, 'update')
+    assert result['success'] and not result['skipped']
+    assert result['files'] == ['ranking.md', 'stats/jump.md']
+    assert remote_file(remote, 'ranking.md') == '# ranking'
+    assert remote_file(remote, 'README.md') == 'pages'
+    head = git.Repo(remote).commit('main').hexsha
+
+    # 内容未变化时跳过提交和推送
+    result = publisher.publish(files, 'update')
+    assert result['skipped'] and result['files'] == []
+    assert git.Repo(remote).commit('main').hexsha == head
+
+    # 只提交发生变化的文件
+    result = publisher.publish(dict(files, **{'ranking.md': b'# ranking 2\n'}), 'update')
+    assert result['files'] == ['ranking.md']
+    assert git.Repo(remote).commit('main').parents[0].hexsha == head
+    publisher.close()
+
+def test_objects_mode_publishes_from_bare_repo(remote, tmp_path):
+    repo = clone(remote, tmp_path / 'pages.git', bare=True)
+    publisher = GitPublisher(str(tmp_path / 'pages.git'), publish_mode='objects')
+
+    result = publisher.publish({'ranking.md': b'# ranking\n'}, 'update')
+    assert result['success'] and result['files'] == ['ranking.md']
+    assert remote_file(remote, 'ranking.md') == '# ranking'
+    assert repo.commit('main').hexsha == git.Repo(remote).commit('main').hexsha
+    assert publisher.publish({'ranking.md': b'# ranking\n'}, 'update')['skipped']
+    publisher.close()
+
+def test_commit_files_to_branch(remote, tmp_path):
+    repo = clone(remote, tmp_path / 'pages.git', bare=True)
+    parent = repo.commit('main')
+    commit = commit_files_to_branch(repo, 'main', {'ranking.md': b'a\n'}, 'update')
+    assert repo.commit('main').hexsha == commit
+    assert repo.commit('main').parents == (parent,)
+    assert (repo.commit('main').tree / 'ranking.md').hexsha == git_blob_sha(b'a\n')
+    assert (repo.commit('main').tree / 'README.md').hexsha == (parent.tree / 'README.md').hexsha
+    # 内容未变化时不生成提交；分支不存在时创建没有父提交的提交
+    assert commit_files_to_branch(repo, 'main', {'ranking.md': b'a\n'}, 'update') is None
+    orphan = commit_files_to_branch(repo, 'gh-pages', {'index.md': b'b\n'}, 'update')
+    assert repo.commit('gh-pages').hexsha == orphan and not repo.commit('gh-pages').parents
+
+@pytest.mark.parametrize('publish_mode', ['worktree', 'objects'])
+def test_push_conflict_is_retried_on_remote_tip(remote, tmp_path, publish_mode):
+    clone(remote, tmp_path / 'pages')
+    publisher = GitPublisher(str(tmp_path / 'pages'), publish_mode=publish_mode)
+    publisher.publish({'ranking.md': b'# ranking 1\n'}, 'update')
+
+    # 另一个发布者修改了同一个文件并先推送
+    other = clone(remote, tmp_path / 'other')
+    (tmp_path / 'other' / 'ranking.md').write_bytes(b'# ranking from elsewhere\n')
+    (tmp_path / 'other' / 'notes.md').write_bytes(b'notes\n')
+    other.index.add(['ranking.md', 'notes.md'])
+    other_commit = other.index.commit('other update')
+    other.git.push('origin', 'main')
+
+    result = publisher.publish({'ranking.md': b'# ranking 2\n'}, 'update')
+    assert result['success'] and result['retries'] == 1
+    head = git.Repo(remote).commit('main')
+    assert head.parents == (other_commit,)
+    assert remote_file(remote, 'ranking.md') == '# ranking 2'
+    assert remote_file(remote, 'notes.md') == 'notes'
+    if publish_mode == 'worktree':
+        assert not git.Repo(tmp_path / 'pages').is_dirty()
+    publisher.close()
@@ -0,0 +1,20 @@
+import random
+
+import pytest
+
+from ranking_engine import RankingAccumulator
+
+def test_accumulator_matches_sort():
+    rng = random.Random(0)
+    players = {f'{i:04d}': {'a': rng.randrange(0, 20), 'b': rng.randrange(-5, 1000)} for i in range(300)}
+    accumulator = RankingAccumulator(['a', 'b'], 10)
+    for uuid, values in players.items():
+        accumulator.add(uuid, uuid, values)
+    for stat_key, ranking in accumulator.results().items():
+        expected = sorted(((-values[stat_key], uuid) for uuid, values in players.items() if values[stat_key] > 0))[:10]
+        assert [(player['uuid'], player['value']) for player in ranking] == [(uuid, -value) for value, uuid in expected]
+
+@pytest.mark.parametrize('top_n', [0, -1])
+def test_top_n_must_be_positive(top_n):
+    with pytest.raises(ValueError):
+        RankingAccumulator(['a'], top_n)
@@ -0,0 +1,42 @@
+import pytest
+
+from stats_history import StatsHistory
+from generate_ranking_md import get_history_windows
+
+@pytest.fixture
+def history(tmp_path):
+    history = StatsHistory(str(tmp_path / 'history.db'))
+    yield history
+    history.close()
+
+def test_window_ranking_uses_deltas(history):
+    history.record_snapshot({'a': {'jump': 10}, 'b': {'jump': 50}}, ts=100)
+    assert history.record_snapshot({'a': {'jump': 40}, 'b': {'jump': 55}}, ts=200) == 2
+    assert history.record_snapshot({'a': {'jump': 40}, 'b': {'jump': 55}}, ts=300) == 0
+    assert history.window_ranking('jump', since=150) == [{'uuid': 'a', 'value': 30}, {'uuid': 'b', 'value': 5}]
+
+def test_float_metrics_are_not_truncated(history, tmp_path):
+    history.record_snapshot({'a': {'kd': 1.25}}, ts=100)
+    history.record_snapshot({'a': {'kd': 1.97}}, ts=200)
+    assert history.value_at('a', 'kd', 250) == 1.97
+    assert history.window_ranking('kd', since=150) == [{'uuid': 'a', 'value': pytest.approx(0.72)}]
+    # 重新打开后从数据库读出的最新值与写入的一致，不会被当作变化重复写入
+    reopened = StatsHistory(str(tmp_path / 'history.db'))
+    try:
+        assert reopened.record_snapshot({'a': {'kd': 1.97}}, ts=300) == 0
+    finally:
+        reopened.close()
+
+def test_invalid_windows_are_skipped(capsys):
+    config = {'history': {'enabled': True, 'windows': [
+        {'stat': 'minecraft:play_time', 'days': 7},
+        {'days': 1},
+        {'stat': 'minecraft:jump', 'days': 'week'},
+        'minecraft:jump',
+        {'stat': 'minecraft:jump', 'name': '跳跃'}
+    ]}}
+    windows = get_history_windows(config)
+    assert [window['stat'] for window in windows] == ['minecraft:play_time', 'minecraft:jump']
+    assert capsys.readouterr().out.count('Skipping invalid history window') == 3
+    config['history']['enabled'] = False
+    assert get_history_windows(config) == []
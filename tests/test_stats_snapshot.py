@@ -0,0 +1,58 @@
+from create_player_rankings import collect_stat_values
+from derived_metrics import get_metric_plan, item_category_key
+from parse_player_data import parse_all_stats, clear_stats_cache, get_stats_cache_entries, get_stats_cache_info
+from ranking_index import RankingIndex
+from stats_snapshot import write_snapshot, restore_index, restore_stats_cache, snapshot_is_current
+
+STAT_KEYS = ['minecraft:play_time', 'minecraft:jump', 'player_stats:blocks_broken']
+
+def build(stats_dir):
+    names = {}
+    parse_keys = get_metric_plan().parse_keys(STAT_KEYS)
+    clear_stats_cache()
+    stats_data = parse_all_stats(str(stats_dir), names, stat_keys=parse_keys)
+    index = RankingIndex()
+    index.update(collect_stat_values(stats_data, STAT_KEYS), {uuid: uuid[:6] for uuid in stats_data},
+                 stat_names={stat_key: stat_key for stat_key in STAT_KEYS}, updated_at=123.0)
+    return index, parse_keys
+
+def test_round_trip(config_dir, make_stats_dir, tmp_path):
+    stats_dir, _ = make_stats_dir(players=80)
+    index, parse_keys = build(stats_dir)
+    path = str(tmp_path / 'snapshot.bin')
+    assert write_snapshot(path, index, str(stats_dir), parse_keys, get_stats_cache_entries(str(stats_dir))) == 80
+
+    restored = RankingIndex()
+    assert restore_index(path, restored, stat_keys=STAT_KEYS) == 80
+    assert restored.export() == index.export()
+    assert restored.rank(restored.top('minecraft:jump', 1)[0]['uuid'], 'minecraft:jump')['rank'] == 1
+
+    # 恢复的解析缓存使下一次解析全部命中
+    clear_stats_cache()
+    assert restore_stats_cache(path, str(stats_dir), parse_keys) == 80
+    parse_all_stats(str(stats_dir), {}, stat_keys=parse_keys)
+    assert get_stats_cache_info()['last_run']['hits'] == 80
+
+def test_stale_snapshot_is_detected(config_dir, make_stats_dir, tmp_path):
+    stats_dir, _ = make_stats_dir(players=10)
+    index, parse_keys = build(stats_dir)
+    path = str(tmp_path / 'snapshot.bin')
+    assert not snapshot_is_current(path, STAT_KEYS, str(stats_dir), parse_keys)
+    write_snapshot(path, index, str(stats_dir), parse_keys, get_stats_cache_entries(str(stats_dir)))
+    assert snapshot_is_current(path, STAT_KEYS, str(stats_dir), parse_keys)
+    # 排行统计项或解析键变化后需要重新写入，也不能再恢复旧的索引
+    assert not snapshot_is_current(path, STAT_KEYS[:2], str(stats_dir), parse_keys)
+    assert not snapshot_is_current(path, STAT_KEYS, str(stats_dir), parse_keys + ['minecraft:deaths'])
+    assert not snapshot_is_current(path, STAT_KEYS, str(stats_dir), parse_keys + [item_category_key('minecraft:mined')])
+    assert restore_index(path, RankingIndex(), stat_keys=STAT_KEYS[:2]) is None
+
+    # 只保存索引的快照（多服务端）
+    write_snapshot(path, index)
+    assert snapshot_is_current(path, STAT_KEYS)
+    assert not snapshot_is_current(path, STAT_KEYS, str(stats_dir), parse_keys)
+
+def test_corrupt_snapshot_is_ignored(config_dir, tmp_path):
+    path = tmp_path / 'snapshot.bin'
+    path.write_bytes(b'PSSN' + b'\0' * 10)
+    assert restore_index(str(path), RankingIndex()) is None
+    assert not snapshot_is_current(str(path), STAT_KEYS)
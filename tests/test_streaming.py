@@ -0,0 +1,19 @@
+from create_player_rankings import create_rankings, create_rankings_streaming, stream_stat_values, iter_stats_files
+from parse_player_data import parse_all_stats
+
+STAT_KEYS = ['minecraft:play_time', 'minecraft:jump', 'player_stats:blocks_broken']
+
+def test_streaming_matches_batch(config_dir, make_stats_dir):
+    stats_dir, data = make_stats_dir(players=300)
+    names = {uuid: uuid[:8] for uuid in data}
+    counters = {}
+    streamed = create_rankings_streaming(str(stats_dir), names, STAT_KEYS, top_n=10, counters=counters)
+    batch = create_rankings(parse_all_stats(str(stats_dir), names, use_cache=False), STAT_KEYS, top_n=10)
+    assert streamed == batch
+    assert counters['files'] == counters['players'] == 300
+
+def test_stream_batches_cover_every_player(config_dir, make_stats_dir):
+    stats_dir, data = make_stats_dir(players=25)
+    values = dict(stream_stat_values(iter_stats_files(str(stats_dir)), ['minecraft:jump'], batch_size=4))
+    assert values == {uuid: {'minecraft:jump': stats['stats']['minecraft:custom']['minecraft:jump']}
+                      for uuid, stats in data.items()}
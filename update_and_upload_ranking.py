@@ -1,169 +1,346 @@
 import os
 import sys
-import json
 import git
+import shutil
+import hashlib
+import tempfile
+import threading
 from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit
 
 # 处理相对导入问题
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 try:
-    from .generate_ranking_md import generate_ranking_md
+    from .generate_ranking_md import generate_ranking_md, get_output_files
     from .get_player_data_paths import get_player_data_paths
+    from .config_service import load_config, save_config
+    from .pipeline_metrics import get_metrics
 except ImportError:
     # 当直接运行时使用绝对导入
-    from generate_ranking_md import generate_ranking_md
+    from generate_ranking_md import generate_ranking_md, get_output_files
     from get_player_data_paths import get_player_data_paths
+    from config_service import load_config, save_config
+    from pipeline_metrics import get_metrics
 
-def find_config_directory():
-    """找到config文件夹"""
-    # 获取当前脚本所在目录
-    current_dir = os.path.dirname(os.path.abspath(__file__))
+def update_ranking():
+    """更新排行榜"""
+    print("=== 更新排行榜 ===")
+    generate_ranking_md()
+    print("排行榜更新完成")
+
+# 内容未变化而跳过提交和推送的累计次数
+_upload_counters = {
+    'uploads': 0,
+    'skipped': 0
+}
+
+def get_upload_counters():
+    """获取上传和跳过的累计次数"""
+    return dict(_upload_counters)
+
+def git_blob_sha(content):
+    """计算内容作为git blob对象时的sha1"""
+    header = f"blob {len(content)}\0".encode('ascii')
+    return hashlib.sha1(header + content).hexdigest()
+
+def has_unpushed_commits(repo, branch):
+    """检查本地分支是否有尚未推送到origin的提交"""
+    try:
+        ahead = repo.git.rev_list('--count', f'origin/{branch}..{branch}')
+        return int(ahead) > 0
+    except (ValueError, git.GitCommandError):
+        # 没有远程跟踪分支时视为需要推送
+        return True
+
+def write_blob(repo, content):
+    """将内容写入对象库，返回blob的sha1"""
+    from io import BytesIO
+    from gitdb import IStream
     
-    # 检查当前目录是否有config文件夹
-    config_dir = os.path.join(current_dir, 'config')
-    if os.path.exists(config_dir) and os.path.isdir(config_dir):
-        return config_dir
+    istream = repo.odb.store(IStream(git.Blob.type, len(content), BytesIO(content)))
+    return istream.binsha.hex()
+
+def commit_files_to_branch(repo, branch, files, message):
+    """不经过工作区，直接在分支末端提交文件
+
+    files为 {仓库中的路径: 内容bytes}。blob、tree和commit对象直接写入对象库，
+    tree通过临时索引文件在分支原有的tree上修改得到，最后用update-ref
+    （检查旧值）移动分支。可以用于裸仓库。
+    返回新提交的sha1，文件内容没有变化时返回None。
+    """
+    ref = f'refs/heads/{branch}'
+    try:
+        parent = repo.git.rev_parse('--verify', '-q', f'{ref}^{{commit}}')
+    except git.GitCommandError:
+        parent = None
     
-    # 检查上一级目录
-    parent_dir = os.path.dirname(current_dir)
-    config_dir = os.path.join(parent_dir, 'config')
-    if os.path.exists(config_dir) and os.path.isdir(config_dir):
-        return config_dir
+    # 使用临时索引文件构建tree，不影响仓库自身的索引
+    tmp_dir = tempfile.mkdtemp(prefix='player_stats_')
+    env = {'GIT_INDEX_FILE': os.path.join(tmp_dir, 'index')}
+    try:
+        if parent:
+            repo.git.read_tree(parent, env=env)
+        else:
+            repo.git.read_tree('--empty', env=env)
+        for path, content in files.items():
+            blob_sha = write_blob(repo, content)
+            repo.git.update_index('--add', '--cacheinfo', f'100644,{blob_sha},{path.replace(os.sep, "/")}', env=env)
+        tree = repo.git.write_tree(env=env)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
     
-    # 如果都没有，在当前目录创建config文件夹
-    config_dir = os.path.join(current_dir, 'config')
-    os.makedirs(config_dir, exist_ok=True)
-    return config_dir
-
-def get_config_path():
-    """获取配置文件路径"""
-    config_dir = find_config_directory()
-    player_stats_dir = os.path.join(config_dir, 'player_stats')
-    os.makedirs(player_stats_dir, exist_ok=True)
-    return os.path.join(player_stats_dir, 'config.json')
-
-def load_config():
-    """加载配置文件"""
-    config_path = get_config_path()
+    if parent and tree == repo.git.rev_parse(f'{parent}^{{tree}}'):
+        return None
     
-    # 如果配置文件不存在，创建默认配置
-    if not os.path.exists(config_path):
-        default_config = {
-            "github": {
-                "token": "",  # GitHub个人访问令牌
-                "repo_owner": "",  # 仓库所有者
-                "repo_name": "",  # 仓库名称
-                "repo_path": "",  # 本地GitHub仓库路径
-                "branch": "main",
-                "file_path": "ranking.md"  # 仓库中的文件路径
-            },
-            "ranking_names": {
-                "minecraft:play_time": "在线时长最长",
-                "minecraft:walk_one_cm": "步行距离最远",
-                "minecraft:fly_one_cm": "飞行距离最远",
-                "minecraft:swim_one_cm": "游泳距离最远",
-                "minecraft:jump": "跳跃次数最多",
-                "minecraft:mob_kills": "杀死生物最多",
-                "minecraft:damage_taken": "受到伤害最多",
-                "minecraft:blocks_broken": "破坏方块最多"
-            },
-            "update_interval": 3600  # 默认1小时更新一次
-        }
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(default_config, f, indent=2, ensure_ascii=False)
-        return default_config
+    args = [tree, '-m', message]
+    if parent:
+        args += ['-p', parent]
+    commit = repo.git.commit_tree(*args)
     
-    # 加载配置文件
-    with open(config_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    # 只有分支仍指向parent时才更新，避免覆盖并发的提交
+    repo.git.update_ref(ref, commit, parent or '')
+    return commit
 
-def save_config(config):
-    """保存配置文件"""
-    config_path = get_config_path()
-    with open(config_path, 'w', encoding='utf-8') as f:
-        json.dump(config, f, indent=2, ensure_ascii=False)
+def get_authenticated_url(remote_url, token):
+    """构建带token认证的https地址，已有的用户信息会被替换"""
+    if not token or not remote_url.startswith('https://'):
+        return remote_url
+    parts = urlsplit(remote_url)
+    host = parts.netloc.rsplit('@', 1)[-1]
+    return urlunsplit((parts.scheme, f"{token}@{host}", parts.path, parts.query, parts.fragment))
 
-def update_ranking():
-    """更新排行榜"""
-    print("=== 更新排行榜 ===")
-    generate_ranking_md()
-    print("排行榜更新完成")
+def _is_push_conflict(error):
+    """判断推送失败是否因为远程分支有新的提交"""
+    output = f"{error.stdout or ''}\n{error.stderr or ''}"
+    return any(marker in output for marker in ('[rejected]', 'non-fast-forward', 'fetch first', 'stale info'))
+
+class PushConflictError(Exception):
+    """多次重试后推送仍然冲突"""
+
+class GitPublisher:
+    """长期持有的git仓库会话
+
+    在多次定时任务之间复用同一个git.Repo和推送地址，每次发布把任意数量的文件
+    放进同一个提交并只推送一次；推送冲突时拉取远程分支、在其上重新提交后重试。
+    token只用于构建推送地址，不会写入仓库配置。
+    """
+
+    def __init__(self, repo_path, branch='main', token='', publish_mode='worktree', push_retries=3):
+        self.repo_path = repo_path
+        self.branch = branch
+        self.token = token
+        self.publish_mode = publish_mode
+        self.push_retries = push_retries
+        self.repo = git.Repo(repo_path)
+        self.lock = threading.Lock()
+        self._push_url = None
+
+    def settings(self):
+        return (self.repo_path, self.branch, self.token, self.publish_mode, self.push_retries)
+
+    def close(self):
+        """释放仓库句柄"""
+        self.repo.close()
+
+    @property
+    def push_url(self):
+        """推送地址，首次使用时计算"""
+        if self._push_url is None:
+            self._push_url = get_authenticated_url(self.repo.remote('origin').url, self.token)
+        return self._push_url
+
+    def changed_files(self, files):
+        """过滤出内容与分支上不同的文件"""
+        try:
+            tree = self.repo.commit(self.branch).tree
+        except (ValueError, git.BadName, git.GitCommandError):
+            return dict(files)
+        
+        changed = {}
+        for path, content in files.items():
+            try:
+                committed_sha = (tree / path.replace(os.sep, '/')).hexsha
+            except KeyError:
+                committed_sha = None
+            if git_blob_sha(content) != committed_sha:
+                changed[path] = content
+        return changed
+
+    def commit(self, files, message):
+        """提交文件，返回新提交的sha1，没有变化时返回None"""
+        if not files:
+            return None
+        if self.publish_mode == 'objects':
+            # 直接写入对象库，不需要工作区
+            return commit_files_to_branch(self.repo, self.branch, files, message)
+        
+        for path, content in files.items():
+            # 写入文件，按字节复制保证与计算的blob一致
+            dest_path = os.path.join(self.repo_path, path)
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            with open(dest_path, 'wb') as dst:
+                dst.write(content)
+        
+        # 添加文件到暂存区并提交
+        self.repo.index.add(list(files))
+        return self.repo.index.commit(message).hexsha
+
+    def fetch(self):
+        """拉取远程分支到refs/remotes/origin"""
+        self.repo.git.fetch(self.push_url, f'+refs/heads/{self.branch}:refs/remotes/origin/{self.branch}')
+
+    def rebase_onto_remote(self, files, message):
+        """拉取远程分支，回到远程分支末端后重新提交本次生成的文件
+
+        本次提交只覆盖生成的文件，不需要变基：远程分支上的同一文件通常也被修改过，
+        变基必然冲突。工作区模式用reset --keep移动分支，工作区中与本次无关的修改会被保留。
+        """
+        self.fetch()
+        remote_ref = f'refs/remotes/origin/{self.branch}'
+        if self.publish_mode == 'objects':
+            self.repo.git.update_ref(f'refs/heads/{self.branch}', remote_ref)
+        else:
+            # GitPython写入的索引中的stat信息可能与文件不一致，先刷新，否则reset会把已提交的文件当作未提交的修改
+            self.repo.git.update_index('-q', '--refresh', with_exceptions=False)
+            self.repo.git.reset('--keep', remote_ref)
+        return self.commit(self.changed_files(files), message)
+
+    def push(self, files, message):
+        """推送分支，冲突时拉取并重新提交后重试，返回重试次数"""
+        refspec = f'refs/heads/{self.branch}:refs/heads/{self.branch}'
+        for attempt in range(self.push_retries + 1):
+            try:
+                self.repo.git.push('--porcelain', self.push_url, refspec)
+            except git.GitCommandError as e:
+                if not _is_push_conflict(e) or attempt == self.push_retries:
+                    if _is_push_conflict(e):
+                        raise PushConflictError(f"推送冲突，已重试 {attempt} 次") from e
+                    raise
+                print(f"推送冲突，拉取远程分支后重试（第 {attempt + 1} 次）...")
+                self.rebase_onto_remote(files, message)
+                continue
+            
+            # 记录已推送的提交，裸仓库没有远程跟踪分支时也能判断是否需要推送
+            self.repo.git.update_ref(f'refs/remotes/origin/{self.branch}', f'refs/heads/{self.branch}')
+            return attempt
+
+    def publish(self, files, message):
+        """在一个提交中发布files（{仓库中的路径: 内容bytes}）并推送一次"""
+        metrics = get_metrics()
+        with self.lock:
+            changed = self.changed_files(files)
+            if not changed and not has_unpushed_commits(self.repo, self.branch):
+                return _upload_result(True, skipped=True, files=[])
+            
+            if changed:
+                with metrics.stage('commit'):
+                    self.commit(changed, message)
+            with metrics.stage('push'):
+                retries = self.push(files, message)
+            metrics.incr('push_retries', retries)
+            return _upload_result(True, files=sorted(changed), retries=retries)
+
+# 在多次上传之间复用的git会话
+_publisher = None
+_publisher_lock = threading.Lock()
+
+def get_publisher(github_config):
+    """获取与配置对应的GitPublisher，配置变化时重新创建"""
+    global _publisher
+    settings = (
+        github_config.get('repo_path'),
+        github_config.get('branch', 'main'),
+        github_config.get('token', ''),
+        github_config.get('publish_mode', 'worktree'),
+        github_config.get('push_retries', 3)
+    )
+    with _publisher_lock:
+        if _publisher is None or _publisher.settings() != settings:
+            if _publisher is not None:
+                _publisher.close()
+            _publisher = GitPublisher(*settings)
+        return _publisher
+
+def close_publisher():
+    """关闭git会话"""
+    global _publisher
+    with _publisher_lock:
+        if _publisher is not None:
+            _publisher.close()
+            _publisher = None
+
+def _upload_result(success, skipped=False, message='', files=None, retries=0):
+    return {
+        'success': success,
+        'skipped': skipped,
+        'message': message,
+        'files': files or [],
+        'retries': retries
+    }
 
 def upload_to_github():
-    """上传文件到GitHub"""
+    """上传生成的文件到GitHub
+
+    所有文件（ranking.md以及配置启用的ranking.json、单独页面）放在同一个提交中，
+    每次只推送一次。返回 {'success', 'skipped', 'message', 'files', 'retries'}；
+    所有文件都与分支上已有的内容相同、且没有未推送的提交时，跳过提交和推送，skipped为True。
+    """
     print("=== 上传到GitHub ===")
     
     # 加载配置
     config = load_config()
     github_config = config.get('github', {})
     
-    token = github_config.get('token')
     repo_path = github_config.get('repo_path')
     branch = github_config.get('branch', 'main')
-    file_path = github_config.get('file_path', 'ranking.md')
     
     # 检查配置是否完整
     if not repo_path:
         print("错误：GitHub仓库路径未配置，请在config/player_stats/config.json中填写完整配置")
-        return False
+        return _upload_result(False, message='GitHub仓库路径未配置')
     
     # 检查本地仓库是否存在
     if not os.path.exists(repo_path) or not os.path.isdir(repo_path):
         print(f"错误：本地仓库路径不存在或不是目录：{repo_path}")
-        return False
+        return _upload_result(False, message='本地仓库路径不存在')
     
-    # 检查ranking.md文件是否存在
-    ranking_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ranking.md')
-    if not os.path.exists(ranking_path):
-        print("错误：ranking.md文件不存在，请先运行generate_ranking_md.py")
-        return False
+    # 检查生成的文件是否存在
+    output_files = get_output_files(config)
+    missing = [local_path for local_path in output_files.values() if not os.path.exists(local_path)]
+    if missing:
+        print(f"错误：{os.path.basename(missing[0])}文件不存在，请先运行generate_ranking_md.py")
+        return _upload_result(False, message=f'{os.path.basename(missing[0])}文件不存在')
     
     try:
-        # 打开本地仓库
-        repo = git.Repo(repo_path)
+        files = {}
+        for path, local_path in output_files.items():
+            with open(local_path, 'rb') as src:
+                files[path] = src.read()
         
-        # 复制ranking.md文件到仓库
-        dest_path = os.path.join(repo_path, file_path)
-        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-        
-        # 读取并写入文件
-        with open(ranking_path, 'r', encoding='utf-8') as src:
-            with open(dest_path, 'w', encoding='utf-8') as dst:
-                dst.write(src.read())
-        
-        # 添加文件到暂存区
-        repo.index.add([file_path])
-        
-        # 提交更改
+        publisher = get_publisher(github_config)
         commit_message = f"自动更新排行榜 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        repo.index.commit(commit_message)
+        result = publisher.publish(files, commit_message)
         
-        # 推送到远程仓库
-        origin = repo.remote('origin')
-        
-        # 如果配置了token，使用token进行认证
-        if token:
-            # 更新远程仓库URL，使用token认证
-            remote_url = origin.url
-            if 'https://' in remote_url:
-                # 提取仓库地址
-                repo_url = remote_url.split('https://')[1]
-                # 构建带token的URL
-                new_url = f"https://{token}@{repo_url}"
-                origin.set_url(new_url)
-                print("使用token认证推送...")
-        
-        origin.push(refspec=f"{branch}:{branch}")
+        if result['skipped']:
+            _upload_counters['skipped'] += 1
+            get_metrics().incr('uploads_skipped')
+            result['message'] = f"排行榜内容未变化，跳过提交和推送（累计跳过 {_upload_counters['skipped']} 次）"
+            print(result['message'])
+            return result
         
+        _upload_counters['uploads'] += 1
+        get_metrics().incr('uploads')
+        result['message'] = f"上传了 {len(result['files'])} 个文件"
         print("成功：文件上传到GitHub")
         print(f"仓库路径：{repo_path}")
         print(f"分支：{branch}")
-        print(f"文件路径：{file_path}")
-        return True
+        print(f"文件：{', '.join(result['files']) or '（仅推送）'}")
+        return result
     
     except Exception as e:
         print(f"错误：上传失败：{e}")
-        return False
+        get_metrics().incr('upload_failures')
+        return _upload_result(False, message=f'上传失败：{e}')
 
 def main():
     """主函数"""
@@ -175,10 +352,12 @@ def main():
     print()
     
     # 2. 上传到GitHub
-    success = upload_to_github()
+    result = upload_to_github()
     print()
     
-    if success:
+    if result['skipped']:
+        print("任务完成：排行榜内容未变化，无需上传")
+    elif result['success']:
         print("任务完成：排行榜已更新并上传到GitHub")
     else:
         print("任务失败：请检查错误信息")